@@ -4,19 +4,45 @@ from tkinter import filedialog, messagebox, ttk
 from tkcalendar import DateEntry
 import pandas as pd
 import sqlite3
-from datetime import datetime
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Image, Spacer
+from datetime import datetime, date
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Image, Spacer, PageBreak, Flowable
 from reportlab.lib.pagesizes import A4
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.pdfbase.pdfmetrics import stringWidth
 from num2words import num2words
 import os
+import re
+import csv
+import importlib.util
+import hashlib
+import json
+import tempfile
+import shutil
+import uuid
+import io
+import sys
+import zipfile
+import webbrowser
+import itertools
+import collections
+import contextlib
+import functools
+import argparse
+import asyncio
+import threading
+import socket
+import queue
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter, sleep
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 
 
 # ----------------------------------------------------
 # Database Setup (SQLite)
 # ----------------------------------------------------
-DB_FILE = "app.db"
+# INVOICEGEN_DB points several processes (e.g. job workers) at the same database.
+DB_FILE = os.environ.get("INVOICEGEN_DB", "app.db")
 conn = sqlite3.connect(DB_FILE)
 cursor = conn.cursor()
 
@@ -43,80 +69,1079 @@ cursor.execute("""
         excel_file TEXT
     )
 """)
+
+# Batch job journal – one row per vendor and run, so interrupted runs can resume.
+cursor.execute("""
+    CREATE TABLE IF NOT EXISTS soa_jobs (
+        run_id TEXT,
+        vendor_id TEXT,
+        status TEXT,
+        output_path TEXT,
+        error TEXT,
+        elapsed REAL,
+        started_at TEXT,
+        finished_at TEXT,
+        PRIMARY KEY (run_id, vendor_id)
+    )
+""")
+
+# Shared generation queue claimed by `worker` processes under a renewable lease.
+cursor.execute("""
+    CREATE TABLE IF NOT EXISTS generation_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT,
+        payload TEXT,
+        output_path TEXT,
+        status TEXT,
+        attempts INTEGER DEFAULT 0,
+        worker TEXT,
+        lease_until REAL,
+        result TEXT,
+        error TEXT,
+        created_at TEXT,
+        started_at TEXT,
+        finished_at TEXT
+    )
+""")
+cursor.execute("CREATE INDEX IF NOT EXISTS idx_generation_jobs_claim ON generation_jobs(status, lease_until)")
+
+# One row per issued line item: normalised name and amount hashed for cross-invoice duplicate checks.
+cursor.execute("""
+    CREATE TABLE IF NOT EXISTS invoice_lines (
+        invoice_id INTEGER,
+        vendor_id TEXT,
+        invoice_no TEXT,
+        invoice_date TEXT,
+        line_hash INTEGER,
+        name TEXT,
+        amount_cents INTEGER
+    )
+""")
+cursor.execute("CREATE INDEX IF NOT EXISTS idx_invoice_lines_lookup ON invoice_lines(vendor_id, line_hash, invoice_date)")
+cursor.execute("CREATE INDEX IF NOT EXISTS idx_invoice_lines_invoice ON invoice_lines(invoice_id)")
+
+# Execution planner journal: the strategy chosen for a render, its predicted and its actual cost.
+cursor.execute("""
+    CREATE TABLE IF NOT EXISTS execution_plans (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT,
+        subject TEXT,
+        strategy TEXT,
+        workers INTEGER,
+        rows INTEGER,
+        estimate_source TEXT,
+        predicted_seconds REAL,
+        predicted_mb REAL,
+        actual_rows INTEGER,
+        actual_seconds REAL,
+        peak_mb REAL,
+        reason TEXT,
+        created_at TEXT
+    )
+""")
+cursor.execute("CREATE INDEX IF NOT EXISTS idx_execution_plans_strategy ON execution_plans(kind, strategy, id)")
+
+# Per-vendor write generation, bumped by triggers on every invoice/vendor write from any process.
+# The query-result cache compares it to decide whether a cached transaction set is still current.
+cursor.execute("""
+    CREATE TABLE IF NOT EXISTS vendor_generations (
+        vendor_id TEXT PRIMARY KEY,
+        generation INTEGER NOT NULL DEFAULT 0
+    )
+""")
+# Bumped by restore_database, so generations read after a restore never equal ones read before it
+cursor.execute("CREATE TABLE IF NOT EXISTS db_epoch (epoch INTEGER NOT NULL)")
+cursor.execute("INSERT INTO db_epoch (epoch) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM db_epoch)")
+_BUMP_GENERATION = """
+    INSERT INTO vendor_generations (vendor_id, generation) SELECT {row}.vendor_id, 1 WHERE {cond}
+        ON CONFLICT(vendor_id) DO UPDATE SET generation = generation + 1;"""
+for _table in ("invoices", "vendors"):
+    cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {_table}_generation_insert AFTER INSERT ON {_table} BEGIN"
+                   + _BUMP_GENERATION.format(row="NEW", cond="1") + " END")
+    cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {_table}_generation_delete AFTER DELETE ON {_table} BEGIN"
+                   + _BUMP_GENERATION.format(row="OLD", cond="1") + " END")
+    # An update that moves a row to another vendor invalidates both vendors
+    cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {_table}_generation_update AFTER UPDATE ON {_table} BEGIN"
+                   + _BUMP_GENERATION.format(row="NEW", cond="1")
+                   + _BUMP_GENERATION.format(row="OLD", cond="OLD.vendor_id IS NOT NEW.vendor_id") + " END")
+
+def _ensure_column(table, column, decl):
+    # Adds columns introduced after a database was first created
+    if column not in [r[1] for r in cursor.execute(f"PRAGMA table_info({table})")]:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+# Invoice total in integer cents, recorded when the invoice is generated.
+_ensure_column("invoices", "amount_cents", "INTEGER")
+# Workbook stat signature and total as last seen by the source watcher.
+_ensure_column("invoices", "source_signature", "TEXT")
+_ensure_column("invoices", "source_amount_cents", "INTEGER")
+_ensure_column("invoices", "source_checked_at", "TEXT")
+# Set once the invoice's line hashes are in invoice_lines, even when it has no lines.
+_ensure_column("invoices", "lines_indexed_at", "TEXT")
+# Peak memory of the largest pool process of a parallel render.
+_ensure_column("execution_plans", "children_mb", "REAL")
+# Covers per-vendor date-range scans and the all-vendor aging aggregation.
+cursor.execute("CREATE INDEX IF NOT EXISTS idx_invoices_vendor_date ON invoices(vendor_id, invoice_date, invoice_type, amount_cents)")
+cursor.execute("CREATE INDEX IF NOT EXISTS idx_vendors_vendor_id ON vendors(vendor_id)")
+# Covers the watcher's per-workbook signature scan.
+cursor.execute("CREATE INDEX IF NOT EXISTS idx_invoices_excel_file ON invoices(excel_file, source_signature)")
+# Case-insensitive prefix search for the vendor picker
+cursor.execute("CREATE INDEX IF NOT EXISTS idx_vendors_name_nocase ON vendors(vendor_name COLLATE NOCASE)")
+cursor.execute("CREATE INDEX IF NOT EXISTS idx_vendors_id_nocase ON vendors(vendor_id COLLATE NOCASE)")
 conn.commit()
 
+# ----------------------------------------------------
+# Yearly Archives
+# ----------------------------------------------------
+# Closed fiscal years are moved out of app.db into archive/invoices_<year>.db. Queries go
+# through invoice_source, which ATTACHes an archive only when the date range asks for it.
+ARCHIVE_DIR = "archive"
+FISCAL_YEAR_START_MONTH = 1
+INVOICE_COLUMNS = "id, vendor_id, invoice_no, invoice_date, invoice_type, po_mr_no, excel_file, amount_cents"
+LINE_COLUMNS = "invoice_id, vendor_id, invoice_no, invoice_date, line_hash, name, amount_cents"
+# Columns read back from the archives, per archived table
+ARCHIVED_COLUMNS = {"invoices": INVOICE_COLUMNS, "invoice_lines": LINE_COLUMNS}
+_attach_ids = itertools.count()
+
+def fiscal_year_bounds(year):
+    """First and last day (ISO strings) of the fiscal year starting in `year`."""
+    start = date(year, FISCAL_YEAR_START_MONTH, 1)
+    end = date(year + 1, FISCAL_YEAR_START_MONTH, 1).toordinal() - 1
+    return start.isoformat(), date.fromordinal(end).isoformat()
+
+def fiscal_year_of(day):
+    return day.year if day.month >= FISCAL_YEAR_START_MONTH else day.year - 1
+
+def archive_path(year):
+    return os.path.join(ARCHIVE_DIR, f"invoices_{year}.db")
+
+def archived_years():
+    if not os.path.isdir(ARCHIVE_DIR):
+        return []
+    years = []
+    for name in os.listdir(ARCHIVE_DIR):
+        stem = name[len("invoices_"):-len(".db")]
+        if name.startswith("invoices_") and name.endswith(".db") and stem.isdigit():
+            years.append(int(stem))
+    return sorted(years)
+
+@contextlib.contextmanager
+def invoice_source(db, from_date=None, to_date=None, table="invoices"):
+    """
+    Yields a FROM expression covering the invoices (or, with table="invoice_lines", their
+    lines) in [from_date, to_date] (either end may be None for open-ended). That is the plain
+    table name unless an archived year overlaps the range, in which case those archives are
+    attached for the duration of the block and the expression is a UNION ALL over them and the
+    live table. Fetch the results inside the block.
+    """
+    columns = ARCHIVED_COLUMNS[table]
+    aliases = []
+    try:
+        for year in archived_years():
+            start, end = fiscal_year_bounds(year)
+            if (to_date and str(to_date) < start) or (from_date and str(from_date) > end):
+                continue
+            alias = f"arch_{year}_{next(_attach_ids)}"
+            db.execute(f"ATTACH DATABASE ? AS {alias}", (archive_path(year),))
+            aliases.append(alias)
+        # Archives written before lines were archived have no invoice_lines table
+        tables = [alias for alias in aliases if db.execute(
+            f"SELECT 1 FROM {alias}.sqlite_master WHERE type='table' AND name=?", (table,)).fetchone()]
+        if not tables:
+            yield table
+        else:
+            parts = [f"SELECT {columns} FROM main.{table}"]
+            parts += [f"SELECT {columns} FROM {alias}.{table}" for alias in tables]
+            yield "(" + " UNION ALL ".join(parts) + ")"
+    finally:
+        for alias in aliases:
+            db.execute(f"DETACH DATABASE {alias}")
+
+def _copy_table_schema(db, table, schema):
+    """
+    Creates schema.table with the columns main.table has now, or adds the ones an older copy
+    lacks. Returns the column names as a select list.
+    """
+    columns = [(name, decl, pk) for _, name, decl, _, _, pk in db.execute(f"PRAGMA main.table_info({table})")]
+    db.execute(f"CREATE TABLE IF NOT EXISTS {schema}.{table} ("
+               + ", ".join(f"{name} {decl}" + (" PRIMARY KEY" if pk else "") for name, decl, pk in columns) + ")")
+    existing = {r[1] for r in db.execute(f"PRAGMA {schema}.table_info({table})")}
+    for name, decl, _ in columns:
+        if name not in existing:
+            db.execute(f"ALTER TABLE {schema}.{table} ADD COLUMN {name} {decl}")
+    return ", ".join(name for name, _, _ in columns)
+
+def archive_fiscal_year(year, vacuum=True):
+    """
+    Moves the invoices of a closed fiscal year, with their invoice_lines rows, into its archive
+    file in one transaction (running it again moves invoices back-dated into that year since).
+    The archive tables get every column the live ones have. VACUUM then returns the freed
+    pages. Returns {"year", "moved", "path"}.
+    """
+    start, end = fiscal_year_bounds(year)
+    if end >= date.today().isoformat():
+        raise ValueError(f"Fiscal year {year} is not closed yet (it ends {end}).")
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    path = archive_path(year)
+    db = sqlite3.connect(DB_FILE)
+    try:
+        db.execute("ATTACH DATABASE ? AS arch", (path,))
+        invoice_columns = _copy_table_schema(db, "invoices", "arch")
+        line_columns = _copy_table_schema(db, "invoice_lines", "arch")
+        db.execute("CREATE INDEX IF NOT EXISTS arch.idx_invoices_vendor_date ON invoices(vendor_id, invoice_date, invoice_type, amount_cents)")
+        db.execute("CREATE INDEX IF NOT EXISTS arch.idx_invoice_lines_lookup ON invoice_lines(vendor_id, line_hash, invoice_date)")
+        db.execute("CREATE INDEX IF NOT EXISTS arch.idx_invoice_lines_invoice ON invoice_lines(invoice_id)")
+        year_ids = "SELECT id FROM main.invoices WHERE invoice_date BETWEEN ? AND ?"
+        with db:
+            db.execute(f"INSERT INTO arch.invoice_lines ({line_columns}) SELECT {line_columns} FROM main.invoice_lines "
+                       f"WHERE invoice_id IN ({year_ids})", (start, end))
+            db.execute(f"DELETE FROM main.invoice_lines WHERE invoice_id IN ({year_ids})", (start, end))
+            moved = db.execute(f"INSERT INTO arch.invoices ({invoice_columns}) SELECT {invoice_columns} FROM main.invoices "
+                               "WHERE invoice_date BETWEEN ? AND ?", (start, end)).rowcount
+            db.execute("DELETE FROM main.invoices WHERE invoice_date BETWEEN ? AND ?", (start, end))
+        db.execute("DETACH DATABASE arch")
+        if vacuum and moved:
+            db.execute("VACUUM")
+    finally:
+        db.close()
+    return {"year": year, "moved": moved, "path": path}
+
+def archivable_years(db):
+    """Closed fiscal years that still have invoices in the live table."""
+    current = fiscal_year_of(date.today())
+    years = set()
+    for (first,) in db.execute("SELECT DISTINCT substr(invoice_date, 1, 7) FROM invoices WHERE invoice_date IS NOT NULL"):
+        try:
+            year = fiscal_year_of(datetime.strptime(first, "%Y-%m").date())
+        except ValueError:
+            continue
+        if year < current:
+            years.add(year)
+    return sorted(years)
+
+# ----------------------------------------------------
+# Utility: Excel Reader Backends
+# ----------------------------------------------------
+# Every backend opens the workbook once and returns [(sheet_name, rows), ...], with
+# cell values normalised so that the same workbook yields the same frame whichever
+# engine read it. Set EXCEL_ENGINE to force one backend for all reads. Backends take a
+# path, or a binary file object named after the path for workbooks read ahead of time.
+EXCEL_ENGINE = None
+LARGE_EXCEL_BYTES = 5 * 1024 * 1024
+
+def _normalize_cell(value):
+    if value is None:
+        return None
+    if hasattr(value, "to_pydatetime"):
+        return value.to_pydatetime()
+    if hasattr(value, "item") and not isinstance(value, (str, bytes)):
+        value = value.item()
+    if isinstance(value, float):
+        if value != value:
+            return None
+        if value.is_integer():
+            return int(value)
+        return value
+    if isinstance(value, str) and value == "":
+        return None
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return datetime.combine(value, datetime.min.time())
+    return value
+
+def _coerce_text(value):
+    # CSV cells arrive as text; give numbers back their type so CSV exports match .xlsx reads.
+    if value == "":
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return _normalize_cell(float(value))
+    except ValueError:
+        return value
+
+def _trim_rows(rows):
+    """
+    Mirrors pandas' own grid handling: trailing empty cells of each row and trailing
+    empty rows are dropped, then every row is padded to the widest one.
+    """
+    trimmed = []
+    for row in rows:
+        row = list(row)
+        while row and row[-1] is None:
+            row.pop()
+        trimmed.append(row)
+    while trimmed and not trimmed[-1]:
+        trimmed.pop()
+    width = max((len(r) for r in trimmed), default=0)
+    for row in trimmed:
+        row.extend([None] * (width - len(row)))
+    return trimmed
+
+def _read_sheets_calamine(path, first_only=False):
+    from python_calamine import CalamineWorkbook
+    workbook = CalamineWorkbook.from_path(path) if isinstance(path, str) else CalamineWorkbook.from_filelike(path)
+    names = workbook.sheet_names[:1] if first_only else workbook.sheet_names
+
+    def load(name):
+        rows = workbook.get_sheet_by_name(name).to_python(skip_empty_area=False)
+        return name, [[_normalize_cell(c) for c in row] for row in rows]
+
+    if len(names) > 1:
+        # calamine parses each sheet independently in native code, so sheets load side by side
+        with ThreadPoolExecutor(max_workers=min(len(names), os.cpu_count() or 1)) as pool:
+            return list(pool.map(load, names))
+    return [load(name) for name in names]
+
+def _read_sheets_openpyxl(path, first_only=False):
+    import openpyxl
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheets = []
+        for sheet in workbook.worksheets[:1] if first_only else workbook.worksheets:
+            sheet.reset_dimensions()
+            sheets.append((sheet.title, [[_normalize_cell(c) for c in row] for row in sheet.iter_rows(values_only=True)]))
+        return sheets
+    finally:
+        workbook.close()
+
+def _read_sheets_pandas(path, first_only=False, engine=None):
+    frames = pd.read_excel(path, header=None, engine=engine, sheet_name=0 if first_only else None)
+    if first_only:
+        frames = {0: frames}
+    return [(name, [[_normalize_cell(c) for c in row] for row in df.astype(object).values.tolist()])
+            for name, df in frames.items()]
+
+def _read_sheets_odf(path, first_only=False):
+    return _read_sheets_pandas(path, first_only, engine="odf")
+
+def _read_sheets_csv(path, first_only=False):
+    if isinstance(path, str):
+        f = open(path, newline="", encoding="utf-8-sig")
+    else:
+        f = io.TextIOWrapper(path, newline="", encoding="utf-8-sig")
+    with f:
+        rows = [[_coerce_text(c) for c in row] for row in csv.reader(f)]
+    name = path if isinstance(path, str) else path.name
+    return [(os.path.splitext(os.path.basename(name))[0], rows)]
+
+EXCEL_ENGINES = {
+    "calamine": _read_sheets_calamine,
+    "openpyxl": _read_sheets_openpyxl,
+    "pandas": _read_sheets_pandas,
+    "odf": _read_sheets_odf,
+    "csv": _read_sheets_csv,
+}
+# Engines whose sheets can be parsed and scanned concurrently from a single open workbook.
+PARALLEL_SHEET_ENGINES = {"calamine"}
+
+def available_excel_engines():
+    """Returns the names of the reader backends whose dependencies are installed."""
+    names = []
+    for name, module in (("calamine", "python_calamine"), ("openpyxl", "openpyxl"),
+                         ("pandas", "pandas"), ("odf", "odf"), ("csv", "csv")):
+        if importlib.util.find_spec(module) is not None:
+            names.append(name)
+    return names
+
+def select_excel_engine(path, size=None):
+    """
+    Picks a reader backend from the file type and size: CSV and ODS have their own readers,
+    .xls goes through pandas, and .xlsx prefers calamine when installed, falling back to
+    openpyxl's read-only streaming mode for large files. size skips the stat when known.
+    """
+    if EXCEL_ENGINE:
+        return EXCEL_ENGINE
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".csv", ".txt"):
+        return "csv"
+    if ext == ".ods":
+        return "odf"
+    if ext == ".xls":
+        return "pandas"
+    if "calamine" in available_excel_engines():
+        return "calamine"
+    if (os.path.getsize(path) if size is None else size) >= LARGE_EXCEL_BYTES:
+        return "openpyxl"
+    return "pandas"
+
+def read_excel_sheets(excel_path, engine=None, first_only=False, data=None):
+    """
+    Opens the workbook once and returns [(sheet_name, rows), ...] with each sheet's grid
+    trimmed, using the given (or auto-selected) engine. data is the file's content when it
+    was already read, in which case excel_path only names it.
+    """
+    engine = engine or select_excel_engine(excel_path, None if data is None else len(data))
+    if engine not in EXCEL_ENGINES:
+        raise ValueError(f"Unknown Excel engine '{engine}'.")
+    source = excel_path
+    if data is not None:
+        source = io.BytesIO(data)
+        source.name = excel_path
+    return [(name, _trim_rows(rows)) for name, rows in EXCEL_ENGINES[engine](source, first_only)]
+
+def read_excel_rows(excel_path, engine=None):
+    """Reads the first sheet as a trimmed list of rows."""
+    sheets = read_excel_sheets(excel_path, engine, first_only=True)
+    return sheets[0][1] if sheets else []
+
+def _header_labels(values):
+    labels = []
+    seen = {}
+    for i, value in enumerate(values):
+        label = f"Unnamed: {i}" if value is None else value
+        if label in seen:
+            seen[label] += 1
+            label = f"{label}.{seen[label]}"
+        seen.setdefault(label, 0)
+        labels.append(label)
+    return labels
+
+def rows_to_frame(rows, header=None):
+    """
+    Builds a DataFrame from a row grid. With header=None the columns are numbered like
+    pd.read_excel(header=None); otherwise that row supplies the column names and only the
+    rows below it become data.
+    """
+    if header is None:
+        return pd.DataFrame(rows)
+    columns = _header_labels(rows[header]) if header < len(rows) else []
+    return pd.DataFrame(rows[header + 1:], columns=columns).infer_objects()
+
+def read_excel_frame(excel_path, header=None, engine=None):
+    return rows_to_frame(read_excel_rows(excel_path, engine), header)
+
+def find_header_row(rows):
+    """Returns the index of the first row holding both a 'name' and an 'amount' cell, or None."""
+    for i, row in enumerate(rows):
+        cells = {str(c).lower() for c in row}
+        if 'name' in cells and 'amount' in cells:
+            return i
+    return None
+
 # ----------------------------------------------------
 # Utility: Process Excel File
 # ----------------------------------------------------
-def process_excel_file(excel_path):
+def _process_sheet(sheet_name, rows):
+    """
+    Applies the header/amount rules to one sheet. Returns (DataFrame, subtotal), or None
+    when the sheet has no 'name'/'amount' header row (cover or notes sheets).
+    """
+    header_row = find_header_row(rows)
+    if header_row is None:
+        return None
+
+    df = rows_to_frame(rows, header_row)
+    # Drop the trailing total row
+    df = df.iloc[:-1]
+    amount_col = None
+    for col in df.columns:
+        if str(col).strip().lower() == 'amount':
+            amount_col = col
+            break
+
+    if amount_col is None:
+        raise ValueError(f"No column named 'amount' found in sheet '{sheet_name}'.")
+
+    df = df.drop_duplicates()
+    # Convert the 'amount' column to numeric and fill NaN with 0
+    df[amount_col] = pd.to_numeric(df[amount_col], errors='coerce').fillna(0)
+    return df, df[amount_col].sum()
+
+def process_excel_workbook(excel_path, engine=None, data=None):
+    """
+    Ingests every sheet of the workbook from a single open. Each sheet gets its own header
+    detection, duplicate removal and subtotal; sheets without a header row are skipped.
+    Returns (DataFrame, total, sections) where sections is a list of
+    {"sheet", "subtotal", "rows"} dicts. When more than one sheet contributes, the combined
+    frame gets a leading "Sheet" column so line items can be grouped again for the PDF.
+    data is the workbook's content when the caller already read it (see read_excel_sheets).
+    """
+    try:
+        engine = engine or select_excel_engine(excel_path, None if data is None else len(data))
+        sheets = read_excel_sheets(excel_path, engine, data=data)
+        if engine in PARALLEL_SHEET_ENGINES and len(sheets) > 1:
+            with ThreadPoolExecutor(max_workers=min(len(sheets), os.cpu_count() or 1)) as pool:
+                results = list(pool.map(lambda s: _process_sheet(*s), sheets))
+        else:
+            results = [_process_sheet(name, rows) for name, rows in sheets]
+
+        found = [(name, r[0], r[1]) for (name, _), r in zip(sheets, results) if r is not None]
+        if not found:
+            raise ValueError("No header row found containing both 'name' and 'amount'.")
+
+        sections = [{"sheet": name, "subtotal": subtotal, "rows": len(df)} for name, df, subtotal in found]
+        if len(found) == 1:
+            df = found[0][1]
+        else:
+            df = pd.concat([sheet_df.assign(Sheet=str(name)) for name, sheet_df, _ in found], ignore_index=True)
+            df = df[["Sheet"] + [c for c in df.columns if c != "Sheet"]]
+        total = sum(s["subtotal"] for s in sections)
+        return df, total, sections
+
+    except Exception as e:
+        raise ValueError(f"Error processing Excel file: {e}")
+
+def process_excel_file(excel_path, engine=None):
     """
     Reads the Excel file, finds a row that contains both 'name' and 'amount' (case-insensitive),
     and then uses that row as the header. It then converts the column named "amount" to numeric,
     sums its values, and returns the DataFrame along with the total sum.
+    Workbooks with several employee sheets are combined; see process_excel_workbook.
+    """
+    df, total, _ = process_excel_workbook(excel_path, engine)
+    return df, total
+# ----------------------------------------------------
+# Utility: Streaming Ingestion (large exports)
+# ----------------------------------------------------
+INGEST_CHUNK_ROWS = 5000
+
+def select_streaming_engine(path):
+    """
+    The reader backend for row-at-a-time ingestion. Like select_excel_engine, except that .xlsx
+    goes to openpyxl's read-only mode, which parses rows as they are asked for; calamine loads a
+    whole sheet before handing out its first row.
     """
+    if EXCEL_ENGINE:
+        return EXCEL_ENGINE
+    if os.path.splitext(path)[1].lower() in (".xlsx", ".xlsm") and "openpyxl" in available_excel_engines():
+        return "openpyxl"
+    return select_excel_engine(path)
+
+def iter_excel_sheet_rows(excel_path, engine=None):
+    """
+    Yields (sheet_name, row) for every row of every sheet. CSV and openpyxl (the default for
+    .xlsx, see select_streaming_engine) never hold a sheet in memory; calamine holds one sheet
+    at a time, and the other engines read the whole workbook first.
+    """
+    engine = engine or select_streaming_engine(excel_path)
+    if engine == "csv":
+        name = os.path.splitext(os.path.basename(excel_path))[0]
+        with open(excel_path, newline="", encoding="utf-8-sig") as f:
+            for row in csv.reader(f):
+                yield name, [_coerce_text(c) for c in row]
+    elif engine == "openpyxl":
+        import openpyxl
+        workbook = openpyxl.load_workbook(excel_path, read_only=True, data_only=True)
+        try:
+            for sheet in workbook.worksheets:
+                sheet.reset_dimensions()
+                for row in sheet.iter_rows(values_only=True):
+                    yield sheet.title, [_normalize_cell(c) for c in row]
+        finally:
+            workbook.close()
+    elif engine == "calamine":
+        from python_calamine import CalamineWorkbook
+        workbook = CalamineWorkbook.from_path(excel_path)
+        for name in workbook.sheet_names:
+            # get_sheet_by_name loads the sheet's whole range
+            for row in workbook.get_sheet_by_name(name).iter_rows():
+                yield name, [_normalize_cell(c) for c in row]
+    else:
+        for name, rows in read_excel_sheets(excel_path, engine):
+            for row in rows:
+                yield name, row
+
+def _to_amount(value):
+    """Per-cell equivalent of pd.to_numeric(errors='coerce').fillna(0); returns (amount, coerced)."""
+    if value is None:
+        return 0.0, False
+    if isinstance(value, (int, float)):
+        return float(value), False
     try:
-        # Read the Excel file without headers
-        df = pd.read_excel(excel_path, header=None)
-        header_row = None
-        # Iterate through rows to find a header row that contains both 'name' and 'amount'
-        for i, row in df.iterrows():
-            # Convert each cell to a lower-case string
-            row_str = row.astype(str).str.lower()
-            if 'name' in row_str.values and 'amount' in row_str.values:
-                header_row = i
-                break
+        return float(str(value).strip()), False
+    except ValueError:
+        return 0.0, True
 
-        if header_row is None:
-            raise ValueError("No header row found containing both 'name' and 'amount'.")
+def _cell_kind(value):
+    if value is None:
+        return "none"
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, (int, float, datetime, str)):
+        return type(value).__name__
+    return "object"
 
-        # Re-read the Excel file using the found header row
-        df = pd.read_excel(excel_path, header=header_row)
-        # Search for the column named "amount" (case-insensitive)
-        df = df.iloc[:-1]
-        amount_col = None
-        for col in df.columns:
-            if str(col).strip().lower() == 'amount':
-                amount_col = col
-                break
+def _frame_dtype(kinds):
+    """
+    The dtype pandas infers for a column holding cells of these kinds (see rows_to_frame):
+    missing cells turn a column of integers into floats, mixed kinds leave it as objects.
+    """
+    values = kinds - {"none"}
+    if values == {"int"} and "none" not in kinds:
+        return "int64"
+    if values and values <= {"int", "float"}:
+        return "float64"
+    if values == {"bool"} and "none" not in kinds:
+        return "bool"
+    if values == {"datetime"}:
+        return "datetime"
+    if values == {"str"}:
+        return "str"
+    return "object"
+
+def _amount_is_float(value):
+    # Whether pd.to_numeric(errors='coerce').fillna(0) turns this amount cell into a float
+    if isinstance(value, str):
+        try:
+            int(value.strip())
+        except ValueError:
+            return True
+        return False
+    return value is None or isinstance(value, float)
+
+def _row_hash(row):
+    return int.from_bytes(hashlib.blake2b(repr(row).encode(), digest_size=8).digest(), "big", signed=True)
+
+def _open_spill(spill_path):
+    spill = sqlite3.connect(spill_path)
+    spill.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_lines (
+            batch TEXT,
+            sheet TEXT,
+            row_no INTEGER,
+            amount REAL,
+            cells TEXT
+        )
+    """)
+    spill.execute("CREATE INDEX IF NOT EXISTS idx_ingest_lines_batch ON ingest_lines(batch, row_no)")
+    return spill
+
+def ingest_excel_streaming(excel_path, engine=None, spill_path="", chunk_rows=INGEST_CHUNK_ROWS, keep_spill=False):
+    """
+    Constant-memory counterpart of process_excel_workbook for very large exports. Rows are read
+    in chunks, the header is detected per sheet, each sheet's trailing total row is dropped and
+    duplicates are removed with a set of 64-bit row hashes instead of a frame copy. The amount
+    column is summed as rows go by. Kept lines are written straight to the ingest_lines table
+    of a SQLite spill file (nothing when spill_path is None). With spill_path "" the spill is a
+    temporary file, removed before returning unless keep_spill is set, in which case the caller
+    removes it (see spilled_workbook).
+    Returns a dict: total, rows, duplicates, coerced, sections, columns, dtypes, spill_path, batch.
+    Each section also records its 1-based "header_row" and the "declared_total" found in the
+    dropped total row (None when that cell is not a number). dtypes gives, per sheet, the dtype
+    of each column in process_excel_workbook's frame (see iter_spilled_frames).
+    """
+    temporary = spill_path == ""
+    if temporary:
+        fd, spill_path = tempfile.mkstemp(prefix="ingest-", suffix=".db")
+        os.close(fd)
+    spill = _open_spill(spill_path) if spill_path else None
+    batch = uuid.uuid4().hex
+    result = {"total": 0.0, "rows": 0, "duplicates": 0, "coerced": 0, "sections": [], "columns": {}, "dtypes": {},
+              "spill_path": spill_path, "batch": batch}
+    pending = []
+    state = {"sheet": None}
+
+    def flush():
+        if spill is not None and pending:
+            spill.executemany("INSERT INTO ingest_lines (batch, sheet, row_no, amount, cells) VALUES (?,?,?,?,?)", pending)
+            spill.commit()
+        pending.clear()
+
+    def note_kinds(row):
+        # The frame's dtypes are inferred before the total row is dropped, so that row counts too
+        for i, kinds in enumerate(state["kinds"]):
+            kinds.add(_cell_kind(row[i]) if i < len(row) else "none")
+
+    def keep(row):
+        # A data row: dedupe on its hash, coerce the amount, add to the running total and spill
+        key = _row_hash(row)
+        if key in state["seen"]:
+            result["duplicates"] += 1
+            return
+        state["seen"].add(key)
+        note_kinds(row)
+        cell = row[state["amount_col"]] if state["amount_col"] < len(row) else None
+        amount, coerced = _to_amount(cell)
+        result["coerced"] += coerced
+        state["float_amounts"] = state["float_amounts"] or coerced or _amount_is_float(cell)
+        state["section"]["subtotal"] += amount
+        state["section"]["rows"] += 1
+        result["total"] += amount
+        result["rows"] += 1
+        pending.append((batch, state["sheet"], result["rows"], amount, json.dumps(row, default=str)))
+        if len(pending) >= chunk_rows:
+            flush()
+
+    def finish_sheet():
+        # Whatever row is still held back is the sheet's total row
+        section, held = state.get("section"), state.get("held")
+        if section is not None:
+            cell = held[state["amount_col"]] if held and state["amount_col"] < len(held) else None
+            amount, coerced = _to_amount(cell)
+            section["declared_total"] = None if cell is None or coerced else amount
+            if held is not None:
+                note_kinds(held)
+            dtypes = [_frame_dtype(kinds) for kinds in state["kinds"]]
+            amount_col = state["amount_col"]
+            float_amounts = state["float_amounts"] or dtypes[amount_col] == "float64"
+            dtypes[amount_col] = "float64" if float_amounts else "int64"
+            result["dtypes"][section["sheet"]] = dtypes
+
+    def start_sheet(name):
+        # A new sheet resets header detection, the dedupe set and the held-back last row
+        finish_sheet()
+        state.update(sheet=name, header=False, seen=set(), held=None, empties=0, section=None, row_no=0)
+
+    try:
+        for sheet, row in iter_excel_sheet_rows(excel_path, engine):
+            if sheet != state["sheet"]:
+                start_sheet(sheet)
+            state["row_no"] += 1
+            while row and row[-1] is None:
+                row.pop()
+            if not state["header"]:
+                if find_header_row([row]) is None:
+                    continue
+                labels = _header_labels(row)
+                state["amount_col"] = next(i for i, c in enumerate(labels) if str(c).strip().lower() == 'amount')
+                state["header"] = True
+                state["section"] = {"sheet": sheet, "subtotal": 0.0, "rows": 0, "header_row": state["row_no"]}
+                result["sections"].append(state["section"])
+                result["columns"][sheet] = labels
+                state.update(kinds=[set() for _ in labels], float_amounts=False)
+                continue
+            if not row:
+                # Blank rows only count if more data follows them (trailing blanks are trimmed)
+                state["empties"] += 1
+                continue
+            # The last non-blank row of a sheet is its total row, so every row is held back one step
+            if state["held"] is not None:
+                keep(state["held"])
+            for _ in range(state["empties"]):
+                keep([])
+            state["held"], state["empties"] = row, 0
+        finish_sheet()
+        flush()
+        if not result["sections"]:
+            raise ValueError("Error processing Excel file: No header row found containing both 'name' and 'amount'.")
+    finally:
+        if spill is not None:
+            spill.close()
+        # A temporary spill only outlives the call when it was asked for and the ingest succeeded
+        if temporary and not (keep_spill and sys.exc_info()[0] is None):
+            os.remove(spill_path)
+            result["spill_path"] = None
+    return result
+
+def iter_spilled_lines(spill_path, batch, start=0, stop=None):
+    """
+    Yields (sheet, amount, cells) for the lines kept by ingest_excel_streaming, in file order.
+    start/stop select lines by their 0-based position, like a slice.
+    """
+    spill = sqlite3.connect(spill_path)
+    try:
+        for sheet, amount, cells in spill.execute(
+                "SELECT sheet, amount, cells FROM ingest_lines WHERE batch=? AND row_no > ? AND row_no <= ? "
+                "ORDER BY row_no", (batch, start, sys.maxsize if stop is None else stop)):
+            yield sheet, amount, json.loads(cells)
+    finally:
+        spill.close()
 
-        if amount_col is None:
-            raise ValueError("No column named 'amount' found.")
+@contextlib.contextmanager
+def spilled_workbook(excel_path, engine=None):
+    """
+    Ingests the workbook with ingest_excel_streaming into a temporary spill file and yields the
+    result; the spill file is removed when the block exits.
+    """
+    result = ingest_excel_streaming(excel_path, engine, spill_path="", keep_spill=True)
+    try:
+        yield result
+    finally:
+        os.remove(result["spill_path"])
+
+def spilled_frame(spilled, start=0, stop=None):
+    """
+    Lines start:stop of a single-sheet spill as a DataFrame with the columns, dtypes and amounts
+    process_excel_workbook's frame has for them, so any run of lines lays out as those rows would.
+    """
+    sheet = spilled["sections"][0]["sheet"]
+    labels, dtypes = spilled["columns"][sheet], spilled["dtypes"][sheet]
+    width = len(labels)
+    amount_col = next(i for i, c in enumerate(labels) if str(c).strip().lower() == "amount")
+    lines = list(iter_spilled_lines(spilled["spill_path"], spilled["batch"], start, stop))
+    df = pd.DataFrame([(cells + [None] * width)[:width] for _, _, cells in lines], columns=labels, dtype=object)
+    for i, dtype in enumerate(dtypes):
+        if i == amount_col:
+            # The spill holds the coerced amount
+            df.isetitem(i, pd.Series([amount for _, amount, _ in lines], dtype="float64").astype(dtype))
+        elif dtype == "datetime":
+            # Dates went through JSON as text
+            df.isetitem(i, pd.to_datetime(df.iloc[:, i]))
+        elif dtype == "str":
+            # object on older pandas, the string dtype where pandas infers one
+            df.isetitem(i, df.iloc[:, i].astype(pd.Series(["", None], dtype=object).infer_objects().dtype))
+        elif dtype != "object":
+            df.isetitem(i, df.iloc[:, i].astype(dtype))
+    return df
+
+def spilled_total(spilled):
+    """The spill's total as process_excel_workbook reports it: an integer when every amount is whole."""
+    sheet = spilled["sections"][0]["sheet"]
+    amount_col = next(i for i, c in enumerate(spilled["columns"][sheet]) if str(c).strip().lower() == "amount")
+    return spilled["total"] if spilled["dtypes"][sheet][amount_col] == "float64" else int(round(spilled["total"]))
 
-        df = df.drop_duplicates()
-        # Convert the 'amount' column to numeric and fill NaN with 0
-        df[amount_col] = pd.to_numeric(df[amount_col], errors='coerce').fillna(0)
-        print(df)
-        total = df[amount_col].sum()
+def iter_spilled_frames(spilled, rows=INGEST_CHUNK_ROWS):
+    """Yields the lines of a single-sheet spill as spilled_frame chunks of up to `rows` lines."""
+    for start in range(0, spilled["rows"], rows):
+        yield spilled_frame(spilled, start, start + rows)
 
-        return df, total
+def excel_total(excel_path):
+    """
+    Returns just the amount total of a workbook. Large files go through the streaming path
+    without spilling, so SOA/report totals never materialise the whole sheet.
+    """
+    if os.path.getsize(excel_path) >= LARGE_EXCEL_BYTES:
+        return ingest_excel_streaming(excel_path, spill_path=None)["total"]
+    return process_excel_file(excel_path)[1]
+
+# ----------------------------------------------------
+# Workbook Validation (dry run)
+# ----------------------------------------------------
+# Runs only the ingestion step over vendor workbooks - no PDF, no invoices row - and reports
+# what generate_invoice would have seen, so a month-end folder can be checked up front.
+SPREADSHEET_EXTENSIONS = (".xlsx", ".xlsm", ".xls", ".ods", ".csv")
+# Relative difference tolerated between the computed subtotal and the sheet's own total row
+TOTAL_TOLERANCE = 0.005
 
+def validate_workbook(excel_path, engine=None):
+    """
+    Ingests one workbook without spilling and returns a report dict: path, status
+    ("ok", "warning" or "error"), issues, total, rows, duplicates, coerced, sections (with
+    header_row and declared_total per sheet) and seconds.
+    """
+    started = perf_counter()
+    report = {"path": excel_path, "status": "ok", "issues": [], "total": 0.0, "rows": 0,
+              "duplicates": 0, "coerced": 0, "sections": []}
+    try:
+        result = ingest_excel_streaming(excel_path, engine, spill_path=None)
     except Exception as e:
-        raise ValueError(f"Error processing Excel file: {e}")
+        report.update(status="error", issues=[str(e)])
+    else:
+        for key in ("total", "rows", "duplicates", "coerced", "sections"):
+            report[key] = result[key]
+        issues = report["issues"]
+        for section in result["sections"]:
+            declared = section.get("declared_total")
+            if section["rows"] == 0:
+                issues.append(f"{section['sheet']}: no line items under the header")
+            if declared is None:
+                issues.append(f"{section['sheet']}: last row has no numeric total")
+            elif abs(declared - section["subtotal"]) > max(0.01, abs(declared) * TOTAL_TOLERANCE):
+                issues.append(f"{section['sheet']}: computed {section['subtotal']:,.2f} but the total row says {declared:,.2f}")
+        if result["total"] <= 0:
+            issues.append(f"total is {result['total']:,.2f}")
+        if result["coerced"]:
+            issues.append(f"{result['coerced']} non-numeric amount(s) counted as 0")
+        if issues:
+            report["status"] = "warning"
+    report["seconds"] = round(perf_counter() - started, 3)
+    return report
+
+def find_workbooks(directory):
+    paths = []
+    for root, _, names in os.walk(directory):
+        paths.extend(os.path.join(root, n) for n in names
+                     if n.lower().endswith(SPREADSHEET_EXTENSIONS) and not n.startswith("~$"))
+    return sorted(paths)
+
+def validate_directory(directory, workers=None, engine=None, progress=None):
+    """Validates every spreadsheet under directory in a process pool; returns the reports sorted by path."""
+    paths = find_workbooks(directory)
+    reports = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(validate_workbook, path, engine) for path in paths]
+        for future in as_completed(futures):
+            reports.append(future.result())
+            if progress:
+                progress(len(reports), len(paths))
+    return sorted(reports, key=lambda r: r["path"])
+
+def write_validation_report(output_path, reports):
+    with open(output_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["File", "Status", "Header Row(s)", "Rows", "Total", "Duplicates Dropped",
+                         "Amounts Coerced to 0", "Seconds", "Issues"])
+        for r in reports:
+            headers = "; ".join(f"{s['sheet']}:{s['header_row']}" for s in r["sections"])
+            writer.writerow([r["path"], r["status"], headers, r["rows"], f"{r['total']:.2f}", r["duplicates"],
+                             r["coerced"], f"{r['seconds']:.3f}", " | ".join(r["issues"])])
+
+def format_validation_summary(reports, seconds=None):
+    counts = {status: sum(1 for r in reports if r["status"] == status) for status in ("ok", "warning", "error")}
+    lines = [f"{len(reports)} workbook(s): {counts['ok']} ok, {counts['warning']} warning(s), {counts['error']} error(s)"
+             + (f" in {seconds:.1f}s" if seconds is not None else "")]
+    for r in reports:
+        if r["status"] != "ok":
+            lines.append(f"  [{r['status']}] {r['path']}: " + " | ".join(r["issues"]))
+    return "\n".join(lines)
+
+# ----------------------------------------------------
+# Transactions (typed ledger rows)
+# ----------------------------------------------------
+def to_cents(amount):
+    return int(round(float(amount) * 100)) if amount else 0
+
+def format_cents(cents):
+    return f"{cents / 100:,.2f}"
+
+class Transaction:
+    """
+    One ledger line of a report or SOA. The date is parsed once into a date object and the
+    amounts are integer cents, so aging and rendering never re-parse strings.
+    """
+    __slots__ = ("date", "invoice_no", "name", "debit", "credit")
+
+    def __init__(self, date, invoice_no, name, debit=0, credit=0):
+        self.date = date
+        self.invoice_no = invoice_no
+        self.name = name
+        self.debit = debit
+        self.credit = credit
+
+    @classmethod
+    def from_invoice(cls, invoice_date, invoice_no, name, invoice_type, amount):
+        """A "Credit" invoice lands in the Debit column and anything else in Credit, as on the PDFs."""
+        try:
+            d = date.fromisoformat(invoice_date) if isinstance(invoice_date, str) else invoice_date
+        except ValueError:
+            d = None
+        cents = to_cents(amount)
+        if (invoice_type or "").lower() == "credit":
+            return cls(d, invoice_no, name, debit=cents)
+        return cls(d, invoice_no, name, credit=cents)
+
+    @property
+    def date_text(self):
+        return self.date.isoformat() if self.date else ""
+
+    def display_values(self):
+        """Strings for a Treeview row: (date, invoice_no, Name, debit, credit)."""
+        return (self.date_text, self.invoice_no, self.name,
+                format_cents(self.debit) if self.debit else "",
+                format_cents(self.credit) if self.credit else "")
+
+# ----------------------------------------------------
+# Output Profiles (image resolution / compression)
+# ----------------------------------------------------
+# The header/footer/signature images are embedded at source resolution unless a profile
+# resamples them to the size they are actually drawn at. Resampled copies are made once per
+# profile and source image, and reused for every later document.
+OUTPUT_PROFILES = {
+    "print":   {"dpi": 300, "jpeg_quality": 92, "compress": True},
+    "archive": {"dpi": 150, "jpeg_quality": 80, "compress": True},
+    "email":   {"dpi": 96,  "jpeg_quality": 70, "compress": True},
+}
+DEFAULT_OUTPUT_PROFILE = "print"
+ASSET_CACHE_DIR = "asset_cache"
+# Drawn size (points) of each image on the page
+ASSET_BOXES = {
+    "header.png": (A4[0], 80),
+    "footer.png": (A4[0], 80),
+    "signeture.jpg": (A4[0] * 0.95, 50),
+    "ss.jpg": (A4[0] * 0.95, 10),
+    "seal.png": (A4[0] * 0.10, 50),
+}
+
+def output_profile_key(profile=None, grayscale=False):
+    """Name of a profile variant as used in cache keys and folder names, e.g. 'email-gray'."""
+    profile = profile or DEFAULT_OUTPUT_PROFILE
+    if profile not in OUTPUT_PROFILES:
+        raise ValueError(f"Unknown output profile: {profile}")
+    return profile + ("-gray" if grayscale else "")
+
+def _resample_asset(src, dest, box, settings, grayscale):
+    from PIL import Image as PILImage
+    with PILImage.open(src) as img:
+        img.load()
+        # Never upsample: a source smaller than the target DPI is kept as is
+        scale = min(1.0, box[0] * settings["dpi"] / 72 / img.width, box[1] * settings["dpi"] / 72 / img.height)
+        if scale < 1.0:
+            img = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))), PILImage.LANCZOS)
+        has_alpha = img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info
+        if grayscale:
+            img = img.convert("LA" if has_alpha else "L")
+        if dest.lower().endswith((".jpg", ".jpeg")):
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("L" if grayscale else "RGB")
+            img.save(dest, "JPEG", quality=settings["jpeg_quality"], optimize=True)
+        else:
+            img.save(dest, "PNG", optimize=True)
+
+def profile_assets(profile=None, grayscale=False):
+    """
+    Maps each image name in ASSET_BOXES to the file to draw for the given profile. Missing
+    sources (or Pillow failing on them) fall back to the original path, so the PDF code shows
+    its usual "[... Image Missing]" placeholder.
+    """
+    key = output_profile_key(profile, grayscale)
+    settings = OUTPUT_PROFILES[key.split("-")[0]]
+    folder = os.path.join(ASSET_CACHE_DIR, key)
+    assets = {}
+    for name, box in ASSET_BOXES.items():
+        assets[name] = name
+        digest = file_digest(name)
+        if digest == "missing":
+            continue
+        stem, ext = os.path.splitext(name)
+        dest = os.path.join(folder, f"{stem}-{digest[:16]}{ext}")
+        if not os.path.exists(dest):
+            try:
+                os.makedirs(folder, exist_ok=True)
+                tmp = f"{dest}.{uuid.uuid4().hex}{ext}"
+                _resample_asset(name, tmp, box, settings, grayscale)
+                os.replace(tmp, dest)
+            except Exception:
+                continue
+        assets[name] = dest
+    return assets
+
+def make_pdf_doc(target, profile=None, grayscale=False, doc_class=None):
+    """A4 document for target with the profile's page compression; doc.assets holds its images."""
+    settings = OUTPUT_PROFILES[output_profile_key(profile).split("-")[0]]
+    doc = (doc_class or SimpleDocTemplate)(target, pagesize=A4, topMargin=90, bottomMargin=90,
+                                           pageCompression=1 if settings["compress"] else 0)
+    doc.assets = profile_assets(profile, grayscale)
+    return doc
+
+def render_stats(output_path, started):
+    """Size and wall time of a rendered document, for choosing between profiles."""
+    return {"bytes": os.path.getsize(output_path), "seconds": round(perf_counter() - started, 3)}
+
+def format_render_stats(meta):
+    if "bytes" not in meta:
+        return ""
+    return f"{meta['bytes'] / 1024:,.0f} KB in {meta['seconds']:.2f} s"
+
 # ----------------------------------------------------
 # PDF Generation Helpers – New Table Format
 # ----------------------------------------------------
 def add_page_header_footer(canvas, doc):
     page_width, page_height = A4
+    assets = getattr(doc, "assets", {})
     try:
-        canvas.drawImage("header.png", 0, page_height - 80, width=page_width, height=80)
+        canvas.drawImage(assets.get("header.png", "header.png"), 0, page_height - 80, width=page_width, height=80)
     except:
         canvas.drawString(10, page_height - 50, "[Header Image Missing]")
     try:
-        canvas.drawImage("footer.png", 0, 0, width=page_width, height=80)
+        canvas.drawImage(assets.get("footer.png", "footer.png"), 0, 0, width=page_width, height=80)
     except:
         canvas.drawString(10, 30, "[Footer Image Missing]")
 
-def create_report_table_pdf(output_path, title, data_rows, balance_bf=0.0, aging_summary=None):
+def create_report_table_pdf(output_path, title, transactions, balance_bf=0.0, aging_summary=None,
+                            profile=None, grayscale=False):
     """
     Generates a PDF with a table having columns:
     Date | Invoice # | Name | Debit | Credit | Balance
     It adds:
       - A "Balance b/f" row,
-      - Each data row (with running balance computed),
+      - Each Transaction (with running balance computed),
       - A "Sub-Total" row,
       - And an optional aging summary.
+    profile/grayscale select the output profile (see OUTPUT_PROFILES).
     """
-    doc = SimpleDocTemplate(output_path, pagesize=A4, topMargin=90, bottomMargin=90)
+    doc = make_pdf_doc(output_path, profile, grayscale)
     elements = []
     styles = getSampleStyleSheet()
     page_width, page_height = A4
@@ -142,31 +1167,22 @@ def create_report_table_pdf(output_path, title, data_rows, balance_bf=0.0, aging
     # Balance b/f row
     table_data.append(["", "", Paragraph("<b>Balance b/f</b>", normal_style), "", "", f"{balance_bf:,.2f}"])
     
-    running_balance = balance_bf
-    total_debit = 0.0
-    total_credit = 0.0
+    # Running totals are kept in integer cents
+    running_balance = to_cents(balance_bf)
+    total_debit = 0
+    total_credit = 0
     
-    # Each row in data_rows is expected to be a tuple:
-    # (invoice_date, invoice_no, Name, debit, credit)
-    for row in data_rows:
-        inv_date, inv_no, Name, debit, credit = row
-        debit = float(debit) if debit else 0.0
-        credit = float(credit) if credit else 0.0
-        running_balance += (debit - credit)
-        total_debit += debit
-        total_credit += credit
-        table_data.append([
-            inv_date, inv_no, Name,
-            f"{debit:,.2f}" if debit else "",
-            f"{credit:,.2f}" if credit else "",
-            f"{running_balance:,.2f}"
-        ])
+    for txn in transactions:
+        running_balance += txn.debit - txn.credit
+        total_debit += txn.debit
+        total_credit += txn.credit
+        table_data.append(list(txn.display_values()) + [format_cents(running_balance)])
     
     # Sub-Total row
     table_data.append(["", "", Paragraph("<b>Sub-Total</b>", normal_style),
-                        f"{total_debit:,.2f}",
-                        f"{total_credit:,.2f}",
-                        f"{running_balance:,.2f}"])
+                        format_cents(total_debit),
+                        format_cents(total_credit),
+                        format_cents(running_balance)])
     
     t = Table(table_data, colWidths=[70, 80, 100, 60, 60, 70])
     t.setStyle(TableStyle([
@@ -199,52 +1215,49 @@ def create_report_table_pdf(output_path, title, data_rows, balance_bf=0.0, aging
         ]))
         elements.append(aging_table)
     try:
-        signature_img = "signeture.jpg"
+        signature_img = doc.assets.get("signeture.jpg", "signeture.jpg")
         elements.append(Image(signature_img, width=page_width * 0.95, height=50))
     except Exception as e:
         elements.append(Paragraph("[Signature Image Missing]", normal_style))
     elements.append(Spacer(1, 20))
     try:
-        second_signature = "ss.jpg"
+        second_signature = doc.assets.get("ss.jpg", "ss.jpg")
         elements.append(Image(second_signature, width=page_width * 0.95, height=10))
     except Exception as e:
         elements.append(Paragraph("[Second Signature Image Missing]", normal_style))
     elements.append(Spacer(1, 20))
     doc.build(elements, onFirstPage=add_page_header_footer, onLaterPages=add_page_header_footer)
 
-def compute_aging(data_rows):
+def compute_aging(transactions):
     """
-    Computes an aging summary from data_rows (list of tuples: (invoice_date, ..., debit, credit)).
+    Computes an aging summary from a list of Transactions.
     Buckets (example):
       - current: 0-30 days,
       - 1month: 31-60,
       - 2months: 61-90,
       - 3months: 91-120,
       - 4plus: over 120 days.
-    Sums the net (debit - credit) for each bucket.
+    Sums the net (debit - credit) for each bucket. Undated transactions count as current.
     """
     today = datetime.now().date()
-    buckets = {"current": 0.0, "1month": 0.0, "2months": 0.0, "3months": 0.0, "4plus": 0.0}
-    for row in data_rows:
-        inv_date_str, _, _, debit, credit = row
-        try:
-            d = datetime.strptime(inv_date_str, "%Y-%m-%d").date()
-        except:
-            d = today
-        delta = (today - d).days
-        net = (float(debit) if debit else 0.0) - (float(credit) if credit else 0.0)
-        if delta <= 30:
-            buckets["current"] += net
-        elif delta <= 60:
-            buckets["1month"] += net
-        elif delta <= 90:
-            buckets["2months"] += net
-        elif delta <= 120:
-            buckets["3months"] += net
-        else:
-            buckets["4plus"] += net
+    buckets = {"current": 0, "1month": 0, "2months": 0, "3months": 0, "4plus": 0}
+    for txn in transactions:
+        buckets[aging_bucket(txn, today)] += txn.debit - txn.credit
     buckets["total"] = sum(buckets.values())
-    return buckets
+    return {k: v / 100 for k, v in buckets.items()}
+
+def aging_bucket(txn, today):
+    """Key of the compute_aging bucket a Transaction falls in."""
+    delta = (today - txn.date).days if txn.date else 0
+    if delta <= 30:
+        return "current"
+    elif delta <= 60:
+        return "1month"
+    elif delta <= 90:
+        return "2months"
+    elif delta <= 120:
+        return "3months"
+    return "4plus"
 
 # ----------------------------------------------------
 # PDF Generation Functions for Invoices & SOA (Modified)
@@ -337,17 +1350,8 @@ def create_invoice_pdf_modified(output_path, input_details, total_amount):
     # New Table: Build a one-row table from processed Excel total.
     invoice_date = input_details.get("invoice_date", "")
     invoice_no = input_details.get("invoice_no", "")
-    inv_type = input_details.get("invoice_type", "").lower()
     # For our table, if type is "credit" then total goes to Debit column; if "debit" then to Credit column.
-    if inv_type == "credit":
-        debit_val = total_amount
-        credit_val = 0.0
-    else:
-        debit_val = 0.0
-        credit_val = total_amount
-
-    # Data row for our table
-    data_rows = [(invoice_date, invoice_no, "", debit_val, credit_val)]
+    data_rows = [Transaction.from_invoice(invoice_date, invoice_no, "", input_details.get("invoice_type", ""), total_amount)]
     # Generate PDF table with new format using our helper (balance b/f=0)
     aging = compute_aging(data_rows)
     # Title for invoice report PDF
@@ -381,9 +1385,53 @@ def wrap_cell_text(text, style):
 #         canvas.drawString(10, 30, "[Footer Image Missing]")
 
 
+def excel_column_lengths(excel_df):
+    """Length of the longest cell text (or title) of each column; the first column counts at least 5."""
+    lengths = []
+    for i, col in enumerate(excel_df.columns):
+        longest = excel_df.iloc[:, i].astype(str).str.len().max() if len(excel_df) else 0
+        max_len = max(0 if pd.isnull(longest) else int(longest), len(str(col)))
+        if i == 0:
+            max_len = max(max_len, 5)
+        lengths.append(max_len)
+    return lengths
+
+def excel_column_widths(excel_df, table_width, lengths=None):
+    """
+    Splits table_width across the columns in proportion to their longest cell text. lengths
+    overrides excel_column_lengths(excel_df), e.g. when the rows are seen a chunk at a time.
+    """
+    col_widths_ratio = lengths or excel_column_lengths(excel_df)
+    total_ratio = sum(col_widths_ratio)
+    return [table_width * (ratio / total_ratio) for ratio in col_widths_ratio]
+
+def excel_items_table(excel_df, colWidths, wrap_style, header=True):
+    """Line-item table; header=False leaves out the column titles (continuation chunks)."""
+    data = [[wrap_cell_text(col, wrap_style) for col in excel_df.columns]] if header else []
+    for row in excel_df.values:
+        data.append([wrap_cell_text("" if pd.isnull(cell) else str(cell), wrap_style) for cell in row])
+    excel_table = Table(data, colWidths=colWidths)
+    if header:
+        excel_table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.lightblue),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+            ('ALIGN', (0, 1), (-1, -1), 'LEFT'),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ]))
+    else:
+        excel_table.setStyle(TableStyle([
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ]))
+    return excel_table
+
 def open_excel_editor(excel_path, parent):
     try:
-        df = pd.read_excel(excel_path)
+        df = read_excel_frame(excel_path, header=0)
     except Exception as e:
         messagebox.showerror("Error", f"Failed to load Excel file: {e}")
         return None
@@ -423,12 +1471,18 @@ def open_excel_editor(excel_path, parent):
     editor_win.wait_window()
     return df
 
-def create_invoice_pdf(output_path, input_details, excel_df,amount, include_seal=True):
-    doc = SimpleDocTemplate(output_path, pagesize=A4, topMargin=90, bottomMargin=90)
-    elements = []
-    styles = getSampleStyleSheet()
-    page_width, page_height = A4
+def create_invoice_pdf(output_path, input_details, excel_df,amount, include_seal=True, sections=None,
+                       profile=None, grayscale=False):
+    """
+    Renders the full invoice. When `sections` (from process_excel_workbook) lists more than one
+    sheet, the line items are shown as one table per sheet with a sub-total under each.
+    """
+    doc = make_pdf_doc(output_path, profile, grayscale)
+    elements = build_invoice_elements(input_details, excel_df, amount, include_seal, sections, assets=doc.assets)
+    doc.build(elements, onFirstPage=add_page_header_footer, onLaterPages=add_page_header_footer)
 
+def _invoice_styles():
+    styles = getSampleStyleSheet()
     normal_style = ParagraphStyle(
         'normal_style',
         parent=styles['Normal'],
@@ -441,6 +1495,70 @@ def create_invoice_pdf(output_path, input_details, excel_df,amount, include_seal
         parent=normal_style,
         wordWrap='CJK'
     )
+    return styles, normal_style, wrap_style
+
+def build_invoice_elements(input_details, excel_df, amount, include_seal=True, sections=None, max_rows=None,
+                           assets=None, line_count=None):
+    """
+    Returns the flowables of an invoice. With max_rows only the first line items are laid out
+    (followed by a note of how many were left out) while the totals still cover every row.
+    assets maps image names to the files to embed (see profile_assets). line_count is the
+    workbook's number of lines when excel_df holds only the first of them.
+    """
+    styles, normal_style, wrap_style = _invoice_styles()
+    page_width, page_height = A4
+    elements = invoice_head_elements(input_details)
+
+    # ---------------------------------------------------------------
+    # 4. Excel Data Table with Wrapped Text
+    # ---------------------------------------------------------------
+    hidden_rows = 0
+    if excel_df is not None and max_rows is not None:
+        hidden_rows = (len(excel_df) if line_count is None else line_count) - min(len(excel_df), max_rows)
+    if hidden_rows > 0:
+        excel_df = excel_df.head(max_rows)
+        if sections and "Sheet" in excel_df.columns:
+            shown = set(excel_df["Sheet"])
+            sections = [s for s in sections if str(s["sheet"]) in shown]
+
+    if excel_df is not None and not excel_df.empty:
+        table_width = page_width * 0.95
+        if sections and len(sections) > 1 and "Sheet" in excel_df.columns:
+            # One titled table per source sheet, each closed by its own sub-total
+            item_columns = [c for c in excel_df.columns if c != "Sheet"]
+            colWidths = excel_column_widths(excel_df[item_columns], table_width)
+            for section in sections:
+                sheet_df = excel_df.loc[excel_df["Sheet"] == str(section["sheet"]), item_columns]
+                elements.append(Paragraph(f"<b>{section['sheet']}</b>", normal_style))
+                elements.append(Spacer(1, 5))
+                elements.append(excel_items_table(sheet_df, colWidths, wrap_style))
+                subtotal_table = Table([[Paragraph(f"<b>Sub-Total ({section['sheet']})</b>", normal_style),
+                                         Paragraph(f"{section['subtotal']:,.2f}", normal_style)]],
+                                       colWidths=[table_width * 0.55, table_width * 0.40])
+                subtotal_table.setStyle(TableStyle([
+                    ('BOX', (0,0), (-1,-1), 0.5, colors.grey),
+                    ('ALIGN', (1,0), (1,0), 'RIGHT'),
+                ]))
+                elements.append(subtotal_table)
+                elements.append(Spacer(1, 15))
+        else:
+            colWidths = excel_column_widths(excel_df, table_width)
+            elements.append(excel_items_table(excel_df, colWidths, wrap_style))
+            elements.append(Spacer(1, 15))
+        if hidden_rows:
+            elements.append(Paragraph(f"<i>... {hidden_rows:,} more rows not shown in preview</i>", normal_style))
+            elements.append(Spacer(1, 15))
+
+        elements.extend(invoice_total_elements(amount))
+
+    elements.extend(invoice_signature_elements(include_seal, assets))
+    return elements
+
+def invoice_head_elements(input_details):
+    """Title, vendor/invoice and form/bank boxes, and the heading above the line items."""
+    elements = []
+    styles, normal_style, _ = _invoice_styles()
+    page_width, page_height = A4
 
     # Title
     elements.append(Paragraph("Invoice", styles['Title']))
@@ -550,131 +1668,2643 @@ def create_invoice_pdf(output_path, input_details, excel_df,amount, include_seal
     # ---------------------------------------------------------------
     elements.append(Paragraph("Invoice Details: Pre-medical Employment", styles['Title']))
     elements.append(Spacer(1, 10))
+    return elements
+
+def invoice_total_elements(amount):
+    """The total row (figures and words) under the line items."""
+    elements = []
+    _, normal_style, _ = _invoice_styles()
+    table_width = A4[0] * 0.95
 
     # ---------------------------------------------------------------
-    # 4. Excel Data Table with Wrapped Text
+    # 5. Total Calculation with Custom Currency Conversion
     # ---------------------------------------------------------------
-    if excel_df is not None and not excel_df.empty:
-        data = []
-        header_row = [wrap_cell_text(col, wrap_style) for col in excel_df.columns]
-        data.append(header_row)
-        for row in excel_df.values:
-            wrapped_row = [wrap_cell_text("" if pd.isnull(cell) else str(cell), wrap_style) for cell in row]
-            data.append(wrapped_row)
-       
-        num_cols = len(data[0])
-        col_widths_ratio = []
-        for col in range(num_cols):
-            max_len = max([len(str(excel_df.iloc[r, col])) for r in range(len(excel_df))] + [len(str(excel_df.columns[col]))])
-            if col == 0:
-                max_len = max(max_len, 5)
-            col_widths_ratio.append(max_len)
-        total_ratio = sum(col_widths_ratio)
-        table_width = page_width * 0.95
-        colWidths = [table_width * (ratio / total_ratio) for ratio in col_widths_ratio]
+    total_amount = amount
 
-        excel_table = Table(data, colWidths=colWidths)
-        excel_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.lightblue),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-            ('ALIGN', (0, 1), (-1, -1), 'LEFT'),
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ]))
-        elements.append(excel_table)
-        elements.append(Spacer(1, 15))
-
-        # ---------------------------------------------------------------
-        # 5. Total Calculation with Custom Currency Conversion
-        # ---------------------------------------------------------------
-
-
-        total_amount = amount
+    total_str = f"Total: {total_amount}"
+    amount_int = int(round(total_amount))
+    total_words = num2words(amount_int, lang='en').title() + " Riyals Only"
+    total_data = [
+        [Paragraph("<b>Total:</b>", normal_style), Paragraph(total_str, normal_style), Paragraph(total_words, normal_style)]
+    ]
+    total_table = Table(total_data, colWidths=[table_width*0.15, table_width*0.40, table_width*0.40])
+    total_table.setStyle(TableStyle([
+        ('BOX', (0,0), (-1,-1), 1, colors.black),
+        ('BACKGROUND', (0,0), (0,0), colors.lightsteelblue),
+        ('LEFTPADDING', (0,0), (-1,-1), 8),
+        ('RIGHTPADDING', (0,0), (-1,-1), 8),
+        ('VALIGN', (0,0), (-1,-1), 'TOP'),
+    ]))
+    elements.append(total_table)
+    elements.append(Spacer(1, 20))
+    return elements
 
-        total_str = f"Total: {total_amount}"
-        amount_int = int(round(total_amount))
-        total_words = num2words(amount_int, lang='en').title() + " Riyals Only"
-        total_data = [
-            [Paragraph("<b>Total:</b>", normal_style), Paragraph(total_str, normal_style), Paragraph(total_words, normal_style)]
-        ]
-        total_table = Table(total_data, colWidths=[table_width*0.15, table_width*0.40, table_width*0.40])
-        total_table.setStyle(TableStyle([
-            ('BOX', (0,0), (-1,-1), 1, colors.black),
-            ('BACKGROUND', (0,0), (0,0), colors.lightsteelblue),
-            ('LEFTPADDING', (0,0), (-1,-1), 8),
-            ('RIGHTPADDING', (0,0), (-1,-1), 8),
-            ('VALIGN', (0,0), (-1,-1), 'TOP'),
-        ]))
-        elements.append(total_table)
-        elements.append(Spacer(1, 20))
+def invoice_signature_elements(include_seal=True, assets=None):
+    """Signature images and, with include_seal, the company seal."""
+    assets = assets or {}
+    elements = []
+    _, normal_style, _ = _invoice_styles()
+    page_width, page_height = A4
 
     # ---------------------------------------------------------------
     # 6. Signature Images Section
     # ---------------------------------------------------------------
     try:
-        signature_img = "signeture.jpg"
+        signature_img = assets.get("signeture.jpg", "signeture.jpg")
         elements.append(Image(signature_img, width=page_width * 0.95, height=50))
     except Exception as e:
         elements.append(Paragraph("[Signature Image Missing]", normal_style))
     elements.append(Spacer(1, 20))
     try:
-        second_signature = "ss.jpg"
+        second_signature = assets.get("ss.jpg", "ss.jpg")
         elements.append(Image(second_signature, width=page_width * 0.95, height=10))
     except Exception as e:
         elements.append(Paragraph("[Second Signature Image Missing]", normal_style))
     elements.append(Spacer(1, 20))
     if include_seal:
         try:
-            seal_img = "seal.png"
+            seal_img = assets.get("seal.png", "seal.png")
             elements.append(Image(seal_img, width=page_width * 0.10, height=50))
         except Exception as e:
             elements.append(Paragraph("[Seal Image Missing]", normal_style))
     elements.append(Spacer(1, 20))
+    return elements
+
+
+
+
+
+def create_soa_pdf_modified(output_path, soa_info, invoices_data, profile=None, grayscale=False):
+    """
+    Generates an SOA PDF similar to invoice PDF but with SOA header details.
+    invoices_data is a list of Transactions.
+    The table is built with our new format.
+    """
+    doc = SimpleDocTemplate(output_path, pagesize=A4, topMargin=90, bottomMargin=90)
+    elements = []
+    styles = getSampleStyleSheet()
+    normal_style = ParagraphStyle('normal_style', parent=styles['Normal'], fontName='Helvetica', fontSize=10, leading=12)
+    
+    # Header with statement details
+    header_text = f"""
+    <para align=center>
+    <b>Statement Date:</b> {soa_info.get('statement_date','')} &nbsp;&nbsp;&nbsp;
+    <b>Due Date:</b> {soa_info.get('due_date','')}
+    </para>
+    """
+    elements.append(Paragraph(header_text, normal_style))
+    elements.append(Spacer(1, 10))
+    company_details = f"""
+    <para align=center>
+    <font color="darkblue"><b>STATEMENT OF ACCOUNT</b><br/>
+    {soa_info.get('company_name','')}<br/>
+    {soa_info.get('company_address','')}</font>
+    </para>
+    """
+    elements.append(Paragraph(company_details, styles['Title']))
+    elements.append(Spacer(1, 15))
+    
+    # Build table from invoices_data (same new table format)
+    aging = compute_aging(invoices_data)
+    create_report_table_pdf(output_path, "Statement of Account", invoices_data, balance_bf=0.0, aging_summary=aging,
+                            profile=profile, grayscale=grayscale)
+    # Note: In a complete solution, you might want to merge multiple invoices into one table.
+    # Here we assume invoices_data is already the merged list.
+    
+# ----------------------------------------------------
+# Invoice Bundles (many invoices, one PDF)
+# ----------------------------------------------------
+class BundleDocTemplate(SimpleDocTemplate):
+    """
+    Document holding several invoices. Each invoice begins with an InvoiceStart marker, which
+    restarts the page count stamped in the footer area. ReportLab stores every image once per
+    document, so the header/footer/signature/seal images are shared by all invoices.
+    """
+    def __init__(self, *args, **kwargs):
+        SimpleDocTemplate.__init__(self, *args, **kwargs)
+        self.section_title = ""
+        self.section_start = 1
+
+    def afterPage(self):
+        page_width, _ = A4
+        self.canv.saveState()
+        self.canv.setFont("Helvetica", 8)
+        self.canv.drawRightString(page_width - 20, 85, f"{self.section_title} - Page {self.page - self.section_start + 1}")
+        self.canv.restoreState()
+
+class InvoiceStart(Flowable):
+    """Zero-size marker at the top of each bundled invoice: restarts numbering and adds a bookmark."""
+    def __init__(self, doc, title, outline=True):
+        Flowable.__init__(self)
+        self.doc = doc
+        self.title = title
+        self.outline = outline
+
+    def wrap(self, availWidth, availHeight):
+        return 0, 0
+
+    def draw(self):
+        self.doc.section_title = self.title
+        self.doc.section_start = self.doc.page
+        if self.outline:
+            key = f"invoice-{self.doc.page}"
+            self.canv.bookmarkPage(key)
+            self.canv.addOutlineEntry(self.title, key, level=0)
+
+def create_invoice_bundle_pdf(output_path, invoices, outline=True, profile=None, grayscale=False):
+    """
+    Renders many invoices into one PDF, each starting on a new page with its own page numbers.
+    invoices is a list of dicts with the create_invoice_pdf arguments: input_details, excel_df,
+    amount and optionally include_seal and sections. outline=True adds a bookmark per invoice.
+    """
+    doc = make_pdf_doc(output_path, profile, grayscale, doc_class=BundleDocTemplate)
+    elements = []
+    for i, inv in enumerate(invoices):
+        if i:
+            elements.append(PageBreak())
+        elements.append(InvoiceStart(doc, f"Invoice {inv['input_details'].get('invoice_no', '')}", outline))
+        elements.extend(build_invoice_elements(inv["input_details"], inv["excel_df"], inv["amount"],
+                                               inv.get("include_seal", True), inv.get("sections"),
+                                               assets=doc.assets))
+    if outline and invoices:
+        doc.build(elements, onFirstPage=_bundle_first_page, onLaterPages=add_page_header_footer)
+    else:
+        doc.build(elements, onFirstPage=add_page_header_footer, onLaterPages=add_page_header_footer)
+
+def _bundle_first_page(canvas, doc):
+    add_page_header_footer(canvas, doc)
+    canvas.showOutline()
+
+def render_invoice_bundle(output_path, rows, include_seal=True, outline=True, profile=None, grayscale=False):
+    """
+    Bundles stored invoices. rows are (vendor_name, vendor_address, invoice_no, invoice_date,
+    invoice_type, po_mr_no, excel_file); each workbook is ingested once.
+    """
+    invoices = []
+    for vendor_name, vendor_address, invoice_no, invoice_date, invoice_type, po_mr_no, excel_file in rows:
+        df, total, sections = process_excel_workbook(excel_file)
+        invoices.append({
+            "input_details": {"vendor_name": vendor_name, "vendor_address": vendor_address, "vendor_po": po_mr_no,
+                              "invoice_type": invoice_type, "invoice_no": invoice_no, "invoice_date": invoice_date},
+            "excel_df": df, "amount": total, "include_seal": include_seal, "sections": sections,
+        })
+    create_invoice_bundle_pdf(output_path, invoices, outline, profile, grayscale)
+
+# ----------------------------------------------------
+# Parallel Chunked Rendering (very large invoices)
+# ----------------------------------------------------
+# A single doc.build lays out every page on one core. For sheets with tens of thousands of
+# rows the line-item table is cut into runs of whole pages, each run is laid out in its own
+# process, and pypdf stitches the parts together. Every part starts on a new page with the
+# header and footer images; the first part carries the invoice head, the last the totals,
+# signatures and seal. The page breaks come from each row's measured height, so the parts
+# break where a single build would and the stitched file matches create_invoice_pdf page for page.
+# Below this many rows the planner does not consider a process pool worth its start-up
+PARALLEL_RENDER_MIN_ROWS = 20000
+PARALLEL_MIN_CHUNK_PAGES = 10
+# Rows are measured this many at a time
+ROW_HEIGHT_BATCH = 2000
+
+class _SpaceMeasuringDoc(SimpleDocTemplate):
+    """Throwaway layout that notes the frame space left under the last flowable of the invoice head."""
+    def __init__(self, *args, **kwargs):
+        SimpleDocTemplate.__init__(self, *args, **kwargs)
+        self.head_end = None
+        self.space_after_head = None
+
+    def afterFlowable(self, flowable):
+        if flowable is self.head_end:
+            self.space_after_head = self.frame._y - self.frame._y1p
+
+def invoice_page_space(input_details):
+    """
+    Lays out the invoice head once. Returns (height left for the item table under the head,
+    height of the item table on every later page).
+    """
+    head = invoice_head_elements(input_details)
+    doc = make_pdf_doc(io.BytesIO(), doc_class=_SpaceMeasuringDoc)
+    doc.head_end = head[-1]
+    doc.build(head, onFirstPage=add_page_header_footer, onLaterPages=add_page_header_footer)
+    frame = doc.pageTemplates[0].frames[0]
+    return doc.space_after_head, frame._height - frame._topPadding - frame._bottomPadding
+
+def _table_row_heights(excel_df, col_widths, header=False):
+    _, _, wrap_style = _invoice_styles()
+    table = excel_items_table(excel_df, col_widths, wrap_style, header=header)
+    table.wrap(sum(col_widths), A4[1])
+    return list(table._rowHeights)
+
+def invoice_row_heights(excel_df, col_widths):
+    """
+    The height each row of excel_df takes in the item table. Rows whose cells all fit on one line
+    share the height of a measured one-line row; the others (wrapping text, markup, blank rows)
+    are wrapped in a Table the way the layout will wrap them.
+    """
+    _, _, wrap_style = _invoice_styles()
+    one_line = _table_row_heights(pd.DataFrame([["x"] * len(col_widths)]), col_widths)[0]
+    # Table cells are padded 6 points left and right
+    room = [w - 12 - 0.01 for w in col_widths]
+    heights, measure = [], []
+    for i, row in enumerate(excel_df.itertuples(index=False, name=None)):
+        texts = ["" if pd.isnull(cell) else str(cell) for cell in row]
+        plain = any(texts) and all(
+            not text or (text.isprintable() and "<" not in text and "&" not in text
+                         and stringWidth(text, wrap_style.fontName, wrap_style.fontSize) <= width)
+            for text, width in zip(texts, room))
+        heights.append(one_line if plain else None)
+        if not plain:
+            measure.append(i)
+    for start in range(0, len(measure), ROW_HEIGHT_BATCH):
+        batch = measure[start:start + ROW_HEIGHT_BATCH]
+        for i, height in zip(batch, _table_row_heights(excel_df.iloc[batch], col_widths)):
+            heights[i] = height
+    return heights
+
+def invoice_page_breaks(heights, space, header_height):
+    """
+    The rows at which the item table moves to a new page, given each row's height, the
+    invoice_page_space and the height of the column-title row. ReportLab splits a table after
+    the last row that still fits, so the first page takes rows while their total fits.
+    """
+    left, page_height = space
+    breaks = []
+    used = header_height
+    for i, height in enumerate(heights):
+        if used + height > left:
+            breaks.append(i)
+            # The column titles only move along when not even the first row fitted
+            used, left = (header_height if i == 0 else 0), page_height
+        used += height
+    return breaks
+
+def _chunk_ranges(rows, breaks, pages_per_chunk):
+    # Every chunk but the last ends on a page break; the first also holds the invoice head
+    bounds = [0] + breaks[pages_per_chunk - 1::pages_per_chunk] + [rows]
+    return [(start, stop) for start, stop in zip(bounds, bounds[1:]) if stop > start]
+
+def plan_invoice_chunks(input_details, excel_df, workers, pages_per_chunk=None):
+    """
+    Splits the rows into page-aligned chunks of pages_per_chunk pages (the first also holds the
+    invoice head). By default there are about two chunks per worker, so a slow chunk does not
+    leave the other workers idle at the end. Returns (col_widths, [(start, stop), ...]).
+    """
+    col_widths = excel_column_widths(excel_df, A4[0] * 0.95)
+    header_height = _table_row_heights(excel_df.head(0), col_widths, header=True)[0]
+    breaks = invoice_page_breaks(invoice_row_heights(excel_df, col_widths), invoice_page_space(input_details),
+                                 header_height)
+    if pages_per_chunk is None:
+        pages_per_chunk = max(PARALLEL_MIN_CHUNK_PAGES, -(-(len(breaks) + 1) // (workers * 2)))
+    return col_widths, _chunk_ranges(len(excel_df), breaks, pages_per_chunk)
+
+def _render_invoice_chunk(input_details, chunk_df, col_widths, first, last, amount, include_seal, profile, grayscale):
+    # Runs in a worker process; the same flowables build_invoice_elements would produce for these rows
+    _, _, wrap_style = _invoice_styles()
+    buffer = io.BytesIO()
+    doc = make_pdf_doc(buffer, profile, grayscale)
+    elements = invoice_head_elements(input_details) if first else []
+    elements.append(excel_items_table(chunk_df, col_widths, wrap_style, header=first))
+    if last:
+        elements.append(Spacer(1, 15))
+        elements.extend(invoice_total_elements(amount))
+        elements.extend(invoice_signature_elements(include_seal, doc.assets))
+    doc.build(elements, onFirstPage=add_page_header_footer, onLaterPages=add_page_header_footer)
+    return buffer.getvalue()
+
+def stitch_pdf_parts(target, parts):
+    """Concatenates PDF byte strings into target (path or stream)."""
+    from pypdf import PdfReader, PdfWriter
+    writer = PdfWriter()
+    for part in parts:
+        writer.append(PdfReader(io.BytesIO(part)))
+    if hasattr(writer, "compress_identical_objects"):
+        # Each part embedded its own copy of the header/footer images
+        writer.compress_identical_objects()
+    writer.write(target)
+
+def create_invoice_pdf_chunked(output_path, input_details, excel_df, amount, include_seal=True, sections=None,
+                               profile=None, grayscale=False, workers=None, pages_per_chunk=None):
+    """
+    create_invoice_pdf for very large invoices, laid out in page-aligned chunks across a process
+    pool and stitched into output_path. workers=1 lays the chunks out in this process instead.
+    Multi-sheet invoices, tables too short to split and installs without pypdf get the regular
+    single-process build. Returns the number of chunks (0 when the regular build was used).
+    """
+    workers = workers or os.cpu_count() or 1
+    ranges = []
+    if (importlib.util.find_spec("pypdf") is not None and excel_df is not None and not excel_df.empty
+            and not (sections and len(sections) > 1)):
+        col_widths, ranges = plan_invoice_chunks(input_details, excel_df, workers, pages_per_chunk)
+    if len(ranges) < 2:
+        create_invoice_pdf(output_path, input_details, excel_df, amount, include_seal=include_seal, sections=sections,
+                           profile=profile, grayscale=grayscale)
+        return 0
+    if workers == 1:
+        # Chunks laid out one after another in this process: only one chunk's flowables are alive at a time
+        parts = [_render_invoice_chunk(input_details, excel_df.iloc[start:stop], col_widths, i == 0,
+                                       i == len(ranges) - 1, amount, include_seal, profile, grayscale)
+                 for i, (start, stop) in enumerate(ranges)]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as pool:
+            futures = [pool.submit(_render_invoice_chunk, input_details, excel_df.iloc[start:stop], col_widths,
+                                   i == 0, i == len(ranges) - 1, amount, include_seal, profile, grayscale)
+                       for i, (start, stop) in enumerate(ranges)]
+            parts = [f.result() for f in futures]
+    stitch_pdf_parts(output_path, parts)
+    return len(ranges)
+
+def create_invoice_pdf_streaming(output_path, input_details, spilled, include_seal=True, profile=None,
+                                 grayscale=False, pages_per_chunk=None):
+    """
+    create_invoice_pdf for a single-sheet workbook ingested with spilled_workbook. Passes over the
+    spill size the columns and measure the rows; then the line items are read back
+    pages_per_chunk pages (PLAN_STREAM_CHUNK_PAGES by default) at a time and each chunk is laid
+    out before the next is read, so neither the whole frame nor the whole layout is ever held.
+    Tables that fit in one chunk and installs without pypdf get the regular build. Returns the
+    number of chunks (0 when the regular build was used).
+    """
+    amount = spilled_total(spilled)
+    ranges = []
+    if spilled["rows"] and importlib.util.find_spec("pypdf") is not None:
+        lengths = None
+        for frame in iter_spilled_frames(spilled):
+            chunk_lengths = excel_column_lengths(frame)
+            lengths = chunk_lengths if lengths is None else [max(a, b) for a, b in zip(lengths, chunk_lengths)]
+        titles = spilled_frame(spilled, 0, 0)
+        col_widths = excel_column_widths(titles, A4[0] * 0.95, lengths)
+        heights = [h for frame in iter_spilled_frames(spilled) for h in invoice_row_heights(frame, col_widths)]
+        breaks = invoice_page_breaks(heights, invoice_page_space(input_details),
+                                     _table_row_heights(titles, col_widths, header=True)[0])
+        ranges = _chunk_ranges(spilled["rows"], breaks, pages_per_chunk or PLAN_STREAM_CHUNK_PAGES)
+    if len(ranges) < 2:
+        create_invoice_pdf(output_path, input_details, spilled_frame(spilled), amount, include_seal=include_seal,
+                           profile=profile, grayscale=grayscale)
+        return 0
+    parts = [_render_invoice_chunk(input_details, spilled_frame(spilled, start, stop), col_widths, i == 0,
+                                   i == len(ranges) - 1, amount, include_seal, profile, grayscale)
+             for i, (start, stop) in enumerate(ranges)]
+    stitch_pdf_parts(output_path, parts)
+    return len(ranges)
+
+# ----------------------------------------------------
+# Execution Planner (memory / streaming / parallel)
+# ----------------------------------------------------
+# Before a render the planner sizes the job cheaply: invoice rows from the sheets' <dimension>
+# records (or a byte-size guess), SOA rows from a COUNT(*). It predicts the time and memory of
+# each strategy and picks one within the budgets:
+#   memory     one doc.build over the whole table - simplest, but memory grows with the rows
+#   streaming  the lines are spilled to disk by ingest_excel_streaming and read back a chunk of
+#              pages at a time, so neither the frame nor the layout of the whole table is held
+#   parallel   chunks across a process pool (SOAs: workbook totals read across the pool)
+# Every plan is journaled in execution_plans with its actual time, so the per-row rates used for
+# predictions follow the last PLAN_HISTORY runs on this machine instead of the defaults below.
+PLAN_MEMORY_BUDGET_MB = 1024
+PLAN_LATENCY_BUDGET_SECONDS = 30
+PLAN_HISTORY = 20
+# Defaults until history exists: seconds per 1,000 rows (per worker for "parallel") and MB per
+# 1,000 rows held by a layout pass, by the ingested frame or by the laid-out parts until stitched
+PLAN_SECONDS_PER_1000_ROWS = {"memory": 1.2, "streaming": 1.1, "parallel": 1.1}
+PLAN_SOA_SECONDS_PER_1000_WORKBOOKS = 40.0
+PLAN_LAYOUT_MB_PER_1000_ROWS = 11.0
+PLAN_FRAME_MB_PER_1000_ROWS = 1.0
+PLAN_STITCH_MB_PER_1000_ROWS = 1.2
+PLAN_BASE_MB = 100
+PLAN_PARALLEL_OVERHEAD_SECONDS = 2.0
+PLAN_STREAM_CHUNK_PAGES = 40
+PLAN_ROWS_PER_PAGE = 35
+PLAN_MEMORY_SAMPLE_SECONDS = 0.02
+# Rough bytes per row of a workbook whose sheets carry no dimension record
+PLAN_BYTES_PER_ROW = {".csv": 40, ".txt": 40, ".xlsx": 25, ".xlsm": 25, ".xls": 60, ".ods": 30}
+
+def _rusage_peak_mb(children=False):
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def process_peak_mb():
+    """Lifetime peak resident memory of this process in MB, or None where the resource module is missing."""
+    return _rusage_peak_mb()
+
+def resident_mb():
+    """Current resident memory of this process in MB, or None where /proc is missing."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+@contextlib.contextmanager
+def measure_memory(interval=PLAN_MEMORY_SAMPLE_SECONDS):
+    """
+    Measures the memory used while a block runs. Yields a dict that gets, on exit, "peak_mb":
+    the highest resident size of this process sampled every `interval` seconds during the block
+    (without /proc: the lifetime peak if the block raised it, else None), and "children_mb": the
+    peak of the largest child process reaped during the block, i.e. a pool worker (None when no
+    child outgrew the ones reaped before).
+    """
+    usage = {}
+    children_before = _rusage_peak_mb(children=True)
+    peak = [resident_mb()]
+    lifetime_before = _rusage_peak_mb() if peak[0] is None else None
+    stop = threading.Event()
+
+    def sample():
+        while not stop.wait(interval):
+            peak[0] = max(peak[0], resident_mb())
+
+    sampler = threading.Thread(target=sample, name="memory-probe", daemon=True) if peak[0] is not None else None
+    if sampler is not None:
+        sampler.start()
+    try:
+        yield usage
+    finally:
+        if sampler is not None:
+            stop.set()
+            sampler.join()
+            usage["peak_mb"] = round(max(peak[0], resident_mb()), 1)
+        else:
+            lifetime = _rusage_peak_mb()
+            usage["peak_mb"] = round(lifetime, 1) if lifetime is not None and lifetime > lifetime_before else None
+        children = _rusage_peak_mb(children=True)
+        usage["children_mb"] = round(children, 1) if children is not None and children > children_before else None
+
+def estimate_workbook_rows(excel_path):
+    """
+    (rows, sheets, source) without reading the cells. .xlsx files give the <dimension ref> at
+    the top of each sheet's XML; CSV files a newline count over the first 64 KB; anything else
+    (or a sheet without a dimension record) a guess from the file size.
+    """
+    size = os.path.getsize(excel_path)
+    ext = os.path.splitext(excel_path)[1].lower()
+    if ext in (".xlsx", ".xlsm"):
+        try:
+            rows, sheets = 0, 0
+            with zipfile.ZipFile(excel_path) as archive:
+                for name in archive.namelist():
+                    if not re.match(r"xl/worksheets/[^/]+\.xml$", name):
+                        continue
+                    with archive.open(name) as sheet:
+                        match = re.search(rb'<dimension ref="(?:[A-Z]+\d+:)?[A-Z]+(\d+)"', sheet.read(4096))
+                    if match is None:
+                        raise ValueError(name)
+                    # Blank sheets still report A1
+                    sheets += int(match.group(1)) > 1
+                    rows += int(match.group(1))
+            return rows, sheets, "sheet dimensions"
+        except (zipfile.BadZipFile, ValueError, KeyError):
+            pass
+    elif ext in (".csv", ".txt"):
+        with open(excel_path, "rb") as f:
+            sample = f.read(64 * 1024)
+        lines = sample.count(b"\n")
+        if len(sample) == size:
+            return lines + (not sample.endswith(b"\n") and bool(sample)), 1, "line count"
+        if lines:
+            return int(size / (len(sample) / lines)), 1, "line sample"
+    return size // PLAN_BYTES_PER_ROW.get(ext, 30), 1, "file size"
+
+def planner_rates(db):
+    """
+    Seconds per 1,000 rows for each invoice strategy and per 1,000 workbooks for SOAs: the
+    median of the recent journal where there is one (parallel runs scaled up to one worker).
+    """
+    rates = dict(PLAN_SECONDS_PER_1000_ROWS, soa=PLAN_SOA_SECONDS_PER_1000_WORKBOOKS)
+    if db is None:
+        return rates
+    # Small runs are mostly fixed overhead, so they say little about the per-row rate
+    for key, kind, strategy, min_rows in [(k, "invoice", k, 1000) for k in PLAN_SECONDS_PER_1000_ROWS] + [("soa", "soa", None, 20)]:
+        observed = [seconds * 1000 * (workers if used == "parallel" else 1) / rows
+                    for used, seconds, rows, workers in db.execute(
+                        "SELECT strategy, actual_seconds, actual_rows, workers FROM execution_plans WHERE kind=? AND "
+                        "(strategy=? OR ? IS NULL) AND actual_seconds IS NOT NULL AND actual_rows >= ? "
+                        "ORDER BY id DESC LIMIT ?", (kind, strategy, strategy, min_rows, PLAN_HISTORY))]
+        if observed:
+            rates[key] = sorted(observed)[len(observed) // 2]
+    return rates
+
+def _choose_plan(plan, candidates, memory_mb, seconds):
+    """Keeps the memory strategy while it fits both budgets, else the fastest that fits in memory."""
+    fitting = {k: v for k, v in candidates.items() if v[1] <= memory_mb}
+    if "memory" in fitting and fitting["memory"][0] <= seconds:
+        strategy, reason = "memory", "fits both budgets"
+    elif fitting:
+        strategy = min(fitting, key=lambda k: fitting[k][0])
+        if "memory" in fitting:
+            reason = f"in-memory path predicted at {candidates['memory'][0]:,.1f} s, over the {seconds:g} s budget"
+        else:
+            reason = f"in-memory path predicted at {candidates['memory'][1]:,.0f} MB, over the {memory_mb:g} MB budget"
+    else:
+        strategy = min(candidates, key=lambda k: candidates[k][1])
+        reason = f"nothing fits the {memory_mb:g} MB budget; least memory"
+    plan.update(strategy=strategy, predicted_seconds=round(candidates[strategy][0], 1),
+                predicted_mb=round(candidates[strategy][1]), reason=reason,
+                candidates={k: (round(t, 1), round(mb)) for k, (t, mb) in candidates.items()})
+    if strategy != "parallel":
+        plan["workers"] = 1
+    return plan
+
+def plan_invoice_render(excel_path, rows=None, sheets=1, db=None, workers=None, memory_mb=None, seconds=None,
+                        allow_parallel=True):
+    """
+    Picks how to render an invoice. rows/sheets are used when already known (e.g. after the
+    preview ingested the workbook), otherwise estimated from the file. db supplies calibrated
+    rates. allow_parallel=False keeps to this process (callers already inside a pool). Returns
+    a plan dict: kind, subject, strategy, workers, rows, estimate_source, predicted_seconds,
+    predicted_mb, reason and the candidates' (seconds, MB).
+    """
+    memory_mb = PLAN_MEMORY_BUDGET_MB if memory_mb is None else memory_mb
+    seconds = PLAN_LATENCY_BUDGET_SECONDS if seconds is None else seconds
+    workers = workers or os.cpu_count() or 1
+    source = "ingested"
+    if rows is None:
+        rows, sheets, source = estimate_workbook_rows(excel_path)
+    rates = planner_rates(db)
+    frame_mb = PLAN_BASE_MB + rows * PLAN_FRAME_MB_PER_1000_ROWS / 1000
+    candidates = {"memory": (rows * rates["memory"] / 1000, frame_mb + rows * PLAN_LAYOUT_MB_PER_1000_ROWS / 1000)}
+    plan = {"kind": "invoice", "subject": excel_path, "workers": workers, "rows": rows, "estimate_source": source}
+    # Chunking needs pypdf to stitch and a single item table to split
+    if importlib.util.find_spec("pypdf") is not None and sheets <= 1:
+        stitch_mb = rows * PLAN_STITCH_MB_PER_1000_ROWS / 1000
+        # No frame: one chunk's rows and layout, plus the parts waiting to be stitched
+        chunk_rows = min(rows, PLAN_STREAM_CHUNK_PAGES * PLAN_ROWS_PER_PAGE)
+        candidates["streaming"] = (rows * rates["streaming"] / 1000, PLAN_BASE_MB + stitch_mb + chunk_rows
+                                   * (PLAN_FRAME_MB_PER_1000_ROWS + PLAN_LAYOUT_MB_PER_1000_ROWS) / 1000)
+        if allow_parallel and workers > 1 and rows >= PARALLEL_RENDER_MIN_ROWS:
+            # plan_invoice_chunks cuts about two chunks per worker, each laid out in its own process
+            chunk_rows = max(PARALLEL_MIN_CHUNK_PAGES * PLAN_ROWS_PER_PAGE, rows // (workers * 2))
+            candidates["parallel"] = (rows * rates["parallel"] / 1000 / workers + PLAN_PARALLEL_OVERHEAD_SECONDS,
+                                      frame_mb + stitch_mb
+                                      + workers * (PLAN_BASE_MB + chunk_rows * PLAN_LAYOUT_MB_PER_1000_ROWS / 1000))
+    return _choose_plan(plan, candidates, memory_mb, seconds)
+
+def plan_soa_render(db, sql, params, date_range=(None, None), workers=None, memory_mb=None, seconds=None):
+    """
+    Picks how to collect an SOA's workbook totals: one after another ("memory") or across a
+    process pool ("parallel"). The row count comes from a COUNT(*) over the SOA query.
+    """
+    memory_mb = PLAN_MEMORY_BUDGET_MB if memory_mb is None else memory_mb
+    seconds = PLAN_LATENCY_BUDGET_SECONDS if seconds is None else seconds
+    workers = workers or os.cpu_count() or 1
+    with invoice_source(db, *date_range) as source:
+        rows = db.execute(f"SELECT COUNT(*) FROM ({sql.format(source=source)})", params).fetchone()[0]
+    rate = planner_rates(db)["soa"]
+    candidates = {"memory": (rows * rate / 1000, PLAN_BASE_MB)}
+    if workers > 1 and rows > 1:
+        candidates["parallel"] = (rows * rate / 1000 / workers + PLAN_PARALLEL_OVERHEAD_SECONDS,
+                                  PLAN_BASE_MB * (workers + 1))
+    plan = {"kind": "soa", "subject": str(params[0]), "workers": workers, "rows": rows, "estimate_source": "count"}
+    return _choose_plan(plan, candidates, memory_mb, seconds)
+
+def execute_plan(plan, run):
+    """
+    Calls run() and fills in the plan's actual wall time, this process's peak memory during the
+    run and the peak of its largest pool process (see measure_memory). Further calls for the same
+    plan (ingestion and render run apart) add their time and keep the highest peaks.
+    """
+    started = perf_counter()
+    with measure_memory() as usage:
+        result = run()
+    plan["actual_seconds"] = round(plan.get("actual_seconds", 0) + perf_counter() - started, 3)
+    for key, value in usage.items():
+        if value is not None:
+            plan[key] = max(value, plan.get(key) or 0)
+    return result
+
+def log_execution_plan(db, plan):
+    """Journals a plan with its actual cost (see execute_plan). Runs in the caller's transaction."""
+    db.execute("""
+        INSERT INTO execution_plans (kind, subject, strategy, workers, rows, estimate_source, predicted_seconds,
+                                     predicted_mb, actual_rows, actual_seconds, peak_mb, children_mb, reason,
+                                     created_at)
+        VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+    """, (plan["kind"], plan["subject"], plan["strategy"], plan["workers"], plan["rows"], plan["estimate_source"],
+          plan["predicted_seconds"], plan["predicted_mb"], plan.get("actual_rows", plan["rows"]),
+          plan.get("actual_seconds"), plan.get("peak_mb"), plan.get("children_mb"), plan["reason"],
+          datetime.now().isoformat(timespec="seconds")))
+
+def format_plan(plan):
+    text = (f"{plan['strategy']}" + (f" x{plan['workers']}" if plan["strategy"] == "parallel" else "")
+            + f": ~{plan['rows']:,} rows ({plan['estimate_source']}), predicted {plan['predicted_seconds']:.1f} s"
+            f" / {plan['predicted_mb']:,} MB")
+    if plan.get("actual_seconds") is not None:
+        text += f", took {plan['actual_seconds']:.1f} s"
+        if plan.get("peak_mb"):
+            text += f" (peak {plan['peak_mb']:,.0f} MB"
+            text += f", largest worker {plan['children_mb']:,.0f} MB)" if plan.get("children_mb") else ")"
+    return text
+
+# ----------------------------------------------------
+# First-Page Preview
+# ----------------------------------------------------
+PREVIEW_ROWS = 15
+PREVIEW_SCALE = 1.0  # 72 dpi – enough to proof-read the layout
+
+def read_invoice_preview(excel_path, rows=PREVIEW_ROWS, engine=None):
+    """
+    Reads what the preview shows without loading the workbook: the first `rows` line items as a
+    frame (taken from iter_excel_sheet_rows, which stops there), and the total, sections and line
+    count from a streaming pass that spills nothing (see ingest_excel_streaming).
+    Returns (df, total, sections, line_count).
+    """
+    streamed = ingest_excel_streaming(excel_path, engine, spill_path=None)
+    grids = []  # [sheet, rows read, data rows after its header (None until the header)]
+    shown = 0
+    with contextlib.closing(iter_excel_sheet_rows(excel_path, engine)) as sheet_rows:
+        for sheet, row in sheet_rows:
+            if not grids or grids[-1][0] != sheet:
+                if grids and grids[-1][2]:
+                    shown += grids[-1][2] - 1  # less the sheet's total row
+                grids.append([sheet, [], None])
+            entry = grids[-1]
+            entry[1].append(row)
+            if entry[2] is None:
+                if find_header_row([row]) is not None:
+                    entry[2] = 0
+            elif any(c is not None for c in row):
+                entry[2] += 1
+                # One row past the preview, since _process_sheet drops the last row as the total
+                if shown + entry[2] > rows:
+                    break
+    frames = []
+    for sheet, grid, _ in grids:
+        result = _process_sheet(sheet, _trim_rows(grid))
+        if result is None:
+            continue
+        df = result[0]
+        # A float further down makes the whole column float in the full frame
+        for i, dtype in enumerate(streamed["dtypes"].get(sheet, [])[:df.shape[1]]):
+            if dtype == "float64" and df.dtypes.iloc[i] != "float64":
+                df.isetitem(i, df.iloc[:, i].astype("float64"))
+        frames.append((sheet, df))
+    if len(streamed["sections"]) > 1:
+        df = pd.concat([sheet_df.assign(Sheet=str(name)) for name, sheet_df in frames], ignore_index=True)
+        df = df[["Sheet"] + [c for c in df.columns if c != "Sheet"]]
+    else:
+        df = frames[0][1]
+    return df.head(rows), streamed["total"], streamed["sections"], streamed["rows"]
+
+def render_invoice_preview(input_details, excel_df, amount, include_seal=True, sections=None, rows=PREVIEW_ROWS,
+                           line_count=None):
+    """
+    Lays out the invoice with only its first `rows` line items and returns the PDF bytes.
+    excel_df may hold just those rows when line_count gives the workbook's full count.
+    """
+    buffer = io.BytesIO()
+    doc = make_pdf_doc(buffer)
+    doc.build(build_invoice_elements(input_details, excel_df, amount, include_seal, sections, max_rows=rows,
+                                     assets=doc.assets, line_count=line_count),
+              onFirstPage=add_page_header_footer, onLaterPages=add_page_header_footer)
+    return buffer.getvalue()
+
+def rasterize_first_page(pdf_bytes, scale=PREVIEW_SCALE):
+    """Returns the first page as a PIL image, or None when pypdfium2 is not installed."""
+    try:
+        import pypdfium2 as pdfium
+    except ImportError:
+        return None
+    pdf = pdfium.PdfDocument(pdf_bytes)
+    try:
+        return pdf[0].render(scale=scale).to_pil()
+    finally:
+        pdf.close()
+
+# ----------------------------------------------------
+# Rendered-PDF Cache
+# ----------------------------------------------------
+# Reprints of an unchanged invoice/SOA are served from here instead of re-running ingestion
+# and layout. Entries are keyed by a fingerprint of everything that affects the output.
+RENDER_CACHE_DIR = "render_cache"
+RENDER_CACHE_MAX_BYTES = 500 * 1024 * 1024
+RENDER_CACHE_MAX_AGE_DAYS = 90
+RENDER_CACHE_HARDLINK = False
+# Bump whenever the PDF layout code changes so older cache entries stop matching.
+TEMPLATE_VERSION = "1"
+PDF_ASSETS = ("header.png", "footer.png", "signeture.jpg", "ss.jpg", "seal.png")
+
+_file_digests = {}
+
+def file_digest(path):
+    """SHA-256 of a file's content, memoised on its (size, mtime) so unchanged files are hashed once."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return "missing"
+    signature = (st.st_size, st.st_mtime_ns)
+    cached = _file_digests.get(path)
+    if cached and cached[0] == signature:
+        return cached[1]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    _file_digests[path] = (signature, h.hexdigest())
+    return h.hexdigest()
+
+def render_fingerprint(kind, inputs, source_paths=(), include_seal=True, profile=None, grayscale=False):
+    """
+    Fingerprint of a document: its kind, the vendor/metadata inputs, the content of the source
+    workbooks and image assets, the template version, the seal flag and the output profile.
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps({"kind": kind, "template": TEMPLATE_VERSION, "seal": bool(include_seal),
+                         "profile": output_profile_key(profile, grayscale), "inputs": inputs},
+                        sort_keys=True, default=str).encode())
+    for asset in PDF_ASSETS:
+        h.update(f"{asset}:{file_digest(asset)}".encode())
+    for path in source_paths:
+        h.update(f"{path}:{file_digest(path)}".encode())
+    return h.hexdigest()
+
+def _render_cache_paths(fingerprint):
+    return (os.path.join(RENDER_CACHE_DIR, fingerprint + ".pdf"),
+            os.path.join(RENDER_CACHE_DIR, fingerprint + ".json"))
+
+def fetch_cached_render(fingerprint, output_path):
+    """
+    Places the cached PDF at output_path and returns its stored metadata, or None on a miss.
+    A PDF without its metadata is an entry still being stored (or half evicted) and misses.
+    """
+    pdf_path, meta_path = _render_cache_paths(fingerprint)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not os.path.exists(pdf_path):
+        return None
+    if os.path.exists(output_path):
+        os.remove(output_path)
+    try:
+        try:
+            if not RENDER_CACHE_HARDLINK:
+                raise OSError
+            os.link(pdf_path, output_path)
+        except OSError:
+            shutil.copyfile(pdf_path, output_path)
+        os.utime(pdf_path)
+    except FileNotFoundError:
+        # Evicted between the check and the copy
+        return None
+    return meta
+
+def store_cached_render(fingerprint, output_path, meta=None):
+    """
+    Adds an entry. Both files are written under temporary names and renamed into place, the
+    metadata first and the PDF last, so concurrent readers never see a partial PDF: until the
+    PDF lands, the entry is still a miss.
+    """
+    os.makedirs(RENDER_CACHE_DIR, exist_ok=True)
+    pdf_path, meta_path = _render_cache_paths(fingerprint)
+    fd, tmp_meta = tempfile.mkstemp(prefix=fingerprint, suffix=".json.tmp", dir=RENDER_CACHE_DIR)
+    fd_pdf, tmp_pdf = tempfile.mkstemp(prefix=fingerprint, suffix=".pdf.tmp", dir=RENDER_CACHE_DIR)
+    os.close(fd_pdf)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(meta or {}, f, default=str)
+        shutil.copyfile(output_path, tmp_pdf)
+        os.replace(tmp_meta, meta_path)
+        os.replace(tmp_pdf, pdf_path)
+    finally:
+        for path in (tmp_meta, tmp_pdf):
+            with contextlib.suppress(OSError):
+                os.remove(path)
+    evict_render_cache()
+
+def evict_render_cache(max_bytes=None, max_age_days=None):
+    """Drops entries older than max_age_days, then the least recently used until under max_bytes."""
+    max_bytes = RENDER_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    max_age_days = RENDER_CACHE_MAX_AGE_DAYS if max_age_days is None else max_age_days
+    if not os.path.isdir(RENDER_CACHE_DIR):
+        return
+    entries = []
+    now = datetime.now().timestamp()
+    for name in os.listdir(RENDER_CACHE_DIR):
+        path = os.path.join(RENDER_CACHE_DIR, name)
+        try:
+            st = os.stat(path)
+            if name.endswith(".pdf"):
+                entries.append((st.st_mtime, st.st_size, name[:-4]))
+            elif name.endswith(".tmp") and st.st_mtime < now - 3600:
+                # Left behind by a writer that died mid-store
+                os.remove(path)
+        except FileNotFoundError:
+            continue  # removed by another writer meanwhile
+    entries.sort()
+    cutoff = now - max_age_days * 86400
+    total = sum(size for _, size, _ in entries)
+    for mtime, size, fingerprint in entries:
+        if mtime >= cutoff and total <= max_bytes:
+            break
+        # PDF first: an entry whose PDF is gone is a miss even while its metadata remains
+        for path in _render_cache_paths(fingerprint):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+        total -= size
+
+def cached_render(fingerprint, output_path, render, force=False):
+    """
+    Serves output_path from the render cache, or calls render() (which writes output_path and
+    returns a metadata dict) and caches the result. force=True always re-renders.
+    Returns (meta, hit).
+    """
+    if not force:
+        meta = fetch_cached_render(fingerprint, output_path)
+        if meta is not None:
+            return meta, True
+    meta = render() or {}
+    store_cached_render(fingerprint, output_path, meta)
+    return meta, False
+
+def ingest_invoice_workbook(excel_path, strategy=None, stack=None):
+    """
+    Reads the workbook the way `strategy` renders it. "streaming" spills the lines to a temporary
+    file (see spilled_workbook) removed when `stack`, a contextlib.ExitStack, closes; other
+    strategies, and workbooks with several item sheets, get process_excel_workbook's
+    (df, total, sections). Either result can be passed to render_invoice_document as `ingested`.
+    """
+    if strategy == "streaming":
+        with contextlib.ExitStack() as spill:
+            spilled = spill.enter_context(spilled_workbook(excel_path))
+            if len(spilled["sections"]) == 1:
+                stack.enter_context(spill.pop_all())
+                return spilled
+    return process_excel_workbook(excel_path)
+
+def ingested_rows(ingested):
+    return ingested["rows"] if isinstance(ingested, dict) else len(ingested[0])
+
+def ingested_line_keys(ingested):
+    """invoice_line_keys for an ingest_invoice_workbook result; a spill is read a chunk at a time."""
+    if isinstance(ingested, dict):
+        return [key for frame in iter_spilled_frames(ingested) for key in invoice_line_keys(frame)]
+    return invoice_line_keys(ingested[0])
+
+def render_invoice_document(output_path, input_details, excel_path, include_seal=True, force=False, ingested=None,
+                            profile=None, grayscale=False, strategy=None, workers=None):
+    """
+    Ingests the workbook and renders the invoice PDF, unless an identical invoice is already
+    in the render cache. `ingested` is an ingest_invoice_workbook result to reuse instead of
+    reading the workbook again. strategy is "memory" (the default, one build), "streaming"
+    (line items read back from a spill file and laid out a chunk of pages at a time; a frame
+    already in memory is laid out in chunks one at a time) or "parallel" (chunks across
+    `workers` processes); see plan_invoice_render. Returns (meta, hit); meta holds the invoice
+    "total" and the size/time of the render (see render_stats).
+    """
+    # Every strategy produces the same pages, so they share cache entries
+    fingerprint = render_fingerprint("invoice", input_details, [excel_path], include_seal, profile, grayscale)
+
+    def render():
+        started = perf_counter()
+        with contextlib.ExitStack() as stack:
+            source = ingested or ingest_invoice_workbook(excel_path, strategy, stack)
+            if isinstance(source, dict):
+                total = source["total"]
+                create_invoice_pdf_streaming(output_path, input_details, source, include_seal=include_seal,
+                                             profile=profile, grayscale=grayscale)
+            else:
+                df, total, sections = source
+                if strategy == "streaming":
+                    create_invoice_pdf_chunked(output_path, input_details, df, total, include_seal=include_seal,
+                                               sections=sections, profile=profile, grayscale=grayscale, workers=1,
+                                               pages_per_chunk=PLAN_STREAM_CHUNK_PAGES)
+                elif strategy == "parallel":
+                    create_invoice_pdf_chunked(output_path, input_details, df, total, include_seal=include_seal,
+                                               sections=sections, profile=profile, grayscale=grayscale, workers=workers)
+                else:
+                    create_invoice_pdf(output_path, input_details, df, total, include_seal=include_seal,
+                                       sections=sections, profile=profile, grayscale=grayscale)
+        return dict(render_stats(output_path, started), total=float(total))
+
+    return cached_render(fingerprint, output_path, render, force)
+
+def _workbook_total(excel_path):
+    # May run in a worker process; None marks an unreadable workbook
+    try:
+        return excel_total(excel_path)
+    except Exception:
+        return None
+
+def soa_transactions(invoices, workers=1):
+    """
+    Transactions for invoice rows (invoice_no, invoice_date, invoice_type, excel_file), reading
+    each workbook's total; workers > 1 reads them across a process pool. Unreadable workbooks
+    are left out.
+    """
+    paths = [inv[3] for inv in invoices]
+    if workers > 1 and len(paths) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as pool:
+            totals = list(pool.map(_workbook_total, paths, chunksize=max(1, len(paths) // (workers * 4))))
+    else:
+        totals = map(_workbook_total, paths)
+    return [Transaction.from_invoice(inv_date, inv_no, "", inv_type, total)
+            for (inv_no, inv_date, inv_type, _), total in zip(invoices, totals) if total is not None]
+
+def render_soa_document(output_path, soa_info, invoices, include_seal=True, force=False, profile=None, grayscale=False,
+                        transactions=None, digests=None):
+    """
+    Renders an SOA from invoice rows (invoice_no, invoice_date, invoice_type, excel_file),
+    ingesting each workbook only on a cache miss. Unreadable workbooks are left out.
+    `transactions` is an already assembled soa_transactions(invoices) to reuse, and digests the
+    workbook_digests it was read from; it is used only while the workbooks still match them.
+    """
+    invoices = [tuple(inv) for inv in invoices]
+    if transactions is not None and digests != workbook_digests(inv[3] for inv in invoices):
+        transactions = None
+    # Aging buckets move with the calendar, so the statement is only reusable on the same day
+    fingerprint = render_fingerprint("soa", {"soa_info": soa_info, "invoices": invoices, "as_of": date.today()},
+                                     [inv[3] for inv in invoices], include_seal, profile, grayscale)
+
+    def render():
+        started = perf_counter()
+        soa_rows = soa_transactions(invoices) if transactions is None else transactions
+        create_soa_pdf_modified(output_path, soa_info, soa_rows, profile, grayscale)
+        return dict(render_stats(output_path, started), rows=len(soa_rows))
+
+    return cached_render(fingerprint, output_path, render, force)
+
+# ----------------------------------------------------
+# Query-Result Cache (SOA / report transactions)
+# ----------------------------------------------------
+# Assembled transaction sets are kept in memory keyed by (vendor, filter type, parameters), so
+# re-running the same SOA while adjusting the seal or output options skips the query and the
+# workbook reads. Each entry remembers the vendor's write generation (vendor_generations, bumped
+# by triggers on invoice/vendor writes from any process) and is dropped once it moves on, or
+# once one of the workbooks it was read from changed (see workbook_digests).
+# Entries spanning all vendors (vendor None) compare against the sum of every generation.
+QUERY_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+def workbook_digests(paths):
+    """file_digest of each workbook, in order: the content a cached transaction set was read from."""
+    return tuple(file_digest(path) for path in paths)
+
+def write_generation(db, vendor_id=None):
+    """
+    Current write generation of one vendor, or of all vendors when vendor_id is None, as an
+    (epoch, counter) pair: a restore puts old counters back but always moves the epoch on.
+    """
+    if vendor_id is None:
+        counter = "SELECT COALESCE(SUM(generation), 0) FROM vendor_generations"
+        params = ()
+    else:
+        counter = "SELECT generation FROM vendor_generations WHERE vendor_id=?"
+        params = (vendor_id,)
+    epoch, generation = db.execute(f"SELECT (SELECT COALESCE(MAX(epoch), 0) FROM db_epoch), ({counter})", params).fetchone()
+    return epoch, generation or 0
+
+def bump_db_epoch(db, floor=0):
+    """Moves the database epoch past both its own value and floor; returns the new epoch."""
+    with db:
+        db.execute("CREATE TABLE IF NOT EXISTS db_epoch (epoch INTEGER NOT NULL)")
+        epoch = max(db.execute("SELECT COALESCE(MAX(epoch), 0) FROM db_epoch").fetchone()[0], floor) + 1
+        db.execute("DELETE FROM db_epoch")
+        db.execute("INSERT INTO db_epoch (epoch) VALUES (?)", (epoch,))
+    return epoch
+
+def _approx_size(value):
+    """Rough in-memory size of a cached value: containers, Transactions and their fields."""
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_approx_size(v) for v in value)
+    if isinstance(value, Transaction):
+        return sys.getsizeof(value) + sum(sys.getsizeof(getattr(value, f)) for f in Transaction.__slots__)
+    return sys.getsizeof(value)
+
+class QueryResultCache:
+    """
+    In-process LRU of query results bounded by their approximate size. get() returns the cached
+    value while the vendor's write generation is unchanged and otherwise calls build() again.
+    Values read from files as well pass check(value), which returns False once those files
+    changed; the entry is then rebuilt like a stale one.
+    """
+    def __init__(self, max_bytes=None):
+        self.max_bytes = QUERY_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self._entries = collections.OrderedDict()  # key -> (generation, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.stale = self.evictions = 0
+
+    def get(self, db, vendor_id, key, build, check=None):
+        key = (vendor_id, key)
+        # Read the generation before building, so a write racing the build leaves the entry stale
+        generation = write_generation(db, vendor_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == generation and (check is None or check(entry[2])):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+            if entry is not None:
+                self.stale += 1
+                self._drop(key)
+        value = build()
+        size = _approx_size(value)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            if size <= self.max_bytes:
+                self._entries[key] = (generation, size, value)
+                self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+        return value
+
+    def _drop(self, key):
+        self._bytes -= self._entries.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "stale": self.stale, "evictions": self.evictions,
+                    "entries": len(self._entries), "bytes": self._bytes,
+                    "hit_rate": self.hits / lookups if lookups else 0.0}
+
+def format_query_cache_stats(stats):
+    return (f"Query cache: {stats['entries']} set(s), {stats['bytes'] / 1024:,.0f} KB, "
+            f"hit rate {stats['hit_rate']:.0%} ({stats['hits']} hit(s), {stats['misses']} miss(es), "
+            f"{stats['stale']} invalidated, {stats['evictions']} evicted)")
+
+# ----------------------------------------------------
+# Batch SOA Run (all vendors, resumable)
+# ----------------------------------------------------
+def plan_soa_batch(db, from_date, to_date, vendor_ids=None):
+    """
+    Plans one SOA per vendor for the period with a single grouped query. Returns a list of
+    {"vendor_id", "vendor_name", "vendor_address", "invoices"} dicts, invoices being
+    (invoice_no, invoice_date, invoice_type, excel_file) rows in date order.
+    """
+    query = """
+        SELECT v.vendor_id, v.vendor_name, v.vendor_address,
+               i.invoice_no, i.invoice_date, i.invoice_type, i.excel_file
+        FROM vendors v JOIN {source} i ON i.vendor_id = v.vendor_id
+        WHERE i.invoice_date BETWEEN ? AND ?
+    """
+    params = [from_date, to_date]
+    if vendor_ids:
+        query += f" AND v.vendor_id IN ({','.join('?' * len(vendor_ids))})"
+        params.extend(vendor_ids)
+    query += " ORDER BY v.vendor_id, i.invoice_date"
+    plan = []
+    with invoice_source(db, from_date, to_date) as source:
+        for (vid, vname, vaddr), rows in itertools.groupby(db.execute(query.format(source=source), params),
+                                                           key=lambda r: r[:3]):
+            plan.append({"vendor_id": vid, "vendor_name": vname, "vendor_address": vaddr,
+                         "invoices": [r[3:] for r in rows]})
+    return plan
+
+def _render_soa_job(job):
+    # Runs in a worker process; returns (vendor_id, error or None, seconds)
+    start = perf_counter()
+    try:
+        render_soa_document(job["output_path"], job["soa_info"], job["invoices"],
+                            include_seal=job["include_seal"], force=job["force"],
+                            profile=job["profile"], grayscale=job["grayscale"])
+        return job["vendor_id"], None, perf_counter() - start
+    except Exception as e:
+        return job["vendor_id"], str(e), perf_counter() - start
+
+def _safe_filename(text):
+    return "".join(c if c.isalnum() or c in "-_" else "_" for c in str(text))
+
+def run_soa_batch(from_date, to_date, output_dir, vendor_ids=None, workers=None,
+                  include_seal=True, force=False, progress=None, profile=None, grayscale=False):
+    """
+    Renders the SOA of every vendor (or of vendor_ids) for the period into output_dir using a
+    process pool. Each vendor's status is journaled in soa_jobs under a run id derived from the
+    period, the filter, the output folder and the output options, so re-running the same batch
+    after an interruption only renders the vendors that are not done yet, while a run into
+    another folder or with another seal/profile setting starts afresh. progress(done, total)
+    is called after each vendor. Returns a summary dict.
+    """
+    start = perf_counter()
+    options = json.dumps([os.path.abspath(output_dir), bool(include_seal), output_profile_key(profile, grayscale)])
+    run_id = (f"soa:{from_date}:{to_date}:{','.join(sorted(vendor_ids)) if vendor_ids else '*'}:"
+              + hashlib.sha256(options.encode()).hexdigest()[:12])
+    db = sqlite3.connect(DB_FILE)
+    try:
+        plan = plan_soa_batch(db, from_date, to_date, vendor_ids)
+        os.makedirs(output_dir, exist_ok=True)
+        done = {row[0] for row in db.execute(
+            "SELECT vendor_id, output_path FROM soa_jobs WHERE run_id=? AND status='done'", (run_id,))
+            if not force and os.path.exists(row[1])}
+        jobs = []
+        for item in plan:
+            output_path = os.path.join(output_dir, f"SOA_{_safe_filename(item['vendor_id'])}_{from_date}_{to_date}.pdf")
+            db.execute("INSERT OR IGNORE INTO soa_jobs (run_id, vendor_id, status, output_path) VALUES (?,?,?,?)",
+                       (run_id, item["vendor_id"], "pending", output_path))
+            if item["vendor_id"] in done:
+                continue
+            jobs.append({
+                "vendor_id": item["vendor_id"], "output_path": output_path, "invoices": item["invoices"],
+                "include_seal": include_seal, "force": force, "profile": profile, "grayscale": grayscale,
+                "soa_info": {"statement_date": from_date, "due_date": to_date,
+                             "company_name": item["vendor_name"], "company_address": item["vendor_address"]},
+            })
+        db.commit()
+
+        summary = {"run_id": run_id, "planned": len(plan), "skipped": len(plan) - len(jobs),
+                   "rendered": 0, "failures": [], "timings": {}}
+        finished = summary["skipped"]
+        if progress:
+            progress(finished, len(plan))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_render_soa_job, job) for job in jobs]
+            for job in jobs:
+                db.execute("UPDATE soa_jobs SET status='running', started_at=? WHERE run_id=? AND vendor_id=?",
+                           (datetime.now().isoformat(timespec="seconds"), run_id, job["vendor_id"]))
+            db.commit()
+            for future in as_completed(futures):
+                vendor_id, error, seconds = future.result()
+                db.execute("UPDATE soa_jobs SET status=?, error=?, elapsed=?, finished_at=? WHERE run_id=? AND vendor_id=?",
+                           ("failed" if error else "done", error, seconds,
+                            datetime.now().isoformat(timespec="seconds"), run_id, vendor_id))
+                db.commit()
+                summary["timings"][vendor_id] = seconds
+                if error:
+                    summary["failures"].append((vendor_id, error))
+                else:
+                    summary["rendered"] += 1
+                finished += 1
+                if progress:
+                    progress(finished, len(plan))
+        summary["elapsed"] = perf_counter() - start
+        return summary
+    finally:
+        db.close()
+
+def format_batch_summary(summary):
+    timings = sorted(summary["timings"].values())
+    lines = [
+        f"Run {summary['run_id']}",
+        f"Vendors planned: {summary['planned']}, rendered: {summary['rendered']}, "
+        f"already done: {summary['skipped']}, failed: {len(summary['failures'])}",
+        f"Elapsed: {summary['elapsed']:.1f}s",
+    ]
+    if timings:
+        lines.append(f"Per vendor: mean {sum(timings) / len(timings):.2f}s, max {timings[-1]:.2f}s")
+    for vendor_id, error in summary["failures"]:
+        lines.append(f"  FAILED {vendor_id}: {error}")
+    return "\n".join(lines)
+
+# ----------------------------------------------------
+# Pipelined Invoice Batch
+# ----------------------------------------------------
+# Invoices from a manifest go through three stages joined by bounded queues: reading the
+# workbook (threads, so slow disks and shares overlap), ingesting and rendering (a process
+# pool, where the CPU time goes) and writing the PDF and its invoice row (one writer, as
+# SQLite wants). A full queue holds back the stage feeding it, so only a few documents are
+# ever in memory. run_invoice_batch(sequential=True) runs the same stages one after another.
+PIPELINE_QUEUE_SIZE = 8
+PIPELINE_READERS = 4
+INVOICE_MANIFEST_COLUMNS = ("vendor_id", "invoice_no", "invoice_date", "invoice_type", "excel_file")
+
+def read_invoice_manifest(db, manifest_path):
+    """
+    Batch jobs from a CSV with the INVOICE_MANIFEST_COLUMNS; invoice_date and invoice_type may
+    be left blank. Vendor details come from the vendors table and relative workbook paths are
+    taken from the manifest's folder. Returns {"vendor_id", "input_details", "excel_file"} dicts.
+    """
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    jobs = []
+    with open(manifest_path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.DictReader(f)
+        missing = [c for c in ("vendor_id", "invoice_no", "excel_file") if c not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f"Manifest is missing column(s): {', '.join(missing)}.")
+        rows = list(reader)
+    # One batched lookup for every vendor in the manifest
+    vendors = fetch_vendors(db, (row["vendor_id"] for row in rows))
+    for line_no, row in enumerate(rows, start=2):
+        vendor = vendors.get(row["vendor_id"])
+        if vendor is None:
+            raise ValueError(f"Line {line_no}: unknown vendor '{row['vendor_id']}'.")
+        jobs.append({
+            "vendor_id": row["vendor_id"],
+            "excel_file": os.path.join(base, row["excel_file"]),
+            "input_details": {
+                "vendor_name": vendor[1],
+                "vendor_address": vendor[2],
+                "vendor_po": vendor[3],
+                "invoice_type": row.get("invoice_type") or "Debit",
+                "invoice_no": row["invoice_no"],
+                "invoice_date": row.get("invoice_date") or date.today().isoformat(),
+            },
+        })
+    return jobs
+
+def _read_invoice_source(job):
+    signature = source_signature(job["excel_file"])
+    with open(job["excel_file"], "rb") as f:
+        return dict(job, data=f.read(), signature=signature)
+
+def _render_invoice_bytes(include_seal, profile, grayscale, job):
+    # Runs in a worker process: ingests the bytes read by the first stage and renders into memory
+    df, total, sections = process_excel_workbook(job["excel_file"], data=job["data"])
+    buffer = io.BytesIO()
+    create_invoice_pdf(buffer, job["input_details"], df, total, include_seal=include_seal, sections=sections,
+                       profile=profile, grayscale=grayscale)
+    rendered = {k: v for k, v in job.items() if k != "data"}
+    rendered.update(pdf=buffer.getvalue(), total=float(total), lines=invoice_line_keys(df))
+    return rendered
+
+def _write_invoice_output(db, output_dir, summary, job):
+    d = job["input_details"]
+    output_path = os.path.join(output_dir, f"Invoice_{_safe_filename(job['vendor_id'])}_{_safe_filename(d['invoice_no'])}.pdf")
+    with open(output_path, "wb") as f:
+        f.write(job["pdf"])
+    billed = find_billed_lines(db, job["vendor_id"], job["lines"], d["invoice_date"], d["invoice_no"])
+    with db:
+        record_invoice(db, job["vendor_id"], d, job["excel_file"], to_cents(job["total"]), job["signature"], job["lines"])
+    if billed:
+        summary["duplicates"].append((d["invoice_no"], billed))
+    summary["written"] += 1
+
+def run_invoice_batch(jobs, output_dir, workers=None, queue_size=PIPELINE_QUEUE_SIZE, sequential=False,
+                      include_seal=True, profile=None, grayscale=False, progress=None):
+    """
+    Generates and records the invoices of jobs (see read_invoice_manifest) into output_dir,
+    through the staged pipeline or, with sequential=True, one document at a time.
+    progress(done, total) is called after each document. Returns a summary dict with
+    per-stage counts and busy time (see format_pipeline_summary).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    summary = {"mode": "sequential" if sequential else "pipeline", "documents": len(jobs), "written": 0,
+               "failures": [], "duplicates": [], "stages": {}}
+    start = perf_counter()
+    # The writer may run on any thread of the loop's pool, but only ever on one at a time
+    db = sqlite3.connect(DB_FILE, check_same_thread=False)
+    try:
+        # (name, work, workers, runs in the process pool)
+        stages = [
+            ("read", _read_invoice_source, PIPELINE_READERS, False),
+            ("render", functools.partial(_render_invoice_bytes, include_seal, profile, grayscale), workers, True),
+            ("write", functools.partial(_write_invoice_output, db, output_dir, summary), 1, False),
+        ]
+        for name, _, count, _ in stages:
+            summary["stages"][name] = {"workers": 1 if sequential else count, "items": 0, "busy": 0.0, "max_queued": 0}
+
+        def finished():
+            if progress:
+                progress(summary["written"] + len(summary["failures"]), summary["documents"])
+
+        if sequential:
+            for job in jobs:
+                for name, work, _, _ in stages:
+                    started = perf_counter()
+                    try:
+                        job = work(job)
+                    except Exception as e:
+                        summary["failures"].append((job["input_details"]["invoice_no"], f"{name}: {e}"))
+                        break
+                    finally:
+                        summary["stages"][name]["busy"] += perf_counter() - started
+                    summary["stages"][name]["items"] += 1
+                finished()
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                asyncio.run(_run_pipeline(jobs, stages, pool, queue_size, summary, finished))
+    finally:
+        db.close()
+    summary["elapsed"] = perf_counter() - start
+    return summary
+
+async def _run_pipeline(jobs, stages, pool, queue_size, summary, finished):
+    """
+    Runs each stage as `workers` coroutines reading from a bounded queue and feeding the next.
+    Thread stages go to the loop's default executor and process stages to pool. A document
+    that fails a stage is recorded in summary["failures"] and goes no further.
+    """
+    loop = asyncio.get_running_loop()
+    queues = [asyncio.Queue(queue_size) for _ in stages]
+
+    async def feed():
+        for job in jobs:
+            await queues[0].put(job)
+        for _ in range(stages[0][2]):
+            await queues[0].put(None)
+
+    async def run_stage(i):
+        name, work, count, in_pool = stages[i]
+        stats = summary["stages"][name]
+        inbox = queues[i]
+        outbox = queues[i + 1] if i + 1 < len(stages) else None
+
+        async def worker():
+            while True:
+                job = await inbox.get()
+                if job is None:
+                    return
+                stats["max_queued"] = max(stats["max_queued"], inbox.qsize() + 1)
+                started = perf_counter()
+                try:
+                    result = await loop.run_in_executor(pool if in_pool else None, work, job)
+                except Exception as e:
+                    summary["failures"].append((job["input_details"]["invoice_no"], f"{name}: {e}"))
+                    finished()
+                    continue
+                finally:
+                    stats["busy"] += perf_counter() - started
+                stats["items"] += 1
+                if outbox is not None:
+                    await outbox.put(result)
+                else:
+                    finished()
+
+        await asyncio.gather(*(worker() for _ in range(count)))
+        if outbox is not None:
+            for _ in range(stages[i + 1][2]):
+                await outbox.put(None)
+
+    await asyncio.gather(feed(), *(run_stage(i) for i in range(len(stages))))
+
+def format_pipeline_summary(summary):
+    elapsed = summary["elapsed"]
+    lines = [f"Invoices: {summary['written']} of {summary['documents']} written, {len(summary['failures'])} failed "
+             f"in {elapsed:.1f}s ({summary['written'] / elapsed if elapsed else 0:.1f} docs/sec, {summary['mode']})"]
+    for name, stats in summary["stages"].items():
+        busy = stats["busy"]
+        used = busy / (elapsed * stats["workers"]) if elapsed else 0
+        lines.append(f"  {name:<7} {stats['workers']:>2} worker(s) {stats['items']:>6} docs  busy {busy:.1f}s "
+                     f"({used:.0%})  avg {busy / stats['items'] if stats['items'] else 0:.3f}s  peak queue {stats['max_queued']}")
+    for invoice_no, billed in summary["duplicates"]:
+        lines.append(f"  {invoice_no}: {len(billed)} line(s) already billed to the vendor")
+    for invoice_no, error in summary["failures"]:
+        lines.append(f"  FAILED {invoice_no}: {error}")
+    return "\n".join(lines)
+
+# ----------------------------------------------------
+# Aging Overview (all vendors)
+# ----------------------------------------------------
+AGING_BUCKETS = ("current", "1month", "2months", "3months", "4plus")
+AGING_SORT_COLUMNS = AGING_BUCKETS + ("total", "overdue", "vendor_id", "vendor_name")
+
+def aging_overview(db, sort="overdue", descending=True):
+    """
+    Aging buckets for every vendor from one grouped aggregation over the stored invoice amounts,
+    using the same day boundaries and sign convention as compute_aging. Invoices without a
+    stored amount are not counted (see backfill_invoice_amounts). Balances cover the whole
+    history, archived years included. Returns a list of dicts.
+    """
+    if sort not in AGING_SORT_COLUMNS:
+        raise ValueError(f"Cannot sort aging by '{sort}'.")
+    with invoice_source(db) as source:
+        rows = _aging_rows(db, source, sort, descending)
+    columns = ("vendor_id", "vendor_name") + AGING_BUCKETS + ("total", "overdue")
+    return [dict(zip(columns, r)) for r in rows]
+
+def _aging_rows(db, source, sort, descending):
+    return db.execute(f"""
+        WITH aged AS (
+            SELECT vendor_id,
+                   CASE WHEN lower(invoice_type) = 'credit' THEN amount_cents ELSE -amount_cents END AS net,
+                   COALESCE(CAST(julianday(date('now', 'localtime')) - julianday(invoice_date) AS INTEGER), 0) AS age
+            FROM {source}
+            WHERE amount_cents IS NOT NULL
+        ), per_vendor AS (
+            SELECT vendor_id,
+                   SUM(CASE WHEN age <= 30 THEN net ELSE 0 END) AS current,
+                   SUM(CASE WHEN age > 30 AND age <= 60 THEN net ELSE 0 END) AS "1month",
+                   SUM(CASE WHEN age > 60 AND age <= 90 THEN net ELSE 0 END) AS "2months",
+                   SUM(CASE WHEN age > 90 AND age <= 120 THEN net ELSE 0 END) AS "3months",
+                   SUM(CASE WHEN age > 120 THEN net ELSE 0 END) AS "4plus",
+                   SUM(net) AS total,
+                   SUM(CASE WHEN age > 30 THEN net ELSE 0 END) AS overdue
+            FROM aged
+            GROUP BY vendor_id
+        )
+        SELECT p.vendor_id,
+               COALESCE((SELECT v.vendor_name FROM vendors v WHERE v.vendor_id = p.vendor_id LIMIT 1), '') AS vendor_name,
+               p.current, p."1month", p."2months", p."3months", p."4plus", p.total, p.overdue
+        FROM per_vendor p
+        ORDER BY "{sort}" {"DESC" if descending else "ASC"}
+    """).fetchall()
+
+def unpriced_invoice_count(db):
+    return db.execute("SELECT COUNT(*) FROM invoices WHERE amount_cents IS NULL").fetchone()[0]
+
+def backfill_invoice_amounts(db, progress=None):
+    """Stores amount_cents for invoices saved before amounts were recorded, reading each workbook once."""
+    paths = [r[0] for r in db.execute("SELECT DISTINCT excel_file FROM invoices WHERE amount_cents IS NULL")]
+    filled = 0
+    for i, path in enumerate(paths):
+        try:
+            cents = to_cents(excel_total(path))
+        except Exception:
+            cents = None  # unreadable; left for a later run
+        if cents is not None:
+            filled += db.execute("UPDATE invoices SET amount_cents=? WHERE excel_file=? AND amount_cents IS NULL",
+                                 (cents, path)).rowcount
+            db.commit()
+        if progress:
+            progress(i + 1, len(paths))
+    return filled
+
+def vendor_transactions(db, vendor_id):
+    """Yields the vendor's invoices (archived years included) as Transactions in date order, straight from the cursor."""
+    with invoice_source(db) as source:
+        cur = db.execute(
+            f"SELECT invoice_date, invoice_no, invoice_type, amount_cents FROM {source} "
+            "WHERE vendor_id=? AND amount_cents IS NOT NULL ORDER BY invoice_date", (vendor_id,))
+        try:
+            for inv_date, inv_no, inv_type, cents in cur:
+                yield Transaction.from_invoice(inv_date, inv_no, "", inv_type, cents / 100)
+        finally:
+            cur.close()
+
+def export_aging_overview_csv(output_path, rows):
+    with open(output_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Vendor ID", "Vendor Name", "Current Month", "1 Month", "2 Months", "3 Months",
+                         "4 Months & Above", "Total", "Overdue"])
+        for r in rows:
+            writer.writerow([r["vendor_id"], r["vendor_name"]] +
+                            [f"{r[k] / 100:.2f}" for k in AGING_BUCKETS + ("total", "overdue")])
+
+# ----------------------------------------------------
+# Source Workbook Watcher
+# ----------------------------------------------------
+# Each invoice remembers the stat signature of its workbook and the total it was issued with.
+# A polling pass re-ingests only workbooks whose signature moved, stores their new total in
+# source_amount_cents and so exposes invoices whose source no longer matches the issued PDF.
+WATCH_INTERVAL_SECONDS = 30
+WATCH_IN_BACKGROUND = False  # GUI default for polling while open; Scan Now works either way
+
+def source_signature(path):
+    """'size:mtime_ns' of a file, or 'missing'. Cheap enough to poll every invoice's workbook."""
+    try:
+        st = os.stat(path)
+    except (OSError, TypeError):
+        return "missing"
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+def scan_source_changes(db, progress=None):
+    """
+    One polling pass over the live invoices' workbooks. Workbooks whose signature differs from
+    the stored one (or was never recorded) are ingested again; their invoices get the new
+    signature and source_amount_cents. Returns {"checked", "changed", "missing", "errors"}.
+    """
+    # MIN/MAX skip NULLs, so invoices saved before signatures were recorded are counted apart
+    rows = db.execute("SELECT excel_file, MIN(source_signature), MAX(source_signature), "
+                      "COUNT(*) - COUNT(source_signature) FROM invoices "
+                      "WHERE excel_file IS NOT NULL GROUP BY excel_file").fetchall()
+    summary = {"checked": len(rows), "changed": [], "missing": [], "errors": []}
+    for i, (path, low, high, unsigned) in enumerate(rows):
+        signature = source_signature(path)
+        if signature == low == high and not unsigned:
+            pass
+        elif signature == "missing":
+            summary["missing"].append(path)
+            db.execute("UPDATE invoices SET source_signature=? WHERE excel_file=?", (signature, path))
+        else:
+            try:
+                cents = to_cents(excel_total(path))
+            except Exception as e:
+                summary["errors"].append((path, str(e)))
+            else:
+                db.execute("UPDATE invoices SET source_signature=?, source_amount_cents=?, source_checked_at=? "
+                           "WHERE excel_file=?", (signature, cents, datetime.now().isoformat(timespec="seconds"), path))
+                summary["changed"].append(path)
+        db.commit()
+        if progress:
+            progress(i + 1, len(rows))
+    return summary
+
+def mismatched_invoices(db):
+    """Invoices whose workbook total no longer equals the total they were issued with."""
+    return db.execute("""
+        SELECT id, vendor_id, invoice_no, invoice_date, excel_file, amount_cents, source_amount_cents, source_checked_at
+        FROM invoices
+        WHERE amount_cents IS NOT NULL AND source_amount_cents IS NOT NULL AND amount_cents != source_amount_cents
+        ORDER BY source_checked_at DESC
+    """).fetchall()
+
+class SourceWatcher(threading.Thread):
+    """
+    Runs scan_source_changes on its own connection until stop(): every `interval` seconds, or only
+    when scan_now() is called if `interval` is None. Passes never overlap, even across watchers.
+    on_scan(summary, mismatched) is called after each pass that found changes or was asked for;
+    on_error(message) when a requested pass could not read the database.
+    """
+    scan_lock = threading.Lock()
+
+    def __init__(self, interval=WATCH_INTERVAL_SECONDS, on_scan=None, on_error=None):
+        threading.Thread.__init__(self, daemon=True)
+        self.interval = interval
+        self.on_scan = on_scan
+        self.on_error = on_error
+        self.stopped = threading.Event()
+        self.wake = threading.Event()
+
+    def run(self):
+        db = sqlite3.connect(DB_FILE)
+        try:
+            while not self.stopped.is_set():
+                requested = self.wake.wait(self.interval)
+                self.wake.clear()
+                if self.stopped.is_set():
+                    break
+                try:
+                    with self.scan_lock:
+                        summary = scan_source_changes(db)
+                        rows = mismatched_invoices(db)
+                except sqlite3.Error as e:
+                    # e.g. the database is busy being restored; try again next round
+                    if requested and self.on_error:
+                        self.on_error(str(e))
+                    continue
+                if self.on_scan and (requested or summary["changed"] or summary["missing"] or summary["errors"]):
+                    self.on_scan(summary, rows)
+        finally:
+            db.close()
+
+    def scan_now(self):
+        """Ask for a pass as soon as the current one (if any) is done; repeated calls coalesce."""
+        self.wake.set()
+
+    def stop(self):
+        self.stopped.set()
+        self.wake.set()
+
+# ----------------------------------------------------
+# Cross-Invoice Duplicate Lines
+# ----------------------------------------------------
+# Every issued line is stored as a hash of its normalised name and amount in invoice_lines,
+# indexed by vendor and hash, so "was this already billed to the vendor recently?" is a set of
+# index seeks instead of re-reading old workbooks.
+DUPLICATE_LOOKBACK_DAYS = 365
+
+def _normalize_line_text(value):
+    if value is None or value != value:
+        return ""
+    return " ".join(str(value).split()).casefold()
+
+def invoice_line_keys(df):
+    """(line_hash, name, amount_cents) for each line item of an ingested frame; blank lines are skipped."""
+    name_col = next((c for c in df.columns if str(c).strip().lower() == "name"), None)
+    amount_col = next(c for c in df.columns if str(c).strip().lower() == "amount")
+    names = df[name_col].tolist() if name_col is not None else [""] * len(df)
+    keys = []
+    for name, amount in zip(names, df[amount_col].tolist()):
+        name, cents = _normalize_line_text(name), to_cents(amount)
+        if name or cents:
+            keys.append((_row_hash([name, cents]), name, cents))
+    return keys
+
+def find_billed_lines(db, vendor_id, line_keys, invoice_date=None, invoice_no=None, lookback_days=None):
+    """
+    Lines of line_keys already billed to the vendor on another invoice dated within lookback_days
+    before invoice_date (today by default), up to invoice_date itself. Returns (name, amount_cents,
+    invoice_no, invoice_date) rows, most recent first.
+    """
+    if not line_keys:
+        return []
+    lookback_days = DUPLICATE_LOOKBACK_DAYS if lookback_days is None else lookback_days
+    until = datetime.strptime(str(invoice_date), "%Y-%m-%d").date() if invoice_date else date.today()
+    since = date.fromordinal(until.toordinal() - lookback_days).isoformat()
+    # Lines of archived years inside the lookback are still duplicates
+    with invoice_source(db, since, until.isoformat(), table="invoice_lines") as source:
+        rows = db.execute(f"""
+            SELECT name, amount_cents, invoice_no, invoice_date FROM {source}
+            WHERE vendor_id = ? AND line_hash IN (SELECT value FROM json_each(?))
+              AND invoice_date >= ? AND invoice_date <= ? AND invoice_no IS NOT ?
+            ORDER BY invoice_date DESC
+        """, (vendor_id, json.dumps([k[0] for k in line_keys]), since, until.isoformat(), invoice_no)).fetchall()
+    # The hash narrows the search; the stored text rules out collisions
+    wanted = {(name, cents) for _, name, cents in line_keys}
+    return [r for r in rows if (r[0], r[1]) in wanted]
+
+def record_invoice(db, vendor_id, input_details, excel_file, amount_cents, signature=None, line_keys=()):
+    """
+    Inserts the invoice row and its line hashes; returns the invoice id. Runs in the caller's
+    transaction (`with db:`), so it can be committed together with the caller's other writes.
+    """
+    invoice_id = db.execute(
+        "INSERT INTO invoices (vendor_id, invoice_no, invoice_date, invoice_type, po_mr_no, excel_file, "
+        "amount_cents, source_signature, source_amount_cents, lines_indexed_at) VALUES (?,?,?,?,?,?,?,?,?,?)",
+        (vendor_id, input_details["invoice_no"], input_details["invoice_date"], input_details["invoice_type"],
+         input_details["vendor_po"], excel_file, amount_cents, signature, amount_cents,
+         datetime.now().isoformat(timespec="seconds"))).lastrowid
+    record_invoice_lines(db, invoice_id, vendor_id, input_details["invoice_no"], input_details["invoice_date"], line_keys)
+    return invoice_id
+
+def record_invoice_lines(db, invoice_id, vendor_id, invoice_no, invoice_date, line_keys):
+    db.executemany("INSERT INTO invoice_lines (invoice_id, vendor_id, invoice_no, invoice_date, line_hash, name, amount_cents) "
+                   "VALUES (?,?,?,?,?,?,?)",
+                   ((invoice_id, vendor_id, invoice_no, invoice_date, h, name, cents) for h, name, cents in line_keys))
+
+def format_billed_lines(rows, limit=20):
+    lines = [f"{name} - {format_cents(cents)} - already on {invoice_no} ({invoice_date})"
+             for name, cents, invoice_no, invoice_date in rows[:limit]]
+    if len(rows) > limit:
+        lines.append(f"... and {len(rows) - limit} more")
+    return "\n".join(lines)
+
+def index_invoice_lines(db, progress=None):
+    """
+    Hashes the lines of stored invoices not indexed yet, reading each workbook once. Indexed
+    invoices are marked (lines_indexed_at), so ones without any lines are not read again;
+    unreadable workbooks are left for the next run.
+    """
+    pending = db.execute("""
+        SELECT i.id, i.vendor_id, i.invoice_no, i.invoice_date, i.excel_file FROM invoices i
+        WHERE i.lines_indexed_at IS NULL
+          AND NOT EXISTS (SELECT 1 FROM invoice_lines l WHERE l.invoice_id = i.id)
+        ORDER BY i.excel_file
+    """).fetchall()
+    indexed = 0
+    for i, (path, rows) in enumerate(itertools.groupby(pending, key=lambda r: r[4])):
+        try:
+            keys = invoice_line_keys(process_excel_workbook(path)[0])
+        except Exception:
+            continue
+        with db:
+            for invoice_id, vendor_id, invoice_no, invoice_date, _ in rows:
+                record_invoice_lines(db, invoice_id, vendor_id, invoice_no, invoice_date, keys)
+                db.execute("UPDATE invoices SET lines_indexed_at=? WHERE id=?",
+                           (datetime.now().isoformat(timespec="seconds"), invoice_id))
+                indexed += 1
+        if progress:
+            progress(i + 1)
+    return indexed
+
+# ----------------------------------------------------
+# Ledger Export (Excel/CSV)
+# ----------------------------------------------------
+# The same ledger as create_report_table_pdf, written row by row: nothing is laid out and only
+# the running balance and aging buckets are kept, so a statement of any length exports in one pass.
+LEDGER_HEADER = ["Date", "Invoice #", "Name", "Debit", "Credit", "Balance"]
+AGING_LABELS = ["Current Month", "1 Month", "2 Months", "3 Months", "4 Months & Above", "Total"]
+LEDGER_EXPORT_TYPES = [("Excel Workbook", "*.xlsx"), ("CSV", "*.csv")]
+
+def ledger_transactions(rows):
+    """
+    Turns cursor rows (invoice_no, invoice_date, invoice_type, amount_cents, excel_file) into
+    Transactions as they are fetched. Invoices saved before amounts were stored are totalled
+    from their workbook; unreadable ones are left out, as in the SOA PDF.
+    """
+    for inv_no, inv_date, inv_type, cents, excel_file in rows:
+        if cents is None:
+            try:
+                amount = excel_total(excel_file)
+            except Exception:
+                continue
+        else:
+            amount = cents / 100
+        yield Transaction.from_invoice(inv_date, inv_no, "", inv_type, amount)
+
+def _csv_ledger_sink(output_path):
+    f = open(output_path, "w", newline="", encoding="utf-8")
+    writer = csv.writer(f)
+
+    def write(values):
+        writer.writerow(["" if v is None else f"{v:.2f}" if isinstance(v, float) else v for v in values])
+    return write, f.close
+
+def _xlsx_ledger_sink(output_path):
+    if importlib.util.find_spec("xlsxwriter"):
+        import xlsxwriter
+        # constant_memory flushes each row to disk as soon as the next one starts
+        workbook = xlsxwriter.Workbook(output_path, {"constant_memory": True})
+        sheet = workbook.add_worksheet("Ledger")
+        sheet.set_column(0, 2, 16)
+        sheet.set_column(3, 5, 14, workbook.add_format({"num_format": "#,##0.00"}))
+        row_no = itertools.count()
+
+        def write(values):
+            sheet.write_row(next(row_no), 0, ["" if v is None else v for v in values])
+        return write, workbook.close
+    if importlib.util.find_spec("openpyxl"):
+        import openpyxl
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet("Ledger")
+        return sheet.append, lambda: workbook.save(output_path)
+    raise RuntimeError("Excel export needs xlsxwriter or openpyxl (pip install xlsxwriter).")
+
+def export_ledger(output_path, title, transactions, balance_bf=0.0):
+    """
+    Writes title, header, Balance b/f, one row per Transaction with its running balance, the
+    Sub-Total row and the aging block to output_path (.xlsx or .csv, by extension).
+    transactions may be any iterable, e.g. ledger_transactions over a live cursor.
+    Returns {"rows", "balance"}.
+    """
+    sink = _xlsx_ledger_sink if output_path.lower().endswith(".xlsx") else _csv_ledger_sink
+    write, close = sink(output_path)
+    today = datetime.now().date()
+    buckets = dict.fromkeys(AGING_BUCKETS, 0)
+    running_balance = to_cents(balance_bf)
+    total_debit = total_credit = rows = 0
+    try:
+        write([title])
+        write([])
+        write(LEDGER_HEADER)
+        write([None, None, "Balance b/f", None, None, running_balance / 100])
+        for txn in transactions:
+            running_balance += txn.debit - txn.credit
+            total_debit += txn.debit
+            total_credit += txn.credit
+            buckets[aging_bucket(txn, today)] += txn.debit - txn.credit
+            write([txn.date_text, txn.invoice_no, txn.name, txn.debit / 100 if txn.debit else None,
+                   txn.credit / 100 if txn.credit else None, running_balance / 100])
+            rows += 1
+        write([None, None, "Sub-Total", total_debit / 100, total_credit / 100, running_balance / 100])
+        write([])
+        write(AGING_LABELS)
+        write([buckets[k] / 100 for k in AGING_BUCKETS] + [sum(buckets.values()) / 100])
+    finally:
+        close()
+    return {"rows": rows, "balance": running_balance / 100}
+
+def export_vendor_ledger(db, vendor_id, from_date, to_date, output_path):
+    """Exports a vendor's SOA ledger for the period straight from the invoices table."""
+    row = db.execute("SELECT vendor_name FROM vendors WHERE vendor_id=?", (vendor_id,)).fetchone()
+    if row is None:
+        raise ValueError(f"Unknown vendor '{vendor_id}'.")
+    with invoice_source(db, from_date, to_date) as source:
+        cur = db.execute(
+            f"SELECT invoice_no, invoice_date, invoice_type, amount_cents, excel_file FROM {source} "
+            "WHERE vendor_id=? AND invoice_date BETWEEN ? AND ? ORDER BY invoice_date", (vendor_id, from_date, to_date))
+        return export_ledger(output_path, f"Statement of Account - {row[0]} ({from_date} to {to_date})",
+                             ledger_transactions(cur))
+
+# ----------------------------------------------------
+# Backups & Integrity Checks
+# ----------------------------------------------------
+# Snapshots are taken with SQLite's online backup API, which copies the database a few pages
+# at a time and restarts by itself when another connection writes in between, so the copy is
+# always consistent and the app never waits on it for long.
+BACKUP_DIR = "backups"
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_KEEP = 14
+BACKUP_INTERVAL_HOURS = 24
+
+def integrity_check(path=None, full=False):
+    """Runs PRAGMA quick_check (or integrity_check with full=True) on path (app.db by default); returns the problem lines, [] when clean."""
+    db = sqlite3.connect(f"file:{os.path.abspath(path or DB_FILE)}?mode=ro", uri=True)
+    try:
+        rows = [r[0] for r in db.execute("PRAGMA integrity_check" if full else "PRAGMA quick_check")]
+    except sqlite3.DatabaseError as e:
+        # Damage bad enough that SQLite cannot read the schema, or not a database at all
+        rows = [str(e)]
+    finally:
+        db.close()
+    return [] if rows == ["ok"] else rows
+
+def list_backups():
+    """Backup files, newest first."""
+    if not os.path.isdir(BACKUP_DIR):
+        return []
+    names = [n for n in os.listdir(BACKUP_DIR) if n.startswith("app-") and n.endswith(".db")]
+    return [os.path.join(BACKUP_DIR, n) for n in sorted(names, reverse=True)]
+
+def prune_backups(keep=None):
+    """Keeps the newest `keep` backups (BACKUP_KEEP by default) and deletes the rest."""
+    keep = BACKUP_KEEP if keep is None else keep
+    removed = list_backups()[keep:]
+    for path in removed:
+        os.remove(path)
+    return removed
+
+def _copy_database(src_path, dest_path, pages, progress):
+    src = sqlite3.connect(src_path)
+    dest = sqlite3.connect(dest_path)
+    try:
+        # The callback sees (status, remaining, total) after every step of `pages` pages
+        src.backup(dest, pages=pages,
+                   progress=(lambda status, remaining, total: progress(total - remaining, total)) if progress else None)
+    finally:
+        dest.close()
+        src.close()
+
+def backup_database(dest_path=None, pages=None, progress=None, keep=None):
+    """
+    Snapshots app.db into BACKUP_DIR (or dest_path) with the online backup API, checks the
+    copy with quick_check and applies the retention. progress(done_pages, total_pages) is
+    called between steps. Returns {"path", "bytes", "seconds", "check_seconds"}.
+    """
+    started = perf_counter()
+    if dest_path is None:
+        os.makedirs(BACKUP_DIR, exist_ok=True)
+        dest_path = os.path.join(BACKUP_DIR, f"app-{datetime.now():%Y%m%d-%H%M%S-%f}.db")
+    partial = dest_path + ".partial"
+    if os.path.exists(partial):
+        os.remove(partial)
+    _copy_database(DB_FILE, partial, pages or BACKUP_PAGES_PER_STEP, progress)
+    copied = perf_counter()
+    problems = integrity_check(partial)
+    if problems:
+        os.remove(partial)
+        raise RuntimeError("Backup failed quick_check: " + "; ".join(problems[:5]))
+    os.replace(partial, dest_path)
+    if os.path.dirname(dest_path) == BACKUP_DIR:
+        prune_backups(keep)
+    return {"path": dest_path, "bytes": os.path.getsize(dest_path), "seconds": round(copied - started, 3),
+            "check_seconds": round(perf_counter() - copied, 3)}
+
+def restore_database(backup_path, progress=None):
+    """
+    Replaces the contents of app.db with a checked backup, writing through SQLite so open
+    connections see the restored data. The current database is snapshotted first.
+    Returns {"restored", "safety_backup", "seconds"}.
+    """
+    started = perf_counter()
+    problems = integrity_check(backup_path)
+    if problems:
+        raise RuntimeError(f"{backup_path} failed quick_check: " + "; ".join(problems[:5]))
+    safety = backup_database()["path"]
+    db = sqlite3.connect(DB_FILE)
+    try:
+        before = db.execute("SELECT COALESCE(MAX(epoch), 0) FROM db_epoch").fetchone()[0]
+    except sqlite3.OperationalError:
+        before = 0
+    finally:
+        db.close()
+    _copy_database(backup_path, DB_FILE, BACKUP_PAGES_PER_STEP, progress)
+    # The backup brings back its own write generations; a new epoch keeps cached query results
+    # built before the restore from matching them again
+    db = sqlite3.connect(DB_FILE)
+    try:
+        bump_db_epoch(db, before)
+    finally:
+        db.close()
+    return {"restored": backup_path, "safety_backup": safety, "seconds": round(perf_counter() - started, 3)}
+
+def backup_due(interval_hours=None):
+    """True when the newest backup is older than the interval (or there is none)."""
+    interval_hours = BACKUP_INTERVAL_HOURS if interval_hours is None else interval_hours
+    backups = list_backups()
+    if not backups:
+        return True
+    return datetime.now().timestamp() - os.path.getmtime(backups[0]) >= interval_hours * 3600
+
+def format_backup_result(result):
+    return (f"{result['path']}: {result['bytes'] / 1024 / 1024:,.1f} MB copied in {result['seconds']:.2f} s, "
+            f"checked in {result['check_seconds']:.2f} s")
+
+# ----------------------------------------------------
+# Generation Service (local HTTP/JSON)
+# ----------------------------------------------------
+# POST /vendors              {"vendor_id", "vendor_name", "vendor_address", "po_number"}
+# POST /invoices             {"vendor_id", "invoice_no", "invoice_date", "invoice_type", "excel_file", "include_seal"}
+# POST /soas                 {"vendor_id", "from_date", "to_date", "include_seal"}
+# GET  /jobs/<id>            job status
+# GET  /jobs/<id>/pdf        the rendered PDF once the job is done
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+SERVICE_QUEUE_LIMIT = 32
+SERVICE_OUTPUT_DIR = "service_output"
+# Finished jobs stay queryable for this long, and at most this many are kept
+SERVICE_JOB_TTL_SECONDS = 3600
+SERVICE_MAX_FINISHED_JOBS = 1000
+
+def _service_render(kind, output_path, payload):
+    # Runs in a worker process
+    if kind == "invoice":
+        # Already one document per pool process, so the plan stays within this process
+        plan = plan_invoice_render(payload["excel_file"], allow_parallel=False)
+        with contextlib.ExitStack() as stack:
+            ingested = execute_plan(plan, lambda: ingest_invoice_workbook(payload["excel_file"], plan["strategy"], stack))
+            meta, hit = execute_plan(plan, lambda: render_invoice_document(
+                output_path, payload["input_details"], payload["excel_file"], include_seal=payload["include_seal"],
+                ingested=ingested, profile=payload["profile"], grayscale=payload["grayscale"],
+                strategy=plan["strategy"]))
+            meta = dict(meta, lines=ingested_line_keys(ingested))
+        if not hit:
+            plan["actual_rows"] = ingested_rows(ingested)
+            meta["plan"] = plan
+    else:
+        meta, _ = render_soa_document(output_path, payload["soa_info"], payload["invoices"],
+                                      include_seal=payload["include_seal"],
+                                      profile=payload["profile"], grayscale=payload["grayscale"])
+    return meta
+
+class GenerationService:
+    """
+    Job queue behind the HTTP endpoints. At most queue_limit jobs wait in the queue (further
+    submissions are refused so the handler can answer 429); `workers` dispatcher threads feed
+    a process pool of the same size, and record results in the database on their own connection.
+    Finished jobs are forgotten after job_ttl seconds, oldest first once more than max_finished
+    have piled up; their PDFs stay in output_dir.
+    """
+    def __init__(self, output_dir=SERVICE_OUTPUT_DIR, workers=None, queue_limit=SERVICE_QUEUE_LIMIT,
+                 job_ttl=SERVICE_JOB_TTL_SECONDS, max_finished=SERVICE_MAX_FINISHED_JOBS):
+        self.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+        self.workers = workers or os.cpu_count() or 1
+        self.queue = queue.Queue(maxsize=queue_limit)
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        self.jobs = {}
+        # Finished job ids in the order they finished
+        self.finished = collections.OrderedDict()
+        self.job_ttl = job_ttl
+        self.max_finished = max_finished
+        self.lock = threading.Lock()
+        for _ in range(self.workers):
+            threading.Thread(target=self._dispatch, daemon=True).start()
+
+    def _update(self, job_id, **fields):
+        with self.lock:
+            self.jobs[job_id].update(fields)
+            if "finished" in fields:
+                self.finished[job_id] = fields["finished"]
+            self._prune()
+
+    def _prune(self):
+        # Called with the lock held
+        now = perf_counter()
+        while self.finished:
+            job_id, finished = next(iter(self.finished.items()))
+            if len(self.finished) <= self.max_finished and now - finished < self.job_ttl:
+                break
+            del self.finished[job_id]
+            del self.jobs[job_id]
+
+    def _dispatch(self):
+        db = sqlite3.connect(DB_FILE)
+        while True:
+            job_id, kind, payload = self.queue.get()
+            job = self.jobs[job_id]
+            self._update(job_id, status="running", started=perf_counter())
+            try:
+                signature = source_signature(payload.get("excel_file"))
+                meta = self.pool.submit(_service_render, kind, job["output_path"], payload).result()
+                duplicates = []
+                with db:
+                    if kind == "invoice":
+                        d = payload["input_details"]
+                        duplicates = find_billed_lines(db, payload["vendor_id"], meta["lines"], d["invoice_date"], d["invoice_no"])
+                        record_invoice(db, payload["vendor_id"], d, payload["excel_file"], to_cents(meta["total"]),
+                                       signature, meta["lines"])
+                    if meta.get("plan"):
+                        log_execution_plan(db, meta["plan"])
+                self._update(job_id, status="done", finished=perf_counter(), duplicates=duplicates)
+            except Exception as e:
+                self._update(job_id, status="failed", error=str(e), finished=perf_counter())
+            finally:
+                self.queue.task_done()
+
+    def _enqueue(self, kind, payload):
+        job_id = uuid.uuid4().hex
+        job = {"id": job_id, "kind": kind, "status": "queued", "error": None, "submitted": perf_counter(),
+               "output_path": os.path.join(self.output_dir, f"{kind}_{job_id}.pdf")}
+        with self.lock:
+            self._prune()
+            self.jobs[job_id] = job
+        try:
+            self.queue.put_nowait((job_id, kind, payload))
+        except queue.Full:
+            with self.lock:
+                del self.jobs[job_id]
+            raise
+        return job
+
+    def create_vendor(self, body):
+        fields = [str(body.get(k, "")).strip() for k in ("vendor_id", "vendor_name", "vendor_address", "po_number")]
+        if not all(fields):
+            raise ValueError("vendor_id, vendor_name, vendor_address and po_number are required.")
+        db = sqlite3.connect(DB_FILE)
+        try:
+            db.execute("INSERT INTO vendors (vendor_id, vendor_name, vendor_address, po_number) VALUES (?,?,?,?)", fields)
+            db.commit()
+        finally:
+            db.close()
+        return {"vendor_id": fields[0]}
+
+    def _vendor(self, db, vendor_id):
+        row = db.execute("SELECT vendor_name, vendor_address, po_number FROM vendors WHERE vendor_id=?", (vendor_id,)).fetchone()
+        if row is None:
+            raise ValueError(f"Unknown vendor '{vendor_id}'.")
+        return row
+
+    def _output_options(self, body):
+        options = {"include_seal": bool(body.get("include_seal", True)),
+                   "profile": body.get("profile") or DEFAULT_OUTPUT_PROFILE,
+                   "grayscale": bool(body.get("grayscale", False))}
+        output_profile_key(options["profile"])  # raises ValueError for an unknown profile
+        return options
+
+    def submit_invoice(self, body):
+        for key in ("vendor_id", "invoice_no", "excel_file"):
+            if not body.get(key):
+                raise ValueError(f"'{key}' is required.")
+        db = sqlite3.connect(DB_FILE)
+        try:
+            vendor_name, vendor_address, vendor_po = self._vendor(db, body["vendor_id"])
+        finally:
+            db.close()
+        input_details = {
+            "vendor_name": vendor_name,
+            "vendor_address": vendor_address,
+            "vendor_po": vendor_po,
+            "invoice_type": body.get("invoice_type", "Debit"),
+            "invoice_no": body["invoice_no"],
+            "invoice_date": body.get("invoice_date") or date.today().isoformat(),
+        }
+        return self._enqueue("invoice", {"vendor_id": body["vendor_id"], "input_details": input_details,
+                                         "excel_file": body["excel_file"], **self._output_options(body)})
+
+    def submit_soa(self, body):
+        for key in ("vendor_id", "from_date", "to_date"):
+            if not body.get(key):
+                raise ValueError(f"'{key}' is required.")
+        db = sqlite3.connect(DB_FILE)
+        try:
+            vendor_name, vendor_address, _ = self._vendor(db, body["vendor_id"])
+            with invoice_source(db, body["from_date"], body["to_date"]) as source:
+                invoices = db.execute(
+                    f"SELECT invoice_no, invoice_date, invoice_type, excel_file FROM {source} WHERE vendor_id=? AND invoice_date BETWEEN ? AND ?",
+                    (body["vendor_id"], body["from_date"], body["to_date"])).fetchall()
+        finally:
+            db.close()
+        soa_info = {"statement_date": body["from_date"], "due_date": body["to_date"],
+                    "company_name": vendor_name, "company_address": vendor_address}
+        return self._enqueue("soa", {"soa_info": soa_info, "invoices": invoices,
+                                     **self._output_options(body)})
+
+    def status(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            status = {k: job[k] for k in ("id", "kind", "status", "error")}
+            if job.get("duplicates"):
+                # Lines already billed to the vendor within the lookback window
+                status["duplicates"] = [dict(zip(("name", "amount_cents", "invoice_no", "invoice_date"), r))
+                                        for r in job["duplicates"]]
+            if "finished" in job:
+                status["seconds"] = round(job["finished"] - job["submitted"], 3)
+        status["queue_length"] = self.queue.qsize()
+        return status
+
+    def output_path(self, job_id):
+        """The PDF of a finished job, or None once the job is forgotten or if it has not finished."""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return job["output_path"] if job is not None and job["status"] == "done" else None
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    service = None
+
+    def _send_json(self, code, body, headers=()):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        handlers = {"/vendors": self.service.create_vendor, "/invoices": self.service.submit_invoice,
+                    "/soas": self.service.submit_soa}
+        handler = handlers.get(self.path.rstrip("/"))
+        if handler is None:
+            return self._send_json(404, {"error": "Not found."})
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if not isinstance(body, dict):
+                raise ValueError("The request body must be a JSON object.")
+            result = handler(body)
+        except queue.Full:
+            return self._send_json(429, {"error": "Queue is full, retry later."}, [("Retry-After", "1")])
+        except (ValueError, sqlite3.Error) as e:
+            return self._send_json(400, {"error": str(e)})
+        if handler == self.service.create_vendor:
+            return self._send_json(201, result)
+        self._send_json(202, {"job_id": result["id"], "status_url": f"/jobs/{result['id']}"})
+
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        if len(parts) not in (2, 3) or parts[0] != "jobs" or (len(parts) == 3 and parts[2] != "pdf"):
+            return self._send_json(404, {"error": "Not found."})
+        status = self.service.status(parts[1])
+        if status is None:
+            return self._send_json(404, {"error": "Unknown job."})
+        if len(parts) == 2:
+            return self._send_json(200, status)
+        if status["status"] != "done":
+            return self._send_json(409, status)
+        output_path = self.service.output_path(parts[1])
+        if output_path is None:
+            return self._send_json(404, {"error": "Unknown job."})
+        with open(output_path, "rb") as f:
+            data = f.read()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/pdf")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+def run_service(host=SERVICE_HOST, port=SERVICE_PORT, workers=None, queue_limit=SERVICE_QUEUE_LIMIT,
+                output_dir=SERVICE_OUTPUT_DIR):
+    handler = type("BoundServiceRequestHandler", (ServiceRequestHandler,),
+                   {"service": GenerationService(output_dir, workers, queue_limit)})
+    server = ThreadingHTTPServer((host, port), handler)
+    print(f"Serving on http://{host}:{port} ({handler.service.workers} workers, queue limit {queue_limit})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        handler.service.pool.shutdown(cancel_futures=True)
+
+# ----------------------------------------------------
+# Shared Job Queue (several worker processes/machines)
+# ----------------------------------------------------
+# Jobs live in generation_jobs so any number of `worker` processes pointed at the same
+# database can share them. A worker claims the oldest queued job inside a write transaction,
+# which gives it a lease; a heartbeat thread keeps extending the lease while it renders.
+# A lease that runs out (the worker crashed or lost the machine) makes the job claimable
+# again, up to JOB_MAX_ATTEMPTS claims. Results are only written back by the lease holder,
+# so a worker that was presumed dead cannot overwrite its successor's output.
+JOB_LEASE_SECONDS = 60
+JOB_HEARTBEAT_SECONDS = 15
+JOB_MAX_ATTEMPTS = 3
+JOB_POLL_SECONDS = 2
+JOB_DB_TIMEOUT = 30
+
+def enqueue_job(db, kind, payload, output_path):
+    """Queues an "invoice" or "soa" job (payload as for the generation service); returns its id."""
+    with db:
+        return db.execute("INSERT INTO generation_jobs (kind, payload, output_path, status, created_at) "
+                          "VALUES (?, ?, ?, 'queued', ?)",
+                          (kind, json.dumps(payload, default=str), output_path,
+                           datetime.now().isoformat(timespec="seconds"))).lastrowid
+
+def enqueue_invoice_jobs(db, jobs, output_dir, include_seal=True, profile=None, grayscale=False):
+    """Queues the invoices of a manifest (see read_invoice_manifest); returns the job ids."""
+    ids = []
+    for job in jobs:
+        name = f"Invoice_{_safe_filename(job['vendor_id'])}_{_safe_filename(job['input_details']['invoice_no'])}.pdf"
+        ids.append(enqueue_job(db, "invoice", {**job, "include_seal": include_seal, "profile": profile,
+                                               "grayscale": grayscale}, os.path.join(output_dir, name)))
+    return ids
+
+def enqueue_soa_jobs(db, from_date, to_date, output_dir, vendor_ids=None, include_seal=True, profile=None, grayscale=False):
+    """Queues one SOA per vendor for the period (see plan_soa_batch); returns the job ids."""
+    ids = []
+    for item in plan_soa_batch(db, from_date, to_date, vendor_ids):
+        payload = {"vendor_id": item["vendor_id"], "invoices": item["invoices"], "include_seal": include_seal,
+                   "profile": profile, "grayscale": grayscale,
+                   "soa_info": {"statement_date": from_date, "due_date": to_date,
+                                "company_name": item["vendor_name"], "company_address": item["vendor_address"]}}
+        name = f"SOA_{_safe_filename(item['vendor_id'])}_{from_date}_{to_date}.pdf"
+        ids.append(enqueue_job(db, "soa", payload, os.path.join(output_dir, name)))
+    return ids
+
+def claim_job(db, worker_id, lease_seconds=JOB_LEASE_SECONDS):
+    """
+    Claims the oldest queued job, or one whose lease expired, for worker_id. Jobs whose lease
+    expired JOB_MAX_ATTEMPTS times are failed instead. Returns the job as a dict, or None.
+    """
+    now = datetime.now()
+    # BEGIN IMMEDIATE takes the write lock up front, so two workers cannot pick the same row
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        db.execute("UPDATE generation_jobs SET status='failed', error='lease expired ' || attempts || ' time(s)', "
+                   "finished_at=? WHERE status='running' AND lease_until < ? AND attempts >= ?",
+                   (now.isoformat(timespec="seconds"), now.timestamp(), JOB_MAX_ATTEMPTS))
+        row = db.execute("SELECT id, kind, payload, output_path, attempts FROM generation_jobs "
+                         "WHERE status='queued' OR (status='running' AND lease_until < ?) ORDER BY id LIMIT 1",
+                         (now.timestamp(),)).fetchone()
+        if row is not None:
+            db.execute("UPDATE generation_jobs SET status='running', worker=?, lease_until=?, attempts=attempts+1, "
+                       "started_at=? WHERE id=?",
+                       (worker_id, now.timestamp() + lease_seconds, now.isoformat(timespec="seconds"), row[0]))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    if row is None:
+        return None
+    return {"id": row[0], "kind": row[1], "payload": json.loads(row[2]), "output_path": row[3], "attempt": row[4] + 1}
+
+def renew_lease(db, job_id, worker_id, lease_seconds=JOB_LEASE_SECONDS):
+    """Extends the lease; False when the job is no longer held by worker_id."""
+    with db:
+        return db.execute("UPDATE generation_jobs SET lease_until=? WHERE id=? AND worker=? AND status='running'",
+                          (datetime.now().timestamp() + lease_seconds, job_id, worker_id)).rowcount == 1
+
+def complete_job(db, worker_id, job, partial_path, meta=None, error=None):
+    """
+    Records the outcome of a claimed job if worker_id still holds it. The status, the result,
+    for invoices the invoice and its lines, and the plan are written in one transaction. The
+    rendered file is moved to the job's output path only after that commit, and only while the
+    job is still done under this worker, so a failed write never publishes a file. A file that
+    cannot be moved into place marks the committed job failed; requeued, it renders again but
+    reuses the invoice row it already recorded. Returns False (and discards the file) when the
+    lease was lost.
+    """
+    result = None
+    if meta is not None:
+        result = {k: v for k, v in meta.items() if k != "lines"}
+        if job["kind"] == "invoice" and error is None:
+            # Looked up before the transaction: archives cannot be attached inside one
+            d = job["payload"]["input_details"]
+            result["duplicates"] = find_billed_lines(db, job["payload"]["vendor_id"], meta["lines"],
+                                                     d["invoice_date"], d["invoice_no"])
+    with db:
+        owned = db.execute("UPDATE generation_jobs SET status=?, error=?, finished_at=?, lease_until=NULL "
+                           "WHERE id=? AND worker=? AND status='running'",
+                           ("failed" if error else "done", error, datetime.now().isoformat(timespec="seconds"),
+                            job["id"], worker_id)).rowcount == 1
+        if owned and error is None:
+            payload = job["payload"]
+            if job["kind"] == "invoice":
+                previous = db.execute("SELECT result FROM generation_jobs WHERE id=?", (job["id"],)).fetchone()[0]
+                invoice_id = json.loads(previous).get("invoice_id") if previous else None
+                if invoice_id is None:
+                    invoice_id = record_invoice(db, payload["vendor_id"], d, payload["excel_file"],
+                                                to_cents(meta["total"]), source_signature(payload["excel_file"]),
+                                                meta["lines"])
+                result["invoice_id"] = invoice_id
+            db.execute("UPDATE generation_jobs SET result=? WHERE id=?", (json.dumps(result, default=str), job["id"]))
+            if meta.get("plan"):
+                log_execution_plan(db, meta["plan"])
+    publish = owned and error is None and db.execute(
+        "SELECT 1 FROM generation_jobs WHERE id=? AND worker=? AND status='done'", (job["id"], worker_id)).fetchone()
+    if publish:
+        try:
+            os.replace(partial_path, job["output_path"])
+        except OSError as e:
+            with db:
+                db.execute("UPDATE generation_jobs SET status='failed', error=? WHERE id=? AND worker=? AND status='done'",
+                           (f"could not publish the file: {e}", job["id"], worker_id))
+    with contextlib.suppress(OSError):
+        os.remove(partial_path)
+    return owned
+
+class LeaseHeartbeat(threading.Thread):
+    """Renews a claimed job's lease every JOB_HEARTBEAT_SECONDS on its own connection until stop()."""
+    def __init__(self, job_id, worker_id, lease_seconds=JOB_LEASE_SECONDS, interval=JOB_HEARTBEAT_SECONDS):
+        threading.Thread.__init__(self, daemon=True)
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.interval = interval
+        self.lost = False
+        self.stopped = threading.Event()
+
+    def run(self):
+        db = sqlite3.connect(DB_FILE, timeout=JOB_DB_TIMEOUT)
+        try:
+            while not self.stopped.wait(self.interval):
+                try:
+                    if not renew_lease(db, self.job_id, self.worker_id, self.lease_seconds):
+                        self.lost = True
+                        return
+                except sqlite3.Error:
+                    pass  # busy; the lease has room for a missed beat
+        finally:
+            db.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+def run_worker(worker_id=None, until_empty=False, max_jobs=None, poll=JOB_POLL_SECONDS,
+               lease_seconds=JOB_LEASE_SECONDS, heartbeat=JOB_HEARTBEAT_SECONDS, log=None):
+    """
+    Claims and renders jobs until interrupted, until max_jobs were handled, or with until_empty
+    once no job is queued or running anywhere. log(message) reports each job. Returns
+    {"worker", "done", "failed", "lost"}.
+    """
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    stats = {"worker": worker_id, "done": 0, "failed": 0, "lost": 0}
+    db = sqlite3.connect(DB_FILE, timeout=JOB_DB_TIMEOUT)
+    try:
+        while max_jobs is None or sum(stats[k] for k in ("done", "failed", "lost")) < max_jobs:
+            job = claim_job(db, worker_id, lease_seconds)
+            if job is None:
+                if until_empty and not db.execute(
+                        "SELECT 1 FROM generation_jobs WHERE status IN ('queued', 'running') LIMIT 1").fetchone():
+                    break
+                sleep(poll)
+                continue
+            started = perf_counter()
+            partial_path = f"{job['output_path']}.{_safe_filename(worker_id)}.partial"
+            os.makedirs(os.path.dirname(os.path.abspath(job["output_path"])), exist_ok=True)
+            beat = LeaseHeartbeat(job["id"], worker_id, lease_seconds, heartbeat)
+            beat.start()
+            meta = error = None
+            try:
+                meta = _service_render(job["kind"], partial_path, job["payload"])
+            except Exception as e:
+                error = str(e)
+            finally:
+                beat.stop()
+            try:
+                owned = complete_job(db, worker_id, job, partial_path, meta, error)
+            except Exception as e:
+                # Nothing was committed or published; record the job as failed and keep serving
+                error = f"could not record the result: {e}"
+                owned = complete_job(db, worker_id, job, partial_path, None, error)
+            if owned and error is None:
+                # The file may still have failed to publish after the commit
+                error = db.execute("SELECT error FROM generation_jobs WHERE id=?", (job["id"],)).fetchone()[0]
+            if not owned:
+                outcome = "lost"
+            else:
+                outcome = "failed" if error else "done"
+            stats[outcome] += 1
+            if log:
+                log(f"{worker_id} job {job['id']} ({job['kind']}, attempt {job['attempt']}) {outcome} "
+                    f"in {perf_counter() - started:.2f}s" + (f": {error}" if error else ""))
+    finally:
+        db.close()
+    return stats
+
+def job_counts(db):
+    """Number of jobs per status."""
+    return dict(db.execute("SELECT status, COUNT(*) FROM generation_jobs GROUP BY status").fetchall())
+
+def requeue_failed_jobs(db):
+    with db:
+        return db.execute("UPDATE generation_jobs SET status='queued', attempts=0, worker=NULL, error=NULL "
+                          "WHERE status='failed'").rowcount
+
+# ----------------------------------------------------
+# Vendor Lookup & Picker
+# ----------------------------------------------------
+VENDOR_LOOKUP_LIMIT = 20
+VENDOR_CACHE_SIZE = 256
+VENDOR_SEARCH_DELAY_MS = 150
+
+class VendorDirectory:
+    """
+    Prefix lookups on vendor name or ID against the NOCASE indexes, plus lookups by key.
+    Recent results are kept in a small LRU, dropped whenever the database changed since the
+    last lookup: a commit from any connection (PRAGMA data_version) or a write on this one
+    (total_changes). Rows are (vendor_id, vendor_name, vendor_address, po_number).
+    """
+    def __init__(self, db, limit=VENDOR_LOOKUP_LIMIT, cache_size=VENDOR_CACHE_SIZE):
+        self.db = db
+        self.limit = limit
+        self.cache_size = cache_size
+        self._cache = collections.OrderedDict()
+        self._version = None
+
+    def refresh(self):
+        """Drops the cache if anything was written since the last call."""
+        # data_version only moves for other connections' commits; total_changes covers this one
+        version = (self.db.execute("PRAGMA data_version").fetchone()[0], self.db.total_changes)
+        if version != self._version:
+            self._version = version
+            self._cache.clear()
+
+    def _cached(self, key, load):
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        return self._store(key, load())
+
+    def _store(self, key, value):
+        self._cache[key] = value
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return value
+
+    def search(self, prefix):
+        prefix = prefix.strip()
+        if not prefix:
+            return []
+        self.refresh()
+        # A range on the NOCASE index is the indexed form of "LIKE 'prefix%'"
+        bounds = (prefix, prefix + "\U0010ffff")
+        return self._cached(("search", prefix.lower()), lambda: self.db.execute("""
+            SELECT vendor_id, vendor_name, vendor_address, po_number FROM vendors
+            WHERE vendor_name >= ? COLLATE NOCASE AND vendor_name < ? COLLATE NOCASE
+            UNION
+            SELECT vendor_id, vendor_name, vendor_address, po_number FROM vendors
+            WHERE vendor_id >= ? COLLATE NOCASE AND vendor_id < ? COLLATE NOCASE
+            ORDER BY 2 COLLATE NOCASE LIMIT ?
+        """, bounds + bounds + (self.limit,)).fetchall())
+
+    def get(self, vendor_id):
+        self.refresh()
+        return self._cached(("id", vendor_id), lambda: self.db.execute(
+            "SELECT vendor_id, vendor_name, vendor_address, po_number FROM vendors WHERE vendor_id=?",
+            (vendor_id,)).fetchone())
+
+    def get_many(self, vendor_ids):
+        """{vendor_id: row or None} for several keys; the ones not cached are fetched in one batch."""
+        self.refresh()
+        rows = {}
+        missing = []
+        for vendor_id in dict.fromkeys(vendor_ids):
+            if ("id", vendor_id) in self._cache:
+                rows[vendor_id] = self._cached(("id", vendor_id), None)
+            else:
+                missing.append(vendor_id)
+        if missing:
+            found = fetch_vendors(self.db, missing)
+            for vendor_id in missing:
+                rows[vendor_id] = self._store(("id", vendor_id), found.get(vendor_id))
+        return rows
+
+    def invalidate(self):
+        self._cache.clear()
+
+class VendorPicker(ctk.CTkFrame):
+    """
+    Type-ahead vendor field: matching vendors are looked up as the user types and listed below
+    the entry. Picking one stores its key in `vendor_id` and calls on_select(row).
+    """
+    def __init__(self, master, directory, on_select=None, width=300):
+        ctk.CTkFrame.__init__(self, master, fg_color="transparent")
+        self.directory = directory
+        self.on_select = on_select
+        self.vendor_id = None
+        self.matches = []
+        self._pending = None
+        self.text_var = tk.StringVar()
+        self.entry = ctk.CTkEntry(self, textvariable=self.text_var, width=width, placeholder_text="Vendor name or ID")
+        self.entry.pack(fill="x")
+        # customtkinter has no list widget; a Listbox coloured from the CTk theme keeps keyboard selection
+        self.listbox = tk.Listbox(self, height=6, width=1, borderwidth=0, highlightthickness=1, activestyle="none")
+        self._style_listbox()
+        self.entry.bind("<KeyRelease>", self._on_key)
+        self.entry.bind("<Down>", lambda e: self._focus_list())
+        self.listbox.bind("<<ListboxSelect>>", lambda e: self._choose())
+        self.listbox.bind("<Return>", lambda e: self._choose())
+
+    def _style_listbox(self):
+        entry = ctk.ThemeManager.theme["CTkEntry"]
+        button = ctk.ThemeManager.theme["CTkButton"]
+        self.listbox.configure(bg=self._apply_appearance_mode(entry["fg_color"]),
+                               fg=self._apply_appearance_mode(entry["text_color"]),
+                               highlightbackground=self._apply_appearance_mode(entry["border_color"]),
+                               selectbackground=self._apply_appearance_mode(button["fg_color"]),
+                               selectforeground=self._apply_appearance_mode(button["text_color"]))
+
+    def _set_appearance_mode(self, mode_string):
+        ctk.CTkFrame._set_appearance_mode(self, mode_string)
+        self._style_listbox()
+
+    def _on_key(self, event):
+        if event.keysym in ("Down", "Up", "Return", "Tab"):
+            return
+        self.vendor_id = None
+        # Debounced so a burst of keystrokes runs one query
+        if self._pending:
+            self.after_cancel(self._pending)
+        self._pending = self.after(VENDOR_SEARCH_DELAY_MS, self._search)
+
+    def _search(self):
+        self._pending = None
+        self.matches = self.directory.search(self.text_var.get())
+        self.listbox.delete(0, tk.END)
+        for vendor_id, vendor_name, _, _ in self.matches:
+            self.listbox.insert(tk.END, f"{vendor_name} ({vendor_id})")
+        if self.matches:
+            self.listbox.pack(fill="x")
+        else:
+            self.listbox.pack_forget()
+
+    def _focus_list(self):
+        if self.matches:
+            self.listbox.focus_set()
+            self.listbox.selection_set(0)
+
+    def _choose(self):
+        selection = self.listbox.curselection()
+        if not selection:
+            return
+        self.select(self.matches[selection[0]])
+
+    def select(self, row):
+        self.vendor_id = row[0]
+        self.text_var.set(f"{row[1]} ({row[0]})")
+        self.listbox.pack_forget()
+        if self.on_select:
+            self.on_select(row)
+
+    @property
+    def selected(self):
+        """The picked vendor's row, re-read by key, or None."""
+        return self.directory.get(self.vendor_id) if self.vendor_id else None
+
+# ----------------------------------------------------
+# Data Access (Repository)
+# ----------------------------------------------------
+# Screen actions read through a Repository: result sets are fetched with one query and the
+# vendors they reference with one IN lookup, instead of a query per row. Vendor rows live in
+# the directory's identity map for the session; any write on its connection drops it, and so
+# does a commit from any other connection (seen through PRAGMA data_version). count_queries()
+# records the statements an action runs, which `benchmark.py queries` uses to check that each
+# action's query count does not grow with the number of rows.
+# SQLite's default limit on bound parameters is 999; larger key sets are fetched in chunks.
+SQLITE_MAX_PARAMS = 900
+
+def fetch_vendors(db, vendor_ids):
+    """{vendor_id: (vendor_id, vendor_name, vendor_address, po_number)} for the keys that exist."""
+    ids = [v for v in dict.fromkeys(vendor_ids) if v is not None]
+    found = {}
+    for start in range(0, len(ids), SQLITE_MAX_PARAMS):
+        chunk = ids[start:start + SQLITE_MAX_PARAMS]
+        for row in db.execute("SELECT vendor_id, vendor_name, vendor_address, po_number FROM vendors "
+                              f"WHERE vendor_id IN ({','.join('?' * len(chunk))})", chunk):
+            found.setdefault(row[0], row)
+    return found
+
+@contextlib.contextmanager
+def count_queries(db):
+    """Collects the SQL statements run on db inside the block (trigger bodies excluded)."""
+    statements = []
+    db.set_trace_callback(lambda sql: None if sql.startswith("--") else statements.append(sql))
+    try:
+        yield statements
+    finally:
+        db.set_trace_callback(None)
+
+class Repository:
+    """
+    Session data access over one connection. `vendors` is the VendorDirectory used by the
+    pickers and doubles as the vendor identity map.
+    """
+    def __init__(self, db):
+        self.db = db
+        self.vendors = VendorDirectory(db)
 
-    doc.build(elements, onFirstPage=add_page_header_footer, onLaterPages=add_page_header_footer)
+    def vendor(self, vendor_id):
+        return self.vendors.get(vendor_id) if vendor_id else None
 
+    def add_vendor(self, vendor_id, vendor_name, vendor_address, po_number):
+        with self.db:
+            self.db.execute("INSERT INTO vendors (vendor_id, vendor_name, vendor_address, po_number) VALUES (?,?,?,?)",
+                            (vendor_id, vendor_name, vendor_address, po_number))
 
+    def search_invoices(self, invoice_no="", vendor_name="", invoice_date=""):
+        """
+        Report search: rows (id, vendor_id, invoice_no, invoice_date, invoice_type, po_mr_no,
+        excel_file, amount_cents) matching every filter given, read from the archives for a dated search.
+        """
+        query = ("SELECT i.id, i.vendor_id, i.invoice_no, i.invoice_date, i.invoice_type, i.po_mr_no, i.excel_file, "
+                 "i.amount_cents FROM {source} i")
+        params = []
+        conditions = []
+        if invoice_no:
+            conditions.append("i.invoice_no LIKE ?")
+            params.append(f"%{invoice_no}%")
+        if vendor_name:
+            query += " JOIN vendors v ON i.vendor_id = v.vendor_id"
+            conditions.append("v.vendor_name LIKE ?")
+            params.append(f"%{vendor_name}%")
+        if invoice_date:
+            conditions.append("i.invoice_date = ?")
+            params.append(invoice_date)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        with invoice_source(self.db, invoice_date or None, invoice_date or None) as source:
+            return self.db.execute(query.format(source=source), params).fetchall()
 
+    def invoices(self, sql, params, date_range=(None, None)):
+        """Runs an invoice query whose FROM is "{source}" over the live table and the needed archives."""
+        with invoice_source(self.db, *date_range) as source:
+            return self.db.execute(sql.format(source=source), params).fetchall()
 
+    def report_transactions(self, rows):
+        """
+        Transactions for search_invoices rows, named after their vendor, at their stored amount.
+        Only invoices saved before amounts were stored have their workbook read for the total;
+        unreadable ones are skipped.
+        """
+        vendors = self.vendors.get_many(r[1] for r in rows)
+        transactions = []
+        for inv_id, vendor_id, inv_no, inv_date, inv_type, _, excel_file, cents in rows:
+            if cents is not None:
+                total_amt = cents / 100
+            else:
+                try:
+                    total_amt = excel_total(excel_file)
+                except Exception:
+                    continue
+            vendor = vendors.get(vendor_id)
+            transactions.append(Transaction.from_invoice(inv_date, inv_no, vendor[1] if vendor else "", inv_type, total_amt))
+        return transactions
+
+    def bundle_rows(self, rows):
+        """search_invoices rows as render_invoice_bundle rows, with the vendor name and address."""
+        vendors = self.vendors.get_many(r[1] for r in rows)
+        bundle = []
+        for _, vendor_id, inv_no, inv_date, inv_type, po_mr_no, excel_file, _ in rows:
+            vendor = vendors.get(vendor_id) or (vendor_id, "", "", "")
+            bundle.append((vendor[1], vendor[2], inv_no, inv_date, inv_type, po_mr_no, excel_file))
+        return bundle
 
-def create_soa_pdf_modified(output_path, soa_info, invoices_data):
-    """
-    Generates an SOA PDF similar to invoice PDF but with SOA header details.
-    invoices_data is a list of tuples: (invoice_date, invoice_no, Name, debit, credit)
-    The table is built with our new format.
-    """
-    doc = SimpleDocTemplate(output_path, pagesize=A4, topMargin=90, bottomMargin=90)
-    elements = []
-    styles = getSampleStyleSheet()
-    normal_style = ParagraphStyle('normal_style', parent=styles['Normal'], fontName='Helvetica', fontSize=10, leading=12)
-    
-    # Header with statement details
-    header_text = f"""
-    <para align=center>
-    <b>Statement Date:</b> {soa_info.get('statement_date','')} &nbsp;&nbsp;&nbsp;
-    <b>Due Date:</b> {soa_info.get('due_date','')}
-    </para>
-    """
-    elements.append(Paragraph(header_text, normal_style))
-    elements.append(Spacer(1, 10))
-    company_details = f"""
-    <para align=center>
-    <font color="darkblue"><b>STATEMENT OF ACCOUNT</b><br/>
-    {soa_info.get('company_name','')}<br/>
-    {soa_info.get('company_address','')}</font>
-    </para>
-    """
-    elements.append(Paragraph(company_details, styles['Title']))
-    elements.append(Spacer(1, 15))
-    
-    # Build table from invoices_data (same new table format)
-    aging = compute_aging(invoices_data)
-    create_report_table_pdf(output_path, "Statement of Account", invoices_data, balance_bf=0.0, aging_summary=aging)
-    # Note: In a complete solution, you might want to merge multiple invoices into one table.
-    # Here we assume invoices_data is already the merged list.
-    
 # ----------------------------------------------------
 # Main Application (Single Window with Frames)
 # ----------------------------------------------------
@@ -704,6 +4334,10 @@ class MainApp(ctk.CTk):
         self.btn_report.pack(side="left", padx=5, pady=5)
         self.btn_soa = ctk.CTkButton(nav_frame, text="SOA Reports", command=self.show_soa_frame)
         self.btn_soa.pack(side="left", padx=5, pady=5)
+        self.btn_aging = ctk.CTkButton(nav_frame, text="Aging Overview", command=self.show_aging_frame)
+        self.btn_aging.pack(side="left", padx=5, pady=5)
+        self.btn_maintenance = ctk.CTkButton(nav_frame, text="Maintenance", command=self.show_maintenance_frame)
+        self.btn_maintenance.pack(side="left", padx=5, pady=5)
 
         # Main Content Area (Frames)
         self.content_frame = ctk.CTkFrame(self, corner_radius=0)
@@ -712,16 +4346,26 @@ class MainApp(ctk.CTk):
         self.invoice_frame = ctk.CTkFrame(self.content_frame)
         self.report_frame = ctk.CTkFrame(self.content_frame)
         self.soa_frame = ctk.CTkFrame(self.content_frame)
-        for f in (self.supplier_frame, self.invoice_frame, self.report_frame, self.soa_frame):
+        self.aging_frame = ctk.CTkFrame(self.content_frame)
+        self.maintenance_frame = ctk.CTkFrame(self.content_frame)
+        for f in (self.supplier_frame, self.invoice_frame, self.report_frame, self.soa_frame, self.aging_frame,
+                  self.maintenance_frame):
             f.place(in_=self.content_frame, x=0, y=0, relwidth=1, relheight=1)
 
+        self.repo = Repository(conn)
+        # Assembled SOA/report transaction sets, dropped when the vendor's invoices change
+        self.query_cache = QueryResultCache()
+
         # Build Frames
         self.build_supplier_frame()
         self.build_invoice_frame()
         self.build_report_frame()
         self.build_soa_frame()
+        self.build_aging_frame()
+        self.build_maintenance_frame()
 
         self.show_supplier_frame()
+        self.schedule_backups()
 
     def show_frame(self, frame: ctk.CTkFrame):
         frame.lift()
@@ -767,9 +4411,7 @@ class MainApp(ctk.CTk):
         if not vid or not vname or not vaddr or not vpo:
             messagebox.showerror("Error", "All fields are required.")
             return
-        cursor.execute("INSERT INTO vendors (vendor_id, vendor_name, vendor_address, po_number) VALUES (?,?,?,?)",
-                       (vid, vname, vaddr, vpo))
-        conn.commit()
+        self.repo.add_vendor(vid, vname, vaddr, vpo)
         messagebox.showinfo("Success", "Vendor added successfully.")
         self.vendor_id_entry.delete(0, tk.END)
         self.vendor_name_entry.delete(0, tk.END)
@@ -781,16 +4423,11 @@ class MainApp(ctk.CTk):
     # -----------------------------
     def build_invoice_frame(self):
         tk.Label(self.invoice_frame, text="Invoice Creation", font=("Arial", 18, "bold")).pack(pady=10)
-        cursor.execute("SELECT vendor_name, vendor_id, vendor_address, po_number FROM vendors")
-        self.vendors = cursor.fetchall()
-        vendor_names = [v[0] for v in self.vendors]
         form_frame = tk.Frame(self.invoice_frame)
         form_frame.pack(pady=10)
-        tk.Label(form_frame, text="Select Vendor:").grid(row=0, column=0, padx=5, pady=5, sticky="w")
-        self.vendor_var = tk.StringVar()
-        self.vendor_dropdown = ctk.CTkOptionMenu(form_frame, values=vendor_names, variable=self.vendor_var)
-        self.vendor_dropdown.grid(row=0, column=1, padx=5, pady=5, sticky="w")
-        self.vendor_var.trace("w", self.fill_vendor_details)
+        tk.Label(form_frame, text="Select Vendor:").grid(row=0, column=0, padx=5, pady=5, sticky="nw")
+        self.vendor_picker = VendorPicker(form_frame, self.repo.vendors, on_select=self.fill_vendor_details)
+        self.vendor_picker.grid(row=0, column=1, padx=5, pady=5, sticky="w")
         tk.Label(form_frame, text="Vendor Name:").grid(row=1, column=0, padx=5, pady=5, sticky="w")
         self.invoice_vendor_name_var = tk.StringVar()
         tk.Entry(form_frame, textvariable=self.invoice_vendor_name_var, width=40, state="readonly").grid(row=1, column=1, padx=5, pady=5)
@@ -811,10 +4448,13 @@ class MainApp(ctk.CTk):
         self.invoice_date_entry.grid(row=7, column=1, padx=5, pady=5)
         self.include_seal_var = tk.BooleanVar(value=True)
         tk.Checkbutton(form_frame, text="Include Seal", variable=self.include_seal_var).grid(row=8, column=1, padx=5, pady=5, sticky="w")
+        self.force_render_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(form_frame, text="Force Re-render", variable=self.force_render_var).grid(row=8, column=2, padx=5, pady=5, sticky="w")
         tk.Label(form_frame, text="Excel File:").grid(row=9, column=0, padx=5, pady=5, sticky="w")
-        excel_file_var = tk.StringVar()
+        self.excel_file_var = tk.StringVar()
+        excel_file_var = self.excel_file_var
         def browse_excel():
-            path = filedialog.askopenfilename(filetypes=[("Excel Files", "*.xlsx *.xls")])
+            path = filedialog.askopenfilename(filetypes=[("Spreadsheets", "*.xlsx *.xlsm *.xls *.ods *.csv")])
             if path:
                 excel_file_var.set(path)
                 edited_df = open_excel_editor(path, form_frame)
@@ -823,52 +4463,40 @@ class MainApp(ctk.CTk):
         tk.Label(form_frame, text="Excel File:").grid(row=9, column=0, padx=5, pady=5, sticky="w")
         tk.Entry(form_frame, textvariable=excel_file_var, width=40).grid(row=9, column=1, padx=5, pady=5)
         tk.Button(form_frame, text="Browse", command=browse_excel).grid(row=9, column=2, padx=5, pady=5)
+        self.output_profile_var, self.grayscale_var = self.add_profile_selector(form_frame, 10)
         self.progress_label = tk.Label(self.invoice_frame, text="", fg="green", font=("Helvetica", 10))
         self.progress_label.pack(pady=5)
-        tk.Button(self.invoice_frame, text="Generate Invoice", command=self.generate_invoice).pack(pady=15)
-
-    def fill_vendor_details(self, *args):
-        selected = self.vendor_var.get()
-        for v in self.vendors:
-            if v[0] == selected:
-                self.invoice_vendor_name_var.set(v[0])
-                self.invoice_vendor_id_var.set(v[1])
-                self.invoice_vendor_address_var.set(v[2])
-                break
+        btn_frame = tk.Frame(self.invoice_frame)
+        btn_frame.pack(pady=15)
+        tk.Button(btn_frame, text="Preview", command=self.preview_invoice).pack(side="left", padx=5)
+        tk.Button(btn_frame, text="Generate Invoice", command=self.generate_invoice).pack(side="left", padx=5)
+
+    def fill_vendor_details(self, vendor):
+        vendor_id, vendor_name, vendor_address, _ = vendor
+        self.invoice_vendor_name_var.set(vendor_name)
+        self.invoice_vendor_id_var.set(vendor_id)
+        self.invoice_vendor_address_var.set(vendor_address)
 
     def browse_excel(self):
-        path = filedialog.askopenfilename(filetypes=[("Excel Files", "*.xlsx *.xls")])
+        path = filedialog.askopenfilename(filetypes=[("Spreadsheets", "*.xlsx *.xlsm *.xls *.ods *.csv")])
         if path:
             self.excel_file_var.set(path)
             # Optionally, you can allow editing via a pop-up editor if needed.
             # For now we simply store the file path.
     
-    def generate_invoice(self):
-        self.progress_label.config(text="Generating Invoice...")
-        self.update_idletasks()
+    def invoice_form_details(self):
+        """Reads the invoice form into (vendor_id, input_details), or reports what is missing and returns None."""
         vendor_name = self.invoice_vendor_name_var.get()
         vendor_id = self.invoice_vendor_id_var.get()
         vendor_address = self.invoice_vendor_address_var.get()
-        cursor.execute("SELECT po_number FROM vendors WHERE vendor_id=?", (vendor_id,))
-        row = cursor.fetchone()
-        vendor_po = row[0] if row else ""
+        row = self.repo.vendor(vendor_id)
+        vendor_po = row[3] if row else ""
         invoice_type = self.invoice_type_entry.get().strip()
         invoice_no = self.invoice_no_entry.get().strip()
         invoice_date = self.invoice_date_entry.get()
         if not vendor_name or not invoice_no or not self.excel_file_var.get():
             messagebox.showerror("Error", "Vendor, Invoice No, and Excel file are required.")
-            self.progress_label.config(text="")
-            return
-        try:
-            df_processed, total_amount = process_excel_file(self.excel_file_var.get())
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
-            self.progress_label.config(text="")
-            return
-        output_path = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF Files", "*.pdf")])
-        if not output_path:
-            self.progress_label.config(text="")
-            return
+            return None
         input_details = {
             "vendor_name": vendor_name,
             "vendor_address": vendor_address,
@@ -877,17 +4505,115 @@ class MainApp(ctk.CTk):
             "invoice_no": invoice_no,
             "invoice_date": invoice_date
         }
+        return vendor_id, input_details
+
+    def add_profile_selector(self, form_frame, row):
+        """Adds the output profile menu and grayscale checkbox on `row`; returns their variables."""
+        tk.Label(form_frame, text="Output Profile:").grid(row=row, column=0, padx=5, pady=5, sticky="w")
+        profile_var = tk.StringVar(value=DEFAULT_OUTPUT_PROFILE)
+        ctk.CTkOptionMenu(form_frame, values=list(OUTPUT_PROFILES), variable=profile_var).grid(row=row, column=1, padx=5, pady=5, sticky="w")
+        grayscale_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(form_frame, text="Grayscale", variable=grayscale_var).grid(row=row, column=2, padx=5, pady=5, sticky="w")
+        return profile_var, grayscale_var
+
+    def generate_invoice(self, counts=None):
+        """Renders and records the invoice; `counts` is the preview's (rows, sheets), which sizes the plan."""
+        self.progress_label.config(text="Generating Invoice...")
+        self.update_idletasks()
+        form = self.invoice_form_details()
+        if form is None:
+            self.progress_label.config(text="")
+            return
+        vendor_id, input_details = form
+        output_path = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF Files", "*.pdf")])
+        if not output_path:
+            self.progress_label.config(text="")
+            return
         try:
-            create_invoice_pdf(output_path, input_details,df_processed, total_amount)
-            cursor.execute("INSERT INTO invoices (vendor_id, invoice_no, invoice_date, invoice_type, po_mr_no, excel_file) VALUES (?,?,?,?,?,?)",
-                           (vendor_id, invoice_no, invoice_date, invoice_type, vendor_po, self.excel_file_var.get()))
-            conn.commit()
-            self.progress_label.config(text="Invoice Generated Successfully!")
+            excel_path = self.excel_file_var.get()
+            signature = source_signature(excel_path)
+            # Sized from the workbook's metadata before it is read (or from the preview's counts)
+            rows, sheets = counts or (None, 1)
+            plan = plan_invoice_render(excel_path, rows, sheets, db=conn)
+            with contextlib.ExitStack() as stack:
+                ingested = execute_plan(plan, lambda: ingest_invoice_workbook(excel_path, plan["strategy"], stack))
+                line_keys = ingested_line_keys(ingested)
+                billed = find_billed_lines(conn, vendor_id, line_keys, input_details["invoice_date"], input_details["invoice_no"])
+                if billed and not messagebox.askyesno(
+                        "Possible Duplicates",
+                        f"{len(billed)} line(s) were already billed to this vendor in the last {DUPLICATE_LOOKBACK_DAYS} days:\n\n"
+                        f"{format_billed_lines(billed)}\n\nGenerate the invoice anyway?"):
+                    self.progress_label.config(text="")
+                    return
+                self.progress_label.config(text=f"Generating Invoice... {format_plan(plan)}")
+                self.update_idletasks()
+                meta, hit = execute_plan(plan, lambda: render_invoice_document(
+                    output_path, input_details, excel_path, include_seal=self.include_seal_var.get(),
+                    force=self.force_render_var.get(), ingested=ingested, profile=self.output_profile_var.get(),
+                    grayscale=self.grayscale_var.get(), strategy=plan["strategy"], workers=plan["workers"]))
+            with conn:
+                record_invoice(conn, vendor_id, input_details, excel_path, to_cents(meta["total"]), signature, line_keys)
+                if not hit:
+                    plan["actual_rows"] = ingested_rows(ingested)
+                    log_execution_plan(conn, plan)
+            status = "Invoice reprinted from cache." if hit else "Invoice Generated Successfully!"
+            stats = format_render_stats(meta)
+            self.progress_label.config(text=f"{status} ({stats}; {format_plan(plan)})" if stats and not hit else status)
             messagebox.showinfo("Success", "Invoice PDF generated and saved.")
         except Exception as e:
             self.progress_label.config(text="")
             messagebox.showerror("Error", f"Failed to generate invoice: {e}")
 
+    def preview_invoice(self):
+        """
+        Lays out only the first page (header boxes, first rows, totals) and shows it in a window.
+        Only the first rows are read into memory; the total comes from a streaming pass. The full
+        render runs only when the operator confirms, ingesting the way its plan picks.
+        """
+        form = self.invoice_form_details()
+        if form is None:
+            return
+        _, input_details = form
+        self.progress_label.config(text="Preparing preview...")
+        self.update_idletasks()
+        try:
+            df, total, sections, line_count = read_invoice_preview(self.excel_file_var.get())
+            counts = (line_count, len(sections))
+            pdf_bytes = render_invoice_preview(input_details, df, total, self.include_seal_var.get(), sections,
+                                               line_count=line_count)
+        except Exception as e:
+            self.progress_label.config(text="")
+            messagebox.showerror("Error", f"Failed to build preview: {e}")
+            return
+        self.progress_label.config(text="")
+        image = rasterize_first_page(pdf_bytes)
+        if image is None:
+            # No rasteriser installed: hand the one-page PDF to the system viewer instead
+            fd, preview_path = tempfile.mkstemp(prefix="invoice-preview-", suffix=".pdf")
+            with os.fdopen(fd, "wb") as f:
+                f.write(pdf_bytes)
+            webbrowser.open(preview_path)
+            if messagebox.askyesno("Preview", "Generate the full invoice now?"):
+                self.generate_invoice(counts)
+            return
+
+        from PIL import ImageTk
+        popup = tk.Toplevel(self)
+        popup.title(f"Preview - Invoice {input_details['invoice_no']}")
+        photo = ImageTk.PhotoImage(image)
+        label = tk.Label(popup, image=photo)
+        label.image = photo
+        label.pack(padx=10, pady=10)
+
+        def confirm():
+            popup.destroy()
+            self.generate_invoice(counts)
+
+        btn_frame = tk.Frame(popup)
+        btn_frame.pack(pady=5)
+        tk.Button(btn_frame, text="Confirm & Generate", command=confirm).pack(side="left", padx=5)
+        tk.Button(btn_frame, text="Cancel", command=popup.destroy).pack(side="left", padx=5)
+
     # -----------------------------
     # 3) Invoice Reports Frame
     # -----------------------------
@@ -914,7 +4640,12 @@ class MainApp(ctk.CTk):
         
         tk.Button(filter_frame, text="Search", command=self.search_invoices).grid(row=3, column=1, padx=5, pady=5, sticky="e")
         tk.Button(filter_frame, text="Select Transactions", command=self.select_transactions).grid(row=4, column=1, padx=5, pady=15)
+        tk.Button(filter_frame, text="Bundle Selected Invoices PDF", command=self.generate_invoice_bundle).grid(row=4, column=2, padx=5, pady=15)
         tk.Button(filter_frame, text="Generate Invoice Report PDF", command=self.generate_invoice_report_pdf).grid(row=7, column=1, padx=5, pady=15)
+        tk.Button(filter_frame, text="Export Report (Excel/CSV)", command=self.export_invoice_report).grid(row=7, column=3, padx=5, pady=15)
+        self.report_force_render_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(filter_frame, text="Force Re-render", variable=self.report_force_render_var).grid(row=7, column=2, padx=5, pady=15, sticky="w")
+        self.report_profile_var, self.report_grayscale_var = self.add_profile_selector(filter_frame, 8)
         
         # Treeview for search results (populated by search_invoices)
         tk.Label(self.report_frame, text="Search Results:").pack()
@@ -931,6 +4662,9 @@ class MainApp(ctk.CTk):
         for col in ("date", "invoice_no", "Name", "debit", "credit"):
             self.selected_report_tree.heading(col, text=col.capitalize())
             self.selected_report_tree.column(col, width=100)
+        # The trees only display rows; the typed records live in these maps keyed by tree item
+        self.report_rows = {}
+        self.selected_transactions = {}
 
     def search_invoices(self):
         # Clear previous search results
@@ -939,30 +4673,18 @@ class MainApp(ctk.CTk):
         invoice_no = self.report_invoice_no_var.get().strip()
         vendor_name = self.report_vendor_name_var.get().strip()
         date_filter = self.report_date_entry.get().strip()
-        query = "SELECT i.id, i.vendor_id, i.invoice_no, i.invoice_date, i.invoice_type, i.po_mr_no, i.excel_file FROM invoices i"
-        params = []
-        conditions = []
-        if invoice_no:
-            conditions.append("i.invoice_no LIKE ?")
-            params.append(f"%{invoice_no}%")
-        if vendor_name:
-            query += " JOIN vendors v ON i.vendor_id = v.vendor_id"
-            conditions.append("v.vendor_name LIKE ?")
-            params.append(f"%{vendor_name}%")
-        if date_filter:
-            conditions.append("i.invoice_date = ?")
-            params.append(date_filter)
-        if conditions:
-            query += " WHERE " + " AND ".join(conditions)
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
+        rows = self.repo.search_invoices(invoice_no, vendor_name, date_filter)
+        # Keep the typed SQL rows by tree item so later steps don't read back display strings
+        self.report_rows = {}
         for r in rows:
-            self.report_tree.insert("", tk.END, values=r)
+            # The tree shows the first seven fields; amount_cents only feeds the report
+            self.report_rows[self.report_tree.insert("", tk.END, values=r[:7])] = r
 
     def select_transactions(self):
         """
         Opens a pop-up window showing the search results (from self.report_tree).
-        For each row, it processes the associated Excel file to obtain the transaction total.
+        For each row, it takes the stored invoice amount (reading the Excel file only for
+        invoices saved before amounts were stored).
         It then looks up the vendor name (via vendor_id) to fill in the Name column.
         The user selects the rows they want to include, and these rows are added to the 
         main Selected Transactions tree (self.selected_report_tree).
@@ -972,34 +4694,17 @@ class MainApp(ctk.CTk):
             messagebox.showerror("Error", "No search results available.")
             return
 
-        # Build a temporary list of processed rows from search results.
-        processed_rows = []
-        for item in search_rows:
-            vals = self.report_tree.item(item, "values")
-            # Expected format: (id, vendor_id, invoice_no, invoice_date, invoice_type, po_mr_no, excel_file)
-            inv_id, vendor_id, inv_no, inv_date, inv_type, _, excel_file = vals
-            try:
-                # Process the Excel file to get the total amount.
-                _, total_amt = process_excel_file(excel_file)
-            except Exception as e:
-                continue  # Skip rows that cannot be processed
-            
-            # Lookup the vendor name from the vendors table
-            cursor.execute("SELECT vendor_name FROM vendors WHERE vendor_id=?", (vendor_id,))
-            vendor_row = cursor.fetchone()
-            vendor_name = vendor_row[0] if vendor_row else ""
-            
-            # Based on invoice type, assign amount to Debit or Credit.
-            if inv_type.lower() == "credit":
-                debit_val = total_amt
-                credit_val = 0.0
-            else:
-                debit_val = 0.0
-                credit_val = total_amt
-            
-            # Now, use vendor_name as the Name column.
-            processed_rows.append((inv_date, inv_no, vendor_name, debit_val, credit_val))
-        
+        # (id, vendor_id, invoice_no, invoice_date, invoice_type, po_mr_no, excel_file, amount_cents) as fetched
+        rows = tuple(self.report_rows[item] for item in search_rows)
+        # Results can span vendors, so the set is checked against every vendor's generation;
+        # on a miss the vendor names come from one batched lookup. Only invoices without a stored
+        # amount are read from their workbook, so only those workbooks are checked on a hit.
+        read_paths = [r[6] for r in rows if r[7] is None]
+        _, transactions = self.query_cache.get(
+            conn, None, ("report", rows),
+            lambda: (workbook_digests(read_paths), self.repo.report_transactions(rows)),
+            check=lambda value: value[0] == workbook_digests(read_paths))
+
         # Create a pop-up for selection.
         popup = tk.Toplevel(self)
         popup.title("Select Transactions")
@@ -1009,8 +4714,9 @@ class MainApp(ctk.CTk):
         for col in ("date", "invoice_no", "Name", "debit", "credit"):
             sel_tree.heading(col, text=col.capitalize())
             sel_tree.column(col, width=100)
-        for row in processed_rows:
-            sel_tree.insert("", tk.END, values=row)
+        popup_transactions = {}
+        for txn in transactions:
+            popup_transactions[sel_tree.insert("", tk.END, values=txn.display_values())] = txn
         
         def add_selection():
             selected = sel_tree.selection()
@@ -1018,8 +4724,8 @@ class MainApp(ctk.CTk):
                 messagebox.showerror("Error", "No rows selected.")
                 return
             for item in selected:
-                row_data = sel_tree.item(item, "values")
-                self.selected_report_tree.insert("", tk.END, values=row_data)
+                txn = popup_transactions[item]
+                self.selected_transactions[self.selected_report_tree.insert("", tk.END, values=txn.display_values())] = txn
             popup.destroy()
         
         tk.Button(popup, text="Add Selected Rows", command=add_selection).pack(pady=10)
@@ -1034,35 +4740,74 @@ class MainApp(ctk.CTk):
         if not rows:
             messagebox.showerror("Error", "No transactions selected for report.")
             return
-        report_data = []
-        for item in rows:
-            vals = self.selected_report_tree.item(item, "values")
-            # Expected format: (date, invoice_no, Name, debit, credit)
-            report_data.append(vals)
+        report_data = [self.selected_transactions[item] for item in rows]
         aging = compute_aging(report_data)
         output_path = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF Files", "*.pdf")])
         if not output_path:
             return
+        profile, grayscale = self.report_profile_var.get(), self.report_grayscale_var.get()
+        fingerprint = render_fingerprint("report", {
+            "rows": [(t.date_text, t.invoice_no, t.name, t.debit, t.credit) for t in report_data],
+            "as_of": date.today(),
+        }, profile=profile, grayscale=grayscale)
+
+        def render():
+            started = perf_counter()
+            create_report_table_pdf(output_path, "Invoice Report", report_data, balance_bf=0.0, aging_summary=aging,
+                                    profile=profile, grayscale=grayscale)
+            return render_stats(output_path, started)
+
         try:
-            create_report_table_pdf(output_path, "Invoice Report", report_data, balance_bf=0.0, aging_summary=aging)
-            messagebox.showinfo("Success", "Invoice Report PDF generated successfully.")
+            meta, hit = cached_render(fingerprint, output_path, render, force=self.report_force_render_var.get())
+            stats = "" if hit else format_render_stats(meta)
+            messagebox.showinfo("Success", "Invoice Report PDF generated successfully." + (f"\n{stats}" if stats else ""))
         except Exception as e:
             messagebox.showerror("Error", f"Failed to generate PDF: {e}")
 
+    def export_invoice_report(self):
+        """Writes the Selected Transactions ledger to XLSX/CSV instead of a PDF."""
+        rows = self.selected_report_tree.get_children()
+        if not rows:
+            messagebox.showerror("Error", "No transactions selected for report.")
+            return
+        output_path = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=LEDGER_EXPORT_TYPES)
+        if not output_path:
+            return
+        try:
+            result = export_ledger(output_path, "Invoice Report", (self.selected_transactions[item] for item in rows))
+            messagebox.showinfo("Success", f"Invoice Report exported ({result['rows']:,} rows).")
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to export report: {e}")
+
+    def generate_invoice_bundle(self):
+        """Renders the invoices selected in the search results into one bookmarked PDF."""
+        selected = self.report_tree.selection() or self.report_tree.get_children()
+        if not selected:
+            messagebox.showerror("Error", "No search results available.")
+            return
+        output_path = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF Files", "*.pdf")])
+        if not output_path:
+            return
+        rows = self.repo.bundle_rows([self.report_rows[item] for item in selected])
+        try:
+            started = perf_counter()
+            render_invoice_bundle(output_path, rows, profile=self.report_profile_var.get(),
+                                  grayscale=self.report_grayscale_var.get())
+            stats = format_render_stats(render_stats(output_path, started))
+            messagebox.showinfo("Success", f"Bundle of {len(rows)} invoice(s) generated.\n{stats}")
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to generate bundle: {e}")
+
     # -----------------------------
     # 4) SOA Reports Frame
     # -----------------------------
     def build_soa_frame(self):
         tk.Label(self.soa_frame, text="SOA Reports", font=("Arial", 18, "bold")).pack(pady=10)
-        cursor.execute("SELECT vendor_name, vendor_id, vendor_address FROM vendors")
-        self.soa_vendors = cursor.fetchall()
-        vendor_names = [v[0] for v in self.soa_vendors]
         form_frame = tk.Frame(self.soa_frame)
         form_frame.pack(pady=10)
-        tk.Label(form_frame, text="Select Vendor:").grid(row=0, column=0, padx=5, pady=5, sticky="w")
-        self.soa_vendor_var = tk.StringVar()
-        self.soa_vendor_dropdown = ctk.CTkOptionMenu(form_frame, values=vendor_names, variable=self.soa_vendor_var)
-        self.soa_vendor_dropdown.grid(row=0, column=1, padx=5, pady=5, sticky="w")
+        tk.Label(form_frame, text="Select Vendor:").grid(row=0, column=0, padx=5, pady=5, sticky="nw")
+        self.soa_vendor_picker = VendorPicker(form_frame, self.repo.vendors, width=220)
+        self.soa_vendor_picker.grid(row=0, column=1, columnspan=2, padx=5, pady=5, sticky="w")
         self.filter_method = tk.StringVar(value="date")
         tk.Label(form_frame, text="Filter By:").grid(row=1, column=0, padx=5, pady=5, sticky="w")
         tk.Radiobutton(form_frame, text="Date Range", variable=self.filter_method, value="date").grid(row=1, column=1, sticky="w")
@@ -1082,23 +4827,29 @@ class MainApp(ctk.CTk):
         self.soa_invoice_count.grid(row=5, column=1, padx=5, pady=5, sticky="w")
         self.soa_include_seal_var = tk.BooleanVar(value=True)
         tk.Checkbutton(form_frame, text="Include Seal", variable=self.soa_include_seal_var).grid(row=6, column=1, padx=5, pady=5, sticky="w")
-        tk.Button(form_frame, text="Generate SOA", command=self.generate_soa).grid(row=7, column=1, padx=5, pady=15)
+        self.soa_force_render_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(form_frame, text="Force Re-render", variable=self.soa_force_render_var).grid(row=6, column=2, padx=5, pady=5, sticky="w")
+        self.soa_profile_var, self.soa_grayscale_var = self.add_profile_selector(form_frame, 7)
+        tk.Button(form_frame, text="Generate SOA", command=self.generate_soa).grid(row=8, column=1, padx=5, pady=15)
+        tk.Button(form_frame, text="Batch SOA (All Vendors)", command=self.generate_soa_batch).grid(row=8, column=2, padx=5, pady=15)
+        tk.Button(form_frame, text="Export SOA (Excel/CSV)", command=self.export_soa).grid(row=8, column=3, padx=5, pady=15)
+        self.soa_progress_label = tk.Label(self.soa_frame, text="", fg="green", font=("Helvetica", 10))
+        self.soa_progress_label.pack(pady=5)
 
-    def generate_soa(self):
-        selected_vendor = self.soa_vendor_var.get()
-        if not selected_vendor:
+    def soa_query(self, columns):
+        """
+        Builds the SOA invoice query from the form: returns (soa_info, sql, params, date_range)
+        selecting `columns`, or None after reporting a missing/invalid filter. The sql reads from
+        "{source}", to be filled in from invoice_source(conn, *date_range).
+        """
+        if not self.soa_vendor_picker.vendor_id:
             messagebox.showerror("Error", "Please select a vendor.")
             return
-        vendor_id = None
-        vendor_address = ""
-        for v in self.soa_vendors:
-            if v[0] == selected_vendor:
-                vendor_id = v[1]
-                vendor_address = v[2]
-                break
-        if not vendor_id:
+        vendor = self.soa_vendor_picker.selected
+        if vendor is None:
             messagebox.showerror("Error", "Vendor not found in DB.")
             return
+        vendor_id, selected_vendor, vendor_address, _ = vendor
         soa_info = {
             "statement_date": self.soa_from_date_entry.get(),
             "due_date": self.soa_to_date_entry.get(),
@@ -1115,10 +4866,9 @@ class MainApp(ctk.CTk):
             except:
                 messagebox.showerror("Error", "Invalid date format.")
                 return
-            cursor.execute(
-                "SELECT invoice_no, invoice_date, invoice_type, excel_file FROM invoices WHERE vendor_id=? AND invoice_date BETWEEN ? AND ?",
-                (vendor_id, from_date, to_date)
-            )
+            sql = f"SELECT {columns} FROM {{source}} WHERE vendor_id=? AND invoice_date BETWEEN ? AND ?"
+            params = (vendor_id, from_date, to_date)
+            date_range = (from_date, to_date)
         elif filter_type == "invoice":
             invoice_nums = self.soa_invoice_nums.get().strip()
             if not invoice_nums:
@@ -1126,54 +4876,686 @@ class MainApp(ctk.CTk):
                 return
             invoice_list = tuple(item.strip() for item in invoice_nums.split(",") if item.strip())
             placeholders = ",".join("?" * len(invoice_list))
-            query = f"SELECT invoice_no, invoice_date, invoice_type, excel_file FROM invoices WHERE vendor_id=? AND invoice_no IN ({placeholders})"
-            cursor.execute(query, (vendor_id, *invoice_list))
+            sql = f"SELECT {columns} FROM {{source}} WHERE vendor_id=? AND invoice_no IN ({placeholders})"
+            params = (vendor_id, *invoice_list)
+            date_range = (None, None)
         elif filter_type == "count":
             count_str = self.soa_invoice_count.get().strip()
             if not count_str.isdigit():
                 messagebox.showerror("Error", "Please enter a valid invoice count.")
                 return
             count = int(count_str)
-            cursor.execute(
-                "SELECT invoice_no, invoice_date, invoice_type, excel_file FROM invoices WHERE vendor_id=? ORDER BY invoice_date DESC LIMIT ?",
-                (vendor_id, count)
-            )
+            sql = f"SELECT {columns} FROM {{source}} WHERE vendor_id=? ORDER BY invoice_date DESC LIMIT ?"
+            params = (vendor_id, count)
+            date_range = (None, None)
         else:
             messagebox.showerror("Error", "Invalid filter method.")
             return
-        invoices = cursor.fetchall()
+        return soa_info, sql, params, date_range
+
+    def generate_soa(self):
+        query = self.soa_query("invoice_no, invoice_date, invoice_type, excel_file")
+        if query is None:
+            return
+        soa_info, sql, params, date_range = query
+
+        plans = []
+
+        def build():
+            plan = plan_soa_render(conn, sql, params, date_range)
+            invoices = self.repo.invoices(sql, params, date_range)
+            # Taken before the reads, so a workbook edited meanwhile leaves the set stale
+            digests = workbook_digests(inv[3] for inv in invoices)
+            transactions = execute_plan(plan, lambda: soa_transactions(invoices, plan["workers"]))
+            plan["actual_rows"] = len(invoices)
+            with conn:
+                log_execution_plan(conn, plan)
+            plans.append(plan)
+            return invoices, transactions, digests
+
+        # params is (vendor_id, *filter values); the seal/profile options don't change the rows.
+        # Editing a workbook is no database write, so a hit also checks the workbooks' content.
+        invoices, transactions, digests = self.query_cache.get(
+            conn, params[0], ("soa", self.filter_method.get(), params[1:]), build,
+            check=lambda value: value[2] == workbook_digests(inv[3] for inv in value[0]))
         if not invoices:
             messagebox.showinfo("Info", "No invoices found for the selected criteria.")
             return
-        # For each invoice, process its Excel file to get the total amount row.
-        soa_rows = []
-        for inv in invoices:
-            inv_no, inv_date, inv_type, excel_path = inv
-            try:
-                df_proc, total_amt = process_excel_file(excel_path)
-            except:
-                continue
-            if inv_type.lower() == "credit":
-                debit_val = total_amt
-                credit_val = 0.0
-            else:
-                debit_val = 0.0
-                credit_val = total_amt
-            soa_rows.append((inv_date, inv_no, "", debit_val, credit_val))
-        # Generate SOA PDF with new table format.
+        # Generate SOA PDF with new table format; each invoice's Excel file is processed for its total.
         output_path = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF Files", "*.pdf")])
         if not output_path:
             return
         try:
-            create_soa_pdf_modified(output_path, soa_info, soa_rows)
+            meta, hit = render_soa_document(output_path, soa_info, invoices, include_seal=self.soa_include_seal_var.get(),
+                                            force=self.soa_force_render_var.get(), profile=self.soa_profile_var.get(),
+                                            grayscale=self.soa_grayscale_var.get(), transactions=transactions,
+                                            digests=digests)
+            text = "SOA reprinted from cache." if hit else f"SOA generated ({format_render_stats(meta)})"
+            self.soa_progress_label.config(text=text + "".join(f" Totals: {format_plan(plan)}" for plan in plans))
             messagebox.showinfo("Success", "SOA PDF generated successfully.")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to generate SOA: {e}")
 
+    def export_soa(self):
+        """Writes the SOA ledger to XLSX/CSV, streaming the invoices from the cursor."""
+        query = self.soa_query("invoice_no, invoice_date, invoice_type, amount_cents, excel_file")
+        if query is None:
+            return
+        soa_info, sql, params, date_range = query
+        output_path = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=LEDGER_EXPORT_TYPES)
+        if not output_path:
+            return
+        title = f"Statement of Account - {soa_info['company_name']} ({soa_info['statement_date']} to {soa_info['due_date']})"
+        try:
+            started = perf_counter()
+            # A dedicated connection so the GUI's shared cursor is not tied up by the export
+            db = sqlite3.connect(DB_FILE)
+            try:
+                with invoice_source(db, *date_range) as source:
+                    result = export_ledger(output_path, title, ledger_transactions(db.execute(sql.format(source=source), params)))
+            finally:
+                db.close()
+            self.soa_progress_label.config(text=f"SOA exported: {result['rows']:,} rows in {perf_counter() - started:.2f} s")
+            messagebox.showinfo("Success", "SOA exported successfully.")
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to export SOA: {e}")
+
+    def generate_soa_batch(self):
+        """Renders every vendor's SOA for the From/To range into a chosen folder, in the background."""
+        from_date = self.soa_from_date_entry.get()
+        to_date = self.soa_to_date_entry.get()
+        output_dir = filedialog.askdirectory(title="Folder for SOA PDFs")
+        if not output_dir:
+            return
+
+        def progress(done, total):
+            self.after(0, lambda: self.soa_progress_label.config(text=f"Batch SOA: {done}/{total} vendors"))
+
+        def work():
+            try:
+                summary = run_soa_batch(from_date, to_date, output_dir, include_seal=self.soa_include_seal_var.get(),
+                                        force=self.soa_force_render_var.get(), progress=progress,
+                                        profile=self.soa_profile_var.get(), grayscale=self.soa_grayscale_var.get())
+                self.after(0, lambda: messagebox.showinfo("Batch SOA", format_batch_summary(summary)))
+            except Exception as e:
+                self.after(0, lambda: messagebox.showerror("Error", f"Batch SOA failed: {e}"))
+
+        threading.Thread(target=work, daemon=True).start()
+
+    # -----------------------------
+    # 5) Aging Overview Frame
+    # -----------------------------
+    def build_aging_frame(self):
+        tk.Label(self.aging_frame, text="Aging Overview (All Vendors)", font=("Arial", 18, "bold")).pack(pady=10)
+        bar = tk.Frame(self.aging_frame)
+        bar.pack(pady=5)
+        tk.Button(bar, text="Refresh", command=self.refresh_aging_overview).pack(side="left", padx=5)
+        tk.Button(bar, text="Export CSV", command=self.export_aging_overview).pack(side="left", padx=5)
+        tk.Button(bar, text="Backfill Amounts", command=self.backfill_amounts).pack(side="left", padx=5)
+        self.aging_status_label = tk.Label(self.aging_frame, text="", fg="green", font=("Helvetica", 10))
+        self.aging_status_label.pack(pady=2)
+        columns = ("vendor_id", "vendor_name") + AGING_BUCKETS + ("total", "overdue")
+        self.aging_tree = ttk.Treeview(self.aging_frame, columns=columns, show="headings")
+        self.aging_tree.pack(fill="both", expand=True, padx=10, pady=10)
+        for col in columns:
+            self.aging_tree.heading(col, text=col.capitalize(), command=lambda c=col: self.sort_aging_overview(c))
+            self.aging_tree.column(col, width=90, anchor="w" if col.startswith("vendor") else "e")
+        self.aging_tree.bind("<Double-1>", self.open_aging_drilldown)
+        self.aging_sort = ("overdue", True)
+        self.aging_rows = []
+        self.backfill_running = False
+
+    def show_aging_frame(self):
+        self.refresh_aging_overview()
+        self.show_frame(self.aging_frame)
+
+    def refresh_aging_overview(self):
+        sort, descending = self.aging_sort
+        self.aging_rows = aging_overview(conn, sort, descending)
+        self.aging_tree.delete(*self.aging_tree.get_children())
+        for r in self.aging_rows:
+            self.aging_tree.insert("", tk.END, iid=r["vendor_id"], values=[r["vendor_id"], r["vendor_name"]] +
+                                   [format_cents(r[k]) for k in AGING_BUCKETS + ("total", "overdue")])
+        missing = unpriced_invoice_count(conn)
+        self.aging_status_label.config(
+            text=f"{missing} invoice(s) have no stored amount yet - use Backfill Amounts." if missing else "")
+
+    def sort_aging_overview(self, column):
+        sort, descending = self.aging_sort
+        self.aging_sort = (column, not descending if column == sort else True)
+        self.refresh_aging_overview()
+
+    def export_aging_overview(self):
+        output_path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV Files", "*.csv")])
+        if not output_path:
+            return
+        try:
+            export_aging_overview_csv(output_path, self.aging_rows)
+            messagebox.showinfo("Success", "Aging overview exported.")
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to export aging overview: {e}")
+
+    def backfill_amounts(self):
+        """Reads the unpriced invoices' workbooks in a background thread; the status line follows its progress."""
+        if self.backfill_running:
+            return
+        self.backfill_running = True
+        self.aging_status_label.config(text="Reading workbooks...")
+
+        def progress(done, total):
+            self.after(0, lambda: self.aging_status_label.config(text=f"Reading workbooks: {done}/{total}"))
+
+        def work():
+            # Its own connection: the shared one belongs to the Tk thread
+            db = sqlite3.connect(DB_FILE)
+            try:
+                filled = backfill_invoice_amounts(db, progress=progress)
+                text = f"Stored amounts for {filled} invoice(s)."
+            except Exception as e:
+                text = f"Backfill failed: {e}"
+            finally:
+                db.close()
+            self.after(0, lambda: self.backfill_finished(text))
+
+        threading.Thread(target=work, daemon=True).start()
+
+    def backfill_finished(self, text):
+        self.backfill_running = False
+        self.refresh_aging_overview()
+        messagebox.showinfo("Backfill", text)
+
+    def open_aging_drilldown(self, event):
+        vendor_id = self.aging_tree.identify_row(event.y)
+        if not vendor_id:
+            return
+        popup = tk.Toplevel(self)
+        popup.title(f"Transactions - {vendor_id}")
+        popup.geometry("600x400")
+        tree = ttk.Treeview(popup, columns=("date", "invoice_no", "debit", "credit"), show="headings")
+        tree.pack(fill="both", expand=True, padx=10, pady=10)
+        for col in ("date", "invoice_no", "debit", "credit"):
+            tree.heading(col, text=col.capitalize())
+            tree.column(col, width=120)
+        # Rows are pulled from the cursor a page at a time so the window opens immediately
+        transactions = vendor_transactions(conn, vendor_id)
+
+        def load_page():
+            if not popup.winfo_exists():
+                return
+            loaded = 0
+            for txn in itertools.islice(transactions, 500):
+                values = txn.display_values()
+                tree.insert("", tk.END, values=(values[0], values[1], values[3], values[4]))
+                loaded += 1
+            if loaded == 500:
+                popup.after(1, load_page)
+
+        load_page()
+
+    # -----------------------------
+    # 6) Maintenance Frame (backups)
+    # -----------------------------
+    def build_maintenance_frame(self):
+        tk.Label(self.maintenance_frame, text="Maintenance", font=("Arial", 18, "bold")).pack(pady=10)
+        bar = tk.Frame(self.maintenance_frame)
+        bar.pack(pady=5)
+        tk.Button(bar, text="Backup Now", command=self.run_backup).pack(side="left", padx=5)
+        tk.Button(bar, text="Check Integrity", command=self.check_database).pack(side="left", padx=5)
+        tk.Button(bar, text="Restore Selected Backup", command=self.restore_backup).pack(side="left", padx=5)
+        tk.Button(bar, text="Validate Workbook Folder", command=self.validate_workbook_folder).pack(side="left", padx=5)
+        self.maintenance_status_label = tk.Label(self.maintenance_frame, text="", fg="green", font=("Helvetica", 10))
+        self.maintenance_status_label.pack(pady=2)
+        tk.Label(self.maintenance_frame, text=f"Backups (newest first, last {BACKUP_KEEP} kept):").pack()
+        self.backup_listbox = tk.Listbox(self.maintenance_frame, width=80, height=8)
+        self.backup_listbox.pack(padx=10, pady=10)
+        self.backup_running = False
+
+        # Invoices whose workbook changed after they were issued (filled by the source watcher)
+        watch_bar = tk.Frame(self.maintenance_frame)
+        watch_bar.pack(pady=2)
+        tk.Label(watch_bar, text="Changed source workbooks:").pack(side="left", padx=5)
+        tk.Button(watch_bar, text="Scan Now", command=self.scan_sources_now).pack(side="left", padx=5)
+        self.watch_background_var = tk.BooleanVar(value=WATCH_IN_BACKGROUND)
+        tk.Checkbutton(watch_bar, text=f"Rescan every {WATCH_INTERVAL_SECONDS}s", variable=self.watch_background_var,
+                       command=self.toggle_source_watch).pack(side="left", padx=5)
+        self.watch_status_label = tk.Label(self.maintenance_frame, text="", fg="green", font=("Helvetica", 10))
+        self.watch_status_label.pack(pady=2)
+        columns = ("invoice_no", "vendor_id", "invoice_date", "issued", "source_now", "checked", "excel_file")
+        self.mismatch_tree = ttk.Treeview(self.maintenance_frame, columns=columns, show="headings", height=8)
+        self.mismatch_tree.pack(fill="both", expand=True, padx=10, pady=5)
+        for col in columns:
+            self.mismatch_tree.heading(col, text=col.replace("_", " ").capitalize())
+            self.mismatch_tree.column(col, width=100)
+        self.source_watcher = None
+        if WATCH_IN_BACKGROUND:
+            self.toggle_source_watch()
+
+        # Diagnostics
+        diag_bar = tk.Frame(self.maintenance_frame)
+        diag_bar.pack(pady=2)
+        tk.Label(diag_bar, text="Diagnostics:").pack(side="left", padx=5)
+        tk.Button(diag_bar, text="Refresh", command=self.refresh_diagnostics).pack(side="left", padx=5)
+        tk.Button(diag_bar, text="Clear Query Cache", command=self.clear_query_cache).pack(side="left", padx=5)
+        self.diagnostics_label = tk.Label(self.maintenance_frame, text="", font=("Helvetica", 10))
+        self.diagnostics_label.pack(pady=2)
+
+    def show_maintenance_frame(self):
+        self.refresh_backup_list()
+        self.show_source_scan(None, mismatched_invoices(conn))
+        self.refresh_diagnostics()
+        self.show_frame(self.maintenance_frame)
+
+    def refresh_diagnostics(self):
+        self.diagnostics_label.config(text=format_query_cache_stats(self.query_cache.stats()))
+
+    def clear_query_cache(self):
+        self.query_cache.clear()
+        self.refresh_diagnostics()
+
+    def show_source_scan(self, summary, rows):
+        self.mismatch_tree.delete(*self.mismatch_tree.get_children())
+        for inv_id, vendor_id, invoice_no, invoice_date, excel_file, issued, source_now, checked in rows:
+            self.mismatch_tree.insert("", tk.END, values=(invoice_no, vendor_id, invoice_date, format_cents(issued),
+                                                          format_cents(source_now), checked or "", excel_file))
+        text = f"{len(rows)} invoice(s) no longer match their workbook." if rows else "All issued invoices match their workbooks."
+        if summary:
+            text += (f" Last scan: {len(summary['changed'])} changed, {len(summary['missing'])} missing, "
+                     f"{len(summary['errors'])} unreadable of {summary['checked']} workbook(s).")
+        self.watch_status_label.config(text=text, fg="red" if rows else "green")
+
+    def ensure_source_watcher(self):
+        # Started on first use; scans run on the watcher's thread and connection, never on Tk's
+        if self.source_watcher is None:
+            self.source_watcher = SourceWatcher(
+                interval=WATCH_INTERVAL_SECONDS if self.watch_background_var.get() else None,
+                on_scan=lambda summary, rows: self.after(0, self.show_source_scan, summary, rows),
+                on_error=lambda message: self.after(0, lambda: self.watch_status_label.config(
+                    text=f"Scan failed: {message}", fg="red")))
+            self.source_watcher.start()
+        return self.source_watcher
+
+    def toggle_source_watch(self):
+        watcher = self.ensure_source_watcher()
+        watcher.interval = WATCH_INTERVAL_SECONDS if self.watch_background_var.get() else None
+        if watcher.interval:
+            self.scan_sources_now()
+
+    def scan_sources_now(self):
+        self.watch_status_label.config(text="Scanning source workbooks...", fg="green")
+        self.ensure_source_watcher().scan_now()
+
+    def refresh_backup_list(self):
+        self.backup_listbox.delete(0, tk.END)
+        for path in list_backups():
+            self.backup_listbox.insert(tk.END, f"{path}  ({os.path.getsize(path) / 1024 / 1024:,.1f} MB)")
+
+    def run_backup(self):
+        """Takes a snapshot in a background thread; the status line follows its progress."""
+        if self.backup_running:
+            return
+        self.backup_running = True
+
+        def progress(done, total):
+            self.after(0, lambda: self.maintenance_status_label.config(text=f"Backing up: {done}/{total} pages"))
+
+        def work():
+            try:
+                result = backup_database(progress=progress)
+                text = format_backup_result(result)
+            except Exception as e:
+                text = f"Backup failed: {e}"
+            self.after(0, lambda: self.backup_finished(text))
+
+        threading.Thread(target=work, daemon=True).start()
+
+    def backup_finished(self, text):
+        self.backup_running = False
+        self.maintenance_status_label.config(text=text)
+        self.refresh_backup_list()
+
+    def schedule_backups(self):
+        # Checked hourly; a snapshot is taken once the newest one is BACKUP_INTERVAL_HOURS old
+        if backup_due():
+            self.run_backup()
+        self.after(3600 * 1000, self.schedule_backups)
+
+    def check_database(self):
+        self.maintenance_status_label.config(text="Running quick_check...")
+        self.update_idletasks()
+        start = perf_counter()
+        problems = integrity_check()
+        elapsed = perf_counter() - start
+        if problems:
+            self.maintenance_status_label.config(text=f"quick_check found {len(problems)} problem(s) ({elapsed:.2f} s)")
+            messagebox.showerror("Integrity Check", "\n".join(problems[:20]))
+        else:
+            self.maintenance_status_label.config(text=f"quick_check: ok ({elapsed:.2f} s)")
+
+    def validate_workbook_folder(self):
+        """Dry-run ingestion of a folder of vendor workbooks in the background, then offers the CSV report."""
+        directory = filedialog.askdirectory(title="Folder of vendor workbooks")
+        if not directory:
+            return
+
+        def progress(done, total):
+            self.after(0, lambda: self.maintenance_status_label.config(text=f"Validating: {done}/{total} workbooks"))
+
+        def work():
+            start = perf_counter()
+            try:
+                reports = validate_directory(directory, progress=progress)
+            except Exception as e:
+                self.after(0, lambda: messagebox.showerror("Error", f"Validation failed: {e}"))
+                return
+            self.after(0, lambda: self.validation_finished(reports, perf_counter() - start))
+
+        threading.Thread(target=work, daemon=True).start()
+
+    def validation_finished(self, reports, seconds):
+        summary = format_validation_summary(reports, seconds)
+        self.maintenance_status_label.config(text=summary.splitlines()[0])
+        if messagebox.askyesno("Validation", summary[:2000] + "\n\nSave the per-file report as CSV?"):
+            output_path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV Files", "*.csv")])
+            if output_path:
+                write_validation_report(output_path, reports)
+
+    def restore_backup(self):
+        selection = self.backup_listbox.curselection()
+        if not selection:
+            messagebox.showerror("Error", "Select a backup to restore.")
+            return
+        path = list_backups()[selection[0]]
+        if not messagebox.askyesno("Restore", f"Replace the current data with {path}?\n"
+                                              "The current data is backed up first."):
+            return
+        try:
+            result = restore_database(path)
+            # Cached vendors and query results describe the data that was just replaced
+            self.query_cache.clear()
+            self.repo.vendors.invalidate()
+            self.refresh_diagnostics()
+            self.maintenance_status_label.config(
+                text=f"Restored in {result['seconds']:.2f} s; previous data saved to {result['safety_backup']}")
+            self.refresh_backup_list()
+        except Exception as e:
+            messagebox.showerror("Error", f"Restore failed: {e}")
+
+# ----------------------------------------------------
+# Command Line
+# ----------------------------------------------------
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="DocMed invoice & SOA generator. Without a command the GUI starts.")
+    sub = parser.add_subparsers(dest="command")
+
+    p = sub.add_parser("soa-batch", help="render every vendor's SOA for a period (resumable)")
+    p.add_argument("--from", dest="from_date", required=True, help="YYYY-MM-DD")
+    p.add_argument("--to", dest="to_date", required=True, help="YYYY-MM-DD")
+    p.add_argument("--out", required=True, help="output folder")
+    p.add_argument("--vendor", action="append", help="limit to this vendor ID (repeatable)")
+    p.add_argument("--workers", type=int, default=None)
+    p.add_argument("--no-seal", action="store_true")
+    p.add_argument("--force", action="store_true", help="re-render vendors already done in this run")
+    p.add_argument("--profile", choices=sorted(OUTPUT_PROFILES), default=DEFAULT_OUTPUT_PROFILE,
+                   help="output profile (image resolution/compression)")
+    p.add_argument("--grayscale", action="store_true", help="embed images in grayscale")
+
+    p = sub.add_parser("invoice-batch", help="generate the invoices listed in a manifest CSV through a staged pipeline")
+    p.add_argument("manifest", help="CSV with " + ", ".join(INVOICE_MANIFEST_COLUMNS))
+    p.add_argument("--out", required=True, help="output folder")
+    p.add_argument("--workers", type=int, default=None, help="render processes")
+    p.add_argument("--queue-size", type=int, default=PIPELINE_QUEUE_SIZE, help="documents waiting between two stages")
+    p.add_argument("--sequential", action="store_true", help="run the stages one document at a time")
+    p.add_argument("--no-seal", action="store_true")
+    p.add_argument("--profile", choices=sorted(OUTPUT_PROFILES), default=DEFAULT_OUTPUT_PROFILE,
+                   help="output profile (image resolution/compression)")
+    p.add_argument("--grayscale", action="store_true", help="embed images in grayscale")
+
+    p = sub.add_parser("soa-export", help="write one vendor's SOA ledger to .xlsx or .csv")
+    p.add_argument("--vendor", required=True, help="vendor ID")
+    p.add_argument("--from", dest="from_date", required=True, help="YYYY-MM-DD")
+    p.add_argument("--to", dest="to_date", required=True, help="YYYY-MM-DD")
+    p.add_argument("--out", required=True, help="output file (.xlsx or .csv)")
+
+    p = sub.add_parser("archive", help="move closed fiscal years into per-year archive databases")
+    p.add_argument("--year", type=int, action="append", help="fiscal year to archive (repeatable)")
+    p.add_argument("--all-closed", action="store_true", help="archive every closed year still in app.db")
+    p.add_argument("--no-vacuum", action="store_true", help="skip the VACUUM after moving rows")
+
+    p = sub.add_parser("backup", help="snapshot app.db with the online backup API")
+    p.add_argument("--out", help="backup file (default: backups/app-<timestamp>.db)")
+    p.add_argument("--keep", type=int, default=BACKUP_KEEP, help="backups to keep in the backups folder")
+    p.add_argument("--pages", type=int, default=BACKUP_PAGES_PER_STEP, help="pages copied per step")
+    p.add_argument("--every", type=float, metavar="HOURS", help="keep running and snapshot on this interval")
+    p.add_argument("--list", action="store_true", help="list existing backups")
+
+    p = sub.add_parser("check", help="run quick_check (or --full integrity_check) on a database")
+    p.add_argument("path", nargs="?", default=None, help="database file (default: app.db)")
+    p.add_argument("--full", action="store_true")
+
+    p = sub.add_parser("restore", help="restore app.db from a backup (the current data is snapshotted first)")
+    p.add_argument("path")
+
+    p = sub.add_parser("validate", help="dry-run ingestion of every workbook in a folder (no PDF, no database rows)")
+    p.add_argument("directory")
+    p.add_argument("--workers", type=int, default=None)
+    p.add_argument("--engine", choices=sorted(EXCEL_ENGINES), default=None, help="force an Excel reader backend")
+    p.add_argument("--report", help="write the per-file report to this CSV")
+
+    p = sub.add_parser("watch", help="poll invoice workbooks and flag invoices whose source total changed")
+    p.add_argument("--interval", type=float, default=WATCH_INTERVAL_SECONDS, help="seconds between passes")
+    p.add_argument("--once", action="store_true", help="run a single pass and exit")
+
+    sub.add_parser("index-lines", help="hash the line items of stored invoices for duplicate detection")
+
+    p = sub.add_parser("enqueue", help="add invoice or SOA jobs to the shared queue served by `worker`")
+    kinds = p.add_subparsers(dest="kind", required=True)
+    q = kinds.add_parser("invoices", help="one job per row of a manifest CSV (see invoice-batch)")
+    q.add_argument("manifest")
+    q = kinds.add_parser("soas", help="one SOA job per vendor for a period")
+    q.add_argument("--from", dest="from_date", required=True, help="YYYY-MM-DD")
+    q.add_argument("--to", dest="to_date", required=True, help="YYYY-MM-DD")
+    q.add_argument("--vendor", action="append", help="limit to this vendor ID (repeatable)")
+    for q in kinds.choices.values():
+        q.add_argument("--out", required=True, help="output folder, as seen by the workers")
+        q.add_argument("--no-seal", action="store_true")
+        q.add_argument("--profile", choices=sorted(OUTPUT_PROFILES), default=DEFAULT_OUTPUT_PROFILE,
+                       help="output profile (image resolution/compression)")
+        q.add_argument("--grayscale", action="store_true", help="embed images in grayscale")
+
+    p = sub.add_parser("worker", help="claim and render jobs from the shared queue")
+    p.add_argument("--id", dest="worker_id", help="worker name (host:pid by default)")
+    p.add_argument("--until-empty", action="store_true", help="exit once no job is queued or running")
+    p.add_argument("--max-jobs", type=int, default=None)
+    p.add_argument("--poll", type=float, default=JOB_POLL_SECONDS, help="seconds between claims when idle")
+    p.add_argument("--lease", type=float, default=JOB_LEASE_SECONDS, help="seconds a claim lasts without a heartbeat")
+    p.add_argument("--heartbeat", type=float, default=JOB_HEARTBEAT_SECONDS, help="seconds between lease renewals")
+
+    p = sub.add_parser("jobs", help="show shared queue counts per status")
+    p.add_argument("--requeue-failed", action="store_true", help="queue failed jobs again")
+
+    p = sub.add_parser("plan", help="show how an invoice workbook would be rendered, without rendering it")
+    p.add_argument("excel_file")
+    p.add_argument("--memory-budget", type=float, default=PLAN_MEMORY_BUDGET_MB, help="MB")
+    p.add_argument("--latency-budget", type=float, default=PLAN_LATENCY_BUDGET_SECONDS, help="seconds")
+    p.add_argument("--workers", type=int, default=None)
+
+    p = sub.add_parser("plans", help="recent execution plans with predicted and actual cost")
+    p.add_argument("--limit", type=int, default=20)
+
+    p = sub.add_parser("serve", help="run the local HTTP/JSON generation service")
+    p.add_argument("--host", default=SERVICE_HOST, help="bind address (localhost only by default)")
+    p.add_argument("--port", type=int, default=SERVICE_PORT)
+    p.add_argument("--workers", type=int, default=None)
+    p.add_argument("--queue-limit", type=int, default=SERVICE_QUEUE_LIMIT)
+    p.add_argument("--out", default=SERVICE_OUTPUT_DIR, help="folder for rendered PDFs")
+    return parser
+
+def run_command(args):
+    if args.command == "soa-batch":
+        summary = run_soa_batch(args.from_date, args.to_date, args.out, vendor_ids=args.vendor, workers=args.workers,
+                                include_seal=not args.no_seal, force=args.force,
+                                profile=args.profile, grayscale=args.grayscale,
+                                progress=lambda done, total: print(f"{done}/{total} vendors", flush=True))
+        print(format_batch_summary(summary))
+        return 1 if summary["failures"] else 0
+    if args.command == "invoice-batch":
+        db = sqlite3.connect(DB_FILE)
+        try:
+            jobs = read_invoice_manifest(db, args.manifest)
+        finally:
+            db.close()
+        summary = run_invoice_batch(jobs, args.out, workers=args.workers, queue_size=args.queue_size,
+                                    sequential=args.sequential, include_seal=not args.no_seal,
+                                    profile=args.profile, grayscale=args.grayscale,
+                                    progress=lambda done, total: print(f"{done}/{total} invoices", flush=True))
+        print(format_pipeline_summary(summary))
+        return 1 if summary["failures"] else 0
+    if args.command == "soa-export":
+        start = perf_counter()
+        db = sqlite3.connect(DB_FILE)
+        try:
+            result = export_vendor_ledger(db, args.vendor, args.from_date, args.to_date, args.out)
+        finally:
+            db.close()
+        print(f"{result['rows']:,} rows, balance {result['balance']:,.2f}, {perf_counter() - start:.2f}s -> {args.out}")
+        return 0
+    if args.command == "archive":
+        years = args.year or []
+        if args.all_closed:
+            db = sqlite3.connect(DB_FILE)
+            try:
+                years = sorted(set(years) | set(archivable_years(db)))
+            finally:
+                db.close()
+        if not years:
+            print(f"Nothing to archive. Archived years: {', '.join(map(str, archived_years())) or 'none'}")
+            return 0
+        for year in years:
+            result = archive_fiscal_year(year, vacuum=not args.no_vacuum)
+            print(f"{result['year']}: moved {result['moved']:,} invoices -> {result['path']}")
+        return 0
+    if args.command == "backup":
+        if args.list:
+            for path in list_backups():
+                print(f"{path}  {os.path.getsize(path) / 1024 / 1024:,.1f} MB")
+            return 0
+        while True:
+            result = backup_database(args.out, args.pages, keep=args.keep,
+                                     progress=lambda done, total: print(f"\r{done}/{total} pages", end="", flush=True))
+            print("\r" + format_backup_result(result))
+            if not args.every:
+                return 0
+            sleep(args.every * 3600)
+    if args.command == "check":
+        start = perf_counter()
+        problems = integrity_check(args.path, args.full)
+        print("\n".join(problems) if problems else "ok", f"({perf_counter() - start:.2f}s)")
+        return 1 if problems else 0
+    if args.command == "restore":
+        result = restore_database(args.path)
+        print(f"Restored {result['restored']} in {result['seconds']:.2f}s (previous data saved to {result['safety_backup']})")
+        return 0
+    if args.command == "validate":
+        start = perf_counter()
+        reports = validate_directory(args.directory, args.workers, args.engine,
+                                     progress=lambda done, total: print(f"\r{done}/{total} workbooks", end="", flush=True))
+        print("\r" + format_validation_summary(reports, perf_counter() - start))
+        if args.report:
+            write_validation_report(args.report, reports)
+        return 1 if any(r["status"] == "error" for r in reports) else 0
+    if args.command == "watch":
+        db = sqlite3.connect(DB_FILE)
+        try:
+            while True:
+                start = perf_counter()
+                summary = scan_source_changes(db)
+                mismatched = mismatched_invoices(db)
+                print(f"{datetime.now():%H:%M:%S} checked {summary['checked']} workbook(s) in {perf_counter() - start:.2f}s: "
+                      f"{len(summary['changed'])} changed, {len(summary['missing'])} missing, "
+                      f"{len(summary['errors'])} unreadable, {len(mismatched)} invoice(s) mismatched", flush=True)
+                for inv_id, vendor_id, invoice_no, _, excel_file, issued, source_now, _ in (mismatched if args.once or summary["changed"] else []):
+                    print(f"  {vendor_id} {invoice_no}: issued {format_cents(issued)}, workbook now {format_cents(source_now)} ({excel_file})")
+                if args.once:
+                    return 1 if mismatched else 0
+                sleep(args.interval)
+        finally:
+            db.close()
+    if args.command == "index-lines":
+        db = sqlite3.connect(DB_FILE)
+        try:
+            print(f"Indexed line items of {index_invoice_lines(db)} invoice(s).")
+        finally:
+            db.close()
+        return 0
+
+    if args.command == "enqueue":
+        db = sqlite3.connect(DB_FILE, timeout=JOB_DB_TIMEOUT)
+        try:
+            options = {"include_seal": not args.no_seal, "profile": args.profile, "grayscale": args.grayscale}
+            if args.kind == "invoices":
+                ids = enqueue_invoice_jobs(db, read_invoice_manifest(db, args.manifest), args.out, **options)
+            else:
+                ids = enqueue_soa_jobs(db, args.from_date, args.to_date, args.out, args.vendor, **options)
+        finally:
+            db.close()
+        print(f"Queued {len(ids)} job(s).")
+        return 0
+    if args.command == "worker":
+        try:
+            stats = run_worker(args.worker_id, args.until_empty, args.max_jobs, args.poll, args.lease, args.heartbeat,
+                               log=lambda message: print(message, flush=True))
+        except KeyboardInterrupt:
+            return 0
+        print(f"{stats['worker']}: {stats['done']} done, {stats['failed']} failed, {stats['lost']} lost")
+        return 1 if stats["failed"] else 0
+    if args.command == "jobs":
+        db = sqlite3.connect(DB_FILE, timeout=JOB_DB_TIMEOUT)
+        try:
+            if args.requeue_failed:
+                print(f"Queued {requeue_failed_jobs(db)} failed job(s) again.")
+            counts = job_counts(db)
+        finally:
+            db.close()
+        for status in ("queued", "running", "done", "failed"):
+            print(f"{status:<8} {counts.get(status, 0)}")
+        return 0
+    if args.command == "plan":
+        db = sqlite3.connect(DB_FILE)
+        try:
+            plan = plan_invoice_render(args.excel_file, db=db, workers=args.workers, memory_mb=args.memory_budget,
+                                       seconds=args.latency_budget)
+        finally:
+            db.close()
+        print(format_plan(plan), f"- {plan['reason']}")
+        for strategy, (seconds, mb) in plan["candidates"].items():
+            print(f"  {strategy:<10} {seconds:>8.1f} s {mb:>8,} MB")
+        return 0
+    if args.command == "plans":
+        db = sqlite3.connect(DB_FILE)
+        try:
+            rows = db.execute("SELECT created_at, kind, strategy, workers, rows, actual_rows, predicted_seconds, "
+                              "actual_seconds, predicted_mb, peak_mb, children_mb, subject FROM execution_plans "
+                              "ORDER BY id DESC LIMIT ?", (args.limit,)).fetchall()
+        finally:
+            db.close()
+        print(f"{'when':<19} {'kind':<7} {'strategy':<12} {'rows':>9} {'actual':>9} {'pred s':>8} {'took s':>8} "
+              f"{'pred MB':>8} {'peak MB':>8} {'worker':>8}  subject")
+        for when, kind, strategy, workers, rows, actual_rows, p_s, a_s, p_mb, peak, child, subject in rows:
+            label = f"{strategy} x{workers}" if strategy == "parallel" else strategy
+            print(f"{when:<19} {kind:<7} {label:<12} {rows:>9,} {actual_rows or 0:>9,} {p_s:>8.1f} {a_s or 0:>8.1f} "
+                  f"{p_mb or 0:>8,.0f} {peak or 0:>8,.0f} {child or 0:>8,.0f}  {subject}")
+        return 0
+    if args.command == "serve":
+        run_service(args.host, args.port, args.workers, args.queue_limit, args.out)
+    return 0
+
 # ----------------------------------------------------
 # Run the App
 # ----------------------------------------------------
 if __name__ == "__main__":
+    args = build_arg_parser().parse_args()
+    if args.command:
+        raise SystemExit(run_command(args))
     ctk.set_appearance_mode("Dark")
     ctk.set_default_color_theme("dark-blue")
     app = MainApp()
@@ -0,0 +1,605 @@
+"""
+Benchmarks for the invoice generator on synthetic vendor sheets.
+
+    python benchmark.py readers --rows 20000
+    python benchmark.py ingest --rows 300000
+    python benchmark.py bundle --invoices 50
+    python benchmark.py profiles --rows 200
+    python benchmark.py ledger --rows 50000
+    python benchmark.py backup --mb 2000
+    python benchmark.py pipeline --invoices 200 --workers 4
+    python benchmark.py workers --processes 4 --invoices 100 --kill-one
+    python benchmark.py chunked --rows 100000 --workers 1 2 4 8
+    python benchmark.py queries --sizes 10 100 1000
+    python benchmark.py planner --rows 2000 20000 100000
+    python benchmark.py loadtest --url http://127.0.0.1:8765 --requests 200 --concurrency 8
+"""
+import argparse
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+import InvoiceGen as app
+
+
+# ----------------------------------------------------
+# Synthetic Data
+# ----------------------------------------------------
+def make_synthetic_rows(rows, seed=0):
+    """Title rows, a Name/Amount header, line items and a trailing total row, like vendor exports."""
+    grid = [["DocMed Services - Employee Billing"], [None], ["S.No", "Name", "Passport", "Amount"]]
+    total = 0
+    for i in range(rows):
+        amount = 150 + ((i * 37 + seed) % 400)
+        total += amount
+        grid.append([i + 1, f"Employee {(i * 7919 + seed) % (rows * 3)}", f"P{100000 + i}", amount])
+    grid.append([None, "Total", None, total])
+    return grid
+
+def write_synthetic_workbook(path, rows, seed=0, sheets=1):
+    """Writes rows line items to path; .xlsx files can split them across several sheets."""
+    ext = os.path.splitext(path)[1].lower()
+    grid = make_synthetic_rows(rows, seed)
+    if ext == ".csv":
+        import csv
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            csv.writer(f).writerows([["" if c is None else c for c in r] for r in grid])
+    elif ext == ".ods":
+        app.pd.DataFrame(grid).to_excel(path, header=False, index=False, engine="odf")
+    else:
+        import openpyxl
+        workbook = openpyxl.Workbook(write_only=True)
+        per_sheet = -(-rows // sheets)
+        for s in range(sheets):
+            sheet = workbook.create_sheet(f"Sheet{s + 1}")
+            for r in make_synthetic_rows(min(per_sheet, rows - s * per_sheet), seed + s) if sheets > 1 else grid:
+                sheet.append(r)
+        workbook.save(path)
+    return path
+
+
+# ----------------------------------------------------
+# Reader Backends
+# ----------------------------------------------------
+def bench_readers(args):
+    workdir = tempfile.mkdtemp(prefix="invoice-bench-")
+    xlsx = write_synthetic_workbook(os.path.join(workdir, "sheet.xlsx"), args.rows, sheets=args.sheets)
+    sources = [(engine, xlsx) for engine in ("calamine", "openpyxl", "pandas")]
+    if args.sheets == 1:
+        sources.append(("csv", write_synthetic_workbook(os.path.join(workdir, "sheet.csv"), args.rows)))
+    if args.sheets == 1 and "odf" in app.available_excel_engines():
+        sources.append(("odf", write_synthetic_workbook(os.path.join(workdir, "sheet.ods"), args.rows)))
+
+    available = app.available_excel_engines()
+    reference = None
+    print(f"{'engine':<10} {'file':<12} {'best s':>8} {'rows/s':>10}  identical")
+    for engine, path in sources:
+        if engine not in available:
+            print(f"{engine:<10} {'-':<12} {'skipped (not installed)':>20}")
+            continue
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            df, total = app.process_excel_file(path, engine=engine)
+            timings.append(time.perf_counter() - start)
+        if reference is None:
+            reference = (df, total)
+        identical = df.equals(reference[0]) and total == reference[1]
+        best = min(timings)
+        print(f"{engine:<10} {os.path.basename(path):<12} {best:>8.3f} {args.rows / best:>10.0f}  {identical}")
+
+
+# ----------------------------------------------------
+# In-memory vs Streaming Ingestion
+# ----------------------------------------------------
+def bench_ingest_one(args):
+    # Runs in its own process so peak RSS belongs to a single mode
+    start = time.perf_counter()
+    if args.mode == "memory":
+        _, total = app.process_excel_file(args.path)
+    else:
+        total = app.ingest_excel_streaming(args.path, chunk_rows=args.chunk)["total"]
+    print(json.dumps({"mode": args.mode, "seconds": time.perf_counter() - start,
+                      "total": float(total), "peak_rss_mb": app.process_peak_mb()}))
+
+def bench_ingest(args):
+    workdir = tempfile.mkdtemp(prefix="invoice-bench-")
+    path = write_synthetic_workbook(os.path.join(workdir, f"export.{args.format}"), args.rows)
+    print(f"{args.rows} rows, {os.path.getsize(path) / 1e6:.1f} MB {args.format}")
+    print(f"{'mode':<8} {'seconds':>8} {'peak RSS MB':>12} {'total':>16}")
+    for mode in ("memory", "stream"):
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "ingest-one", "--mode", mode,
+                              "--chunk", str(args.chunk), path], capture_output=True, text=True, check=True)
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        rss = "n/a" if r["peak_rss_mb"] is None else f"{r['peak_rss_mb']:.0f}"
+        print(f"{mode:<8} {r['seconds']:>8.2f} {rss:>12} {r['total']:>16,.2f}")
+
+
+# ----------------------------------------------------
+# Generation Service Load Test
+# ----------------------------------------------------
+def _call(base, method, path, body=None):
+    data = json.dumps(body).encode() if body is not None else None
+    request = urllib.request.Request(base + path, data=data, method=method,
+                                     headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))] if values else 0.0
+
+def bench_loadtest(args):
+    """Submits invoice jobs to a running `InvoiceGen.py serve` and measures submit-to-PDF latency."""
+    base = args.url.rstrip("/")
+    excel = args.excel or write_synthetic_workbook(
+        os.path.join(tempfile.mkdtemp(prefix="invoice-bench-"), "load.xlsx"), args.rows)
+    vendor_id = args.vendor or f"LOAD-{uuid.uuid4().hex[:8]}"
+    if not args.vendor:
+        _call(base, "POST", "/vendors", {"vendor_id": vendor_id, "vendor_name": "Load Test Vendor",
+                                         "vendor_address": "Doha", "po_number": "PO-LOAD"})
+    latencies, rejected, failed = [], [0], [0]
+    lock = threading.Lock()
+    counter = iter(range(args.requests))
+
+    def client():
+        for i in counter:
+            start = time.perf_counter()
+            body = {"vendor_id": vendor_id, "invoice_no": f"LT-{i}", "excel_file": os.path.abspath(excel)}
+            while True:
+                code, data = _call(base, "POST", "/invoices", body)
+                if code != 429:
+                    break
+                with lock:
+                    rejected[0] += 1
+                time.sleep(0.05)
+            if code != 202:
+                with lock:
+                    failed[0] += 1
+                continue
+            job_id = json.loads(data)["job_id"]
+            while True:
+                code, data = _call(base, "GET", f"/jobs/{job_id}")
+                status = json.loads(data)["status"]
+                if status in ("done", "failed"):
+                    break
+                time.sleep(0.02)
+            if status == "done" and _call(base, "GET", f"/jobs/{job_id}/pdf")[0] == 200:
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+            else:
+                with lock:
+                    failed[0] += 1
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    print(f"{len(latencies)} documents in {elapsed:.1f}s = {len(latencies) / elapsed:.2f} docs/sec "
+          f"({args.concurrency} clients, {rejected[0]} x 429, {failed[0]} failed)")
+    print(f"latency p50 {percentile(latencies, 50):.3f}s  p99 {percentile(latencies, 99):.3f}s")
+
+
+# ----------------------------------------------------
+# Invoice Bundles vs Separate Files
+# ----------------------------------------------------
+def bench_bundle(args):
+    workdir = tempfile.mkdtemp(prefix="invoice-bench-")
+    invoices = []
+    for i in range(args.invoices):
+        path = write_synthetic_workbook(os.path.join(workdir, f"inv{i}.xlsx"), args.rows, seed=i)
+        df, total, sections = app.process_excel_workbook(path)
+        invoices.append({"input_details": {"vendor_name": "Bench Vendor", "vendor_address": "Doha", "vendor_po": "PO-1",
+                                           "invoice_type": "Debit", "invoice_no": f"B-{i}", "invoice_date": "2025-01-31"},
+                         "excel_df": df, "amount": total, "sections": sections})
+
+    start = time.perf_counter()
+    separate = []
+    for i, inv in enumerate(invoices):
+        out = os.path.join(workdir, f"separate{i}.pdf")
+        app.create_invoice_pdf(out, inv["input_details"], inv["excel_df"], inv["amount"], sections=inv["sections"])
+        separate.append(out)
+    merged_size = sum(os.path.getsize(p) for p in separate)
+    label = "separate files"
+    try:
+        from pypdf import PdfWriter
+        writer = PdfWriter()
+        for p in separate:
+            writer.append(p)
+        merged = os.path.join(workdir, "merged.pdf")
+        with open(merged, "wb") as f:
+            writer.write(f)
+        merged_size = os.path.getsize(merged)
+        label = "separate + merge"
+    except ImportError:
+        pass
+    separate_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    bundle = os.path.join(workdir, "bundle.pdf")
+    app.create_invoice_bundle_pdf(bundle, invoices)
+    bundle_time = time.perf_counter() - start
+
+    print(f"{args.invoices} invoices x {args.rows} rows")
+    print(f"{label:<18} {separate_time:>7.2f}s {merged_size / 1024:>10.0f} KB")
+    print(f"{'bundle':<18} {bundle_time:>7.2f}s {os.path.getsize(bundle) / 1024:>10.0f} KB")
+
+
+# ----------------------------------------------------
+# Output Profiles
+# ----------------------------------------------------
+def bench_profiles(args):
+    workdir = tempfile.mkdtemp(prefix="invoice-bench-")
+    path = write_synthetic_workbook(os.path.join(workdir, "profiles.xlsx"), args.rows)
+    df, total, sections = app.process_excel_workbook(path)
+    details = {"vendor_name": "Bench Vendor", "vendor_address": "Doha", "vendor_po": "PO-1",
+               "invoice_type": "Debit", "invoice_no": "P-1", "invoice_date": "2025-01-31"}
+    print(f"invoice with {args.rows} rows, best of {args.repeat}")
+    for profile in app.OUTPUT_PROFILES:
+        for grayscale in (False, True):
+            app.profile_assets(profile, grayscale)  # resampled assets are a one-time cost
+            out = os.path.join(workdir, f"{app.output_profile_key(profile, grayscale)}.pdf")
+            best = None
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                app.create_invoice_pdf(out, details, df, total, sections=sections, profile=profile, grayscale=grayscale)
+                stats = app.render_stats(out, start)
+                best = stats if best is None or stats["seconds"] < best["seconds"] else best
+            print(f"{app.output_profile_key(profile, grayscale):<14} {best['seconds']:>7.3f}s {best['bytes'] / 1024:>10.0f} KB")
+
+
+# ----------------------------------------------------
+# Ledger Export vs PDF
+# ----------------------------------------------------
+def bench_ledger(args):
+    workdir = tempfile.mkdtemp(prefix="invoice-bench-")
+    transactions = [app.Transaction.from_invoice(f"2025-{1 + i % 12:02d}-{1 + i % 28:02d}", f"L-{i}", "",
+                                                 "Credit" if i % 5 else "Debit", 100 + i % 997 + 0.25)
+                    for i in range(args.rows)]
+    print(f"ledger of {args.rows:,} transactions")
+    targets = [("csv", lambda out: app.export_ledger(out, "Bench", transactions)),
+               ("xlsx", lambda out: app.export_ledger(out, "Bench", transactions))]
+    if not args.skip_pdf:
+        targets.append(("pdf", lambda out: app.create_report_table_pdf(out, "Bench", transactions,
+                                                                       aging_summary=app.compute_aging(transactions))))
+    for ext, run in targets:
+        out = os.path.join(workdir, f"ledger.{ext}")
+        start = time.perf_counter()
+        try:
+            run(out)
+        except RuntimeError as e:
+            print(f"{ext:<6} skipped: {e}")
+            continue
+        print(f"{ext:<6} {time.perf_counter() - start:>8.2f}s {os.path.getsize(out) / 1024:>10.0f} KB")
+
+
+# ----------------------------------------------------
+# Online Backup
+# ----------------------------------------------------
+def bench_backup(args):
+    workdir = tempfile.mkdtemp(prefix="invoice-bench-")
+    app.DB_FILE = os.path.join(workdir, "app.db")
+    app.BACKUP_DIR = os.path.join(workdir, "backups")
+    db = app.sqlite3.connect(app.DB_FILE)
+    db.execute("CREATE TABLE invoices (id INTEGER PRIMARY KEY, vendor_id TEXT, invoice_no TEXT, invoice_date TEXT, "
+               "invoice_type TEXT, po_mr_no TEXT, excel_file TEXT, amount_cents INTEGER)")
+    filler = "x" * 400
+    batch = 10000
+    while os.path.getsize(app.DB_FILE) < args.mb * 1024 * 1024:
+        db.executemany("INSERT INTO invoices (vendor_id, invoice_no, invoice_date, invoice_type, po_mr_no, excel_file, amount_cents) "
+                       "VALUES (?,?,?,?,?,?,?)",
+                       ((f"V{i % 500}", f"INV-{i}", "2025-01-31", "Debit", "PO", filler, i) for i in range(batch)))
+        db.commit()
+    db.close()
+    print(f"database {os.path.getsize(app.DB_FILE) / 1024 / 1024:,.0f} MB")
+    for pages in args.pages:
+        steps = []
+        result = app.backup_database(pages=pages, progress=lambda done, total: steps.append(time.perf_counter()))
+        longest = max((b - a for a, b in zip(steps, steps[1:])), default=0)
+        print(f"pages/step {pages:>6}: copy {result['seconds']:>7.2f}s  quick_check {result['check_seconds']:>6.2f}s  "
+              f"longest step {longest * 1000:>7.1f} ms")
+    start = time.perf_counter()
+    app.integrity_check(full=True)
+    print(f"integrity_check (full) {time.perf_counter() - start:.2f}s")
+
+
+# ----------------------------------------------------
+# Chunked Parallel Rendering of One Large Invoice
+# ----------------------------------------------------
+def bench_chunked(args):
+    workdir = tempfile.mkdtemp(prefix="invoice-bench-")
+    path = write_synthetic_workbook(os.path.join(workdir, "large.csv"), args.rows)
+    df, total, sections = app.process_excel_workbook(path)
+    details = {"vendor_name": "Bench Vendor", "vendor_address": "Doha", "vendor_po": "PO-1",
+               "invoice_type": "Debit", "invoice_no": "C-1", "invoice_date": "2025-01-31"}
+    print(f"invoice with {args.rows:,} rows")
+    out = os.path.join(workdir, "single.pdf")
+    start = time.perf_counter()
+    app.create_invoice_pdf(out, details, df, total, sections=sections)
+    baseline = time.perf_counter() - start
+    print(f"{'single build':<14} {baseline:>8.2f}s {os.path.getsize(out) / 1024:>10.0f} KB")
+    for workers in args.workers:
+        out = os.path.join(workdir, f"chunked{workers}.pdf")
+        start = time.perf_counter()
+        chunks = app.create_invoice_pdf_chunked(out, details, df, total, sections=sections, workers=workers)
+        elapsed = time.perf_counter() - start
+        print(f"{f'{workers} worker(s)':<14} {elapsed:>8.2f}s {os.path.getsize(out) / 1024:>10.0f} KB  "
+              f"{chunks} chunks  x{baseline / elapsed:.2f}")
+
+
+# ----------------------------------------------------
+# Pipelined vs Sequential Invoice Batch
+# ----------------------------------------------------
+def make_bench_database(workdir):
+    """Points app.DB_FILE at an empty copy of the schema in workdir, with one vendor 'BENCH'."""
+    source = app.conn
+    app.DB_FILE = os.path.join(workdir, "app.db")
+    db = app.sqlite3.connect(app.DB_FILE)
+    for (sql,) in source.execute("SELECT sql FROM sqlite_master WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%'"):
+        db.execute(sql)
+    db.execute("INSERT INTO vendors (vendor_id, vendor_name, vendor_address, po_number) VALUES ('BENCH', 'Bench Vendor', 'Doha', 'PO-1')")
+    db.commit()
+    return db
+
+def make_invoice_jobs(workdir, invoices, rows, fmt):
+    jobs = []
+    for i in range(invoices):
+        path = write_synthetic_workbook(os.path.join(workdir, f"inv{i}.{fmt}"), rows, seed=i)
+        jobs.append({"vendor_id": "BENCH", "excel_file": path,
+                     "input_details": {"vendor_name": "Bench Vendor", "vendor_address": "Doha", "vendor_po": "PO-1",
+                                       "invoice_type": "Debit", "invoice_no": f"P-{i}", "invoice_date": "2025-01-31"}})
+    return jobs
+
+def bench_pipeline(args):
+    workdir = tempfile.mkdtemp(prefix="invoice-bench-")
+    db = make_bench_database(workdir)
+    jobs = make_invoice_jobs(workdir, args.invoices, args.rows, args.format)
+    print(f"{args.invoices} invoices x {args.rows} rows ({args.format})")
+    for sequential in (True, False):
+        db.execute("DELETE FROM invoices")
+        db.execute("DELETE FROM invoice_lines")
+        db.commit()
+        summary = app.run_invoice_batch(jobs, os.path.join(workdir, "out"), workers=args.workers,
+                                        queue_size=args.queue_size, sequential=sequential)
+        print(app.format_pipeline_summary(summary))
+    db.close()
+
+
+# ----------------------------------------------------
+# Shared Job Queue with Several Worker Processes
+# ----------------------------------------------------
+def bench_workers(args):
+    """
+    Queues invoices in a scratch database and drains it with several `InvoiceGen.py worker`
+    processes. With --kill-one the first worker is killed mid-job, so its lease has to expire
+    and another worker has to take the job over. Checks that every invoice was recorded once.
+    """
+    workdir = tempfile.mkdtemp(prefix="invoice-bench-")
+    db = make_bench_database(workdir)
+    jobs = make_invoice_jobs(workdir, args.invoices, args.rows, "xlsx")
+    app.enqueue_invoice_jobs(db, jobs, os.path.join(workdir, "out"))
+    env = dict(os.environ, INVOICEGEN_DB=app.DB_FILE)
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "InvoiceGen.py")
+    command = [sys.executable, script, "worker", "--until-empty", "--poll", "0.2",
+               "--lease", str(args.lease), "--heartbeat", str(args.lease / 4)]
+    print(f"{args.invoices} invoice jobs, {args.processes} worker processes, lease {args.lease}s")
+    start = time.perf_counter()
+    workers = [subprocess.Popen(command + ["--id", f"w{n}"], env=env, stdout=subprocess.DEVNULL)
+               for n in range(args.processes)]
+    if args.kill_one:
+        while workers[0].poll() is None and not db.execute(
+                "SELECT 1 FROM generation_jobs WHERE worker='w0' AND status='running'").fetchone():
+            time.sleep(0.05)
+        if workers[0].poll() is None:
+            workers[0].kill()
+            print("killed w0 while it held a job")
+    for proc in workers:
+        proc.wait()
+    elapsed = time.perf_counter() - start
+    counts = app.job_counts(db)
+    print(f"{counts.get('done', 0)} done, {counts.get('failed', 0)} failed in {elapsed:.1f}s = "
+          f"{counts.get('done', 0) / elapsed:.2f} docs/sec")
+    for worker, done in db.execute("SELECT worker, COUNT(*) FROM generation_jobs WHERE status='done' GROUP BY worker"):
+        print(f"  {worker:<4} {done:>5} jobs")
+    retried = db.execute("SELECT COUNT(*) FROM generation_jobs WHERE attempts > 1").fetchone()[0]
+    twice = db.execute("SELECT COUNT(*) FROM (SELECT invoice_no FROM invoices GROUP BY invoice_no HAVING COUNT(*) > 1)").fetchone()[0]
+    recorded = db.execute("SELECT COUNT(DISTINCT invoice_no) FROM invoices").fetchone()[0]
+    print(f"re-claimed after an expired lease: {retried}; invoices recorded: {recorded}, recorded twice: {twice}")
+    db.close()
+
+
+# ----------------------------------------------------
+# Query Counts per Screen Action
+# ----------------------------------------------------
+def make_query_fixture(workdir, size, workbook):
+    """A scratch database with size vendors and size invoices each, plus a manifest of size lines."""
+    db = make_bench_database(workdir)
+    for v in range(size):
+        db.execute("INSERT INTO vendors (vendor_id, vendor_name, vendor_address, po_number) VALUES (?,?,?,?)",
+                   (f"V{v}", f"Vendor {v}", "Doha", f"PO-{v}"))
+    db.executemany("INSERT INTO invoices (vendor_id, invoice_no, invoice_date, invoice_type, excel_file, amount_cents) "
+                   "VALUES (?,?,?,?,?,?)",
+                   [(f"V{i % size}", f"Q-{i}", f"2025-01-{1 + i % 28:02d}", "Debit", workbook, 100)
+                    for i in range(size * size)])
+    db.commit()
+    manifest = os.path.join(workdir, "manifest.csv")
+    with open(manifest, "w", encoding="utf-8") as f:
+        f.write("vendor_id,invoice_no,excel_file\n")
+        f.writelines(f"V{i},M-{i},{workbook}\n" for i in range(size))
+    return db, manifest
+
+def bench_queries(args):
+    """
+    Runs each screen action's data access against databases of growing size and counts the SQL
+    statements it issues. Fails if any action's count grows with the number of rows.
+    """
+    counts = {}
+    for size in args.sizes:
+        workdir = tempfile.mkdtemp(prefix="invoice-bench-")
+        workbook = write_synthetic_workbook(os.path.join(workdir, "items.csv"), 5)
+        db, manifest = make_query_fixture(workdir, size, workbook)
+        repo = app.Repository(db)
+        rows = repo.search_invoices(invoice_no="Q-")
+        actions = {
+            "report search": lambda: repo.search_invoices(invoice_no="Q-"),
+            "select transactions": lambda: repo.report_transactions(rows),
+            "invoice bundle": lambda: repo.bundle_rows(rows),
+            "soa query": lambda: repo.invoices("SELECT invoice_no, invoice_date, invoice_type, excel_file FROM {source} "
+                                               "WHERE vendor_id=? AND invoice_date BETWEEN ? AND ?",
+                                               ("V0", "2025-01-01", "2025-01-31"), ("2025-01-01", "2025-01-31")),
+            "invoice manifest": lambda: app.read_invoice_manifest(db, manifest),
+            "aging overview": lambda: app.aging_overview(db),
+        }
+        for name, action in actions.items():
+            repo.vendors.invalidate()
+            with app.count_queries(db) as statements:
+                action()
+            counts.setdefault(name, []).append(len(statements))
+        db.close()
+    print(f"{'invoices':<22}" + "".join(f"{size * size:>12,}" for size in args.sizes))
+    failed = []
+    for name, per_size in counts.items():
+        flat = len(set(per_size)) == 1
+        print(f"{name:<22}" + "".join(f"{n:>12}" for n in per_size) + ("" if flat else "   grows with rows"))
+        if not flat:
+            failed.append(name)
+    if failed:
+        sys.exit(f"query count depends on row count: {', '.join(failed)}")
+
+
+# ----------------------------------------------------
+# Execution Planner: Predicted vs Actual
+# ----------------------------------------------------
+def _run_strategy(path, strategy, workers):
+    # Runs in a fresh process; times and measures ingestion and render the way execute_plan does
+    details = {"vendor_name": "Bench Vendor", "vendor_address": "Doha", "vendor_po": "PO-1",
+               "invoice_type": "Debit", "invoice_no": "PL-1", "invoice_date": "2025-01-31"}
+    plan = {}
+    with contextlib.ExitStack() as stack:
+        app.execute_plan(plan, lambda: app.render_invoice_document(
+            path + f".{strategy}.pdf", details, path, force=True,
+            ingested=app.ingest_invoice_workbook(path, strategy, stack), strategy=strategy, workers=workers))
+    return plan["actual_seconds"], plan["peak_mb"], plan["children_mb"]
+
+def bench_planner(args):
+    """Plans a synthetic invoice of each size, then runs every candidate strategy to compare."""
+    from concurrent.futures import ProcessPoolExecutor
+    workdir = tempfile.mkdtemp(prefix="invoice-bench-")
+    workers = args.workers or os.cpu_count() or 1
+    print(f"{'rows':>8} {'strategy':<12} {'pred s':>8} {'took s':>8} {'pred MB':>8} {'peak MB':>8} {'worker':>8}")
+    for rows in args.rows:
+        path = write_synthetic_workbook(os.path.join(workdir, f"plan{rows}.csv"), rows)
+        plan = app.plan_invoice_render(path, workers=workers, memory_mb=args.memory_budget, seconds=args.latency_budget)
+        for strategy, (predicted_s, predicted_mb) in plan["candidates"].items():
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                took, peak, worker = pool.submit(_run_strategy, path, strategy, workers).result()
+            mark = "  <- chosen" if strategy == plan["strategy"] else ""
+            print(f"{rows:>8,} {strategy:<12} {predicted_s:>8.1f} {took:>8.1f} {predicted_mb:>8,} "
+                  f"{peak or 0:>8,.0f} {worker or 0:>8,.0f}{mark}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("readers", help="compare Excel reader backends")
+    p.add_argument("--rows", type=int, default=20000)
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--sheets", type=int, default=1, help="split the rows across this many sheets")
+    p.set_defaults(func=bench_readers)
+
+    p = sub.add_parser("ingest", help="time and peak RSS of in-memory vs streaming ingestion")
+    p.add_argument("--rows", type=int, default=300000)
+    p.add_argument("--format", choices=("csv", "xlsx"), default="csv")
+    p.add_argument("--chunk", type=int, default=app.INGEST_CHUNK_ROWS)
+    p.set_defaults(func=bench_ingest)
+
+    p = sub.add_parser("ingest-one")
+    p.add_argument("--mode", choices=("memory", "stream"), required=True)
+    p.add_argument("--chunk", type=int, default=app.INGEST_CHUNK_ROWS)
+    p.add_argument("path")
+    p.set_defaults(func=bench_ingest_one)
+
+    p = sub.add_parser("bundle", help="one bundled PDF vs separate invoice files plus a merge")
+    p.add_argument("--invoices", type=int, default=50)
+    p.add_argument("--rows", type=int, default=40)
+    p.set_defaults(func=bench_bundle)
+
+    p = sub.add_parser("profiles", help="size and render time of one invoice under each output profile")
+    p.add_argument("--rows", type=int, default=200)
+    p.add_argument("--repeat", type=int, default=3)
+    p.set_defaults(func=bench_profiles)
+
+    p = sub.add_parser("ledger", help="XLSX/CSV ledger export vs the PDF report")
+    p.add_argument("--rows", type=int, default=50000)
+    p.add_argument("--skip-pdf", action="store_true", help="only time the exports")
+    p.set_defaults(func=bench_ledger)
+
+    p = sub.add_parser("backup", help="online backup and integrity check timings on a synthetic database")
+    p.add_argument("--mb", type=int, default=500, help="size of the synthetic database")
+    p.add_argument("--pages", type=int, nargs="+", default=[app.BACKUP_PAGES_PER_STEP, 4096, -1],
+                   help="pages per backup step to compare (-1 copies everything in one step)")
+    p.set_defaults(func=bench_backup)
+
+    p = sub.add_parser("chunked", help="one large invoice: single build vs chunked rendering across processes")
+    p.add_argument("--rows", type=int, default=100000)
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    p.set_defaults(func=bench_chunked)
+
+    p = sub.add_parser("pipeline", help="docs/sec of the staged invoice pipeline vs the sequential loop")
+    p.add_argument("--invoices", type=int, default=200)
+    p.add_argument("--rows", type=int, default=200)
+    p.add_argument("--format", choices=("csv", "xlsx"), default="xlsx")
+    p.add_argument("--workers", type=int, default=None)
+    p.add_argument("--queue-size", type=int, default=app.PIPELINE_QUEUE_SIZE)
+    p.set_defaults(func=bench_pipeline)
+
+    p = sub.add_parser("workers", help="drain a shared job queue with several worker processes")
+    p.add_argument("--processes", type=int, default=4)
+    p.add_argument("--invoices", type=int, default=100)
+    p.add_argument("--rows", type=int, default=200)
+    p.add_argument("--lease", type=float, default=4.0, help="short, so a killed worker's job comes back quickly")
+    p.add_argument("--kill-one", action="store_true", help="kill the first worker while it holds a job")
+    p.set_defaults(func=bench_workers)
+
+    p = sub.add_parser("queries", help="SQL statements per screen action at growing row counts")
+    p.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 500],
+                   help="vendors per database; each holds size x size invoices")
+    p.set_defaults(func=bench_queries)
+
+    p = sub.add_parser("planner", help="predicted vs actual time and memory of each render strategy")
+    p.add_argument("--rows", type=int, nargs="+", default=[2000, 20000])
+    p.add_argument("--workers", type=int, default=None)
+    p.add_argument("--memory-budget", type=float, default=app.PLAN_MEMORY_BUDGET_MB)
+    p.add_argument("--latency-budget", type=float, default=app.PLAN_LATENCY_BUDGET_SECONDS)
+    p.set_defaults(func=bench_planner)
+
+    p = sub.add_parser("loadtest", help="p50/p99 latency and docs/sec against the HTTP service")
+    p.add_argument("--url", default=f"http://{app.SERVICE_HOST}:{app.SERVICE_PORT}")
+    p.add_argument("--requests", type=int, default=200)
+    p.add_argument("--concurrency", type=int, default=8)
+    p.add_argument("--vendor", help="existing vendor ID (a throwaway vendor is created otherwise)")
+    p.add_argument("--excel", help="workbook to invoice (a synthetic one is generated otherwise)")
+    p.add_argument("--rows", type=int, default=200)
+    p.set_defaults(func=bench_loadtest)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import csv
+import os
+import sqlite3
+import sys
+import tempfile
+
+import pandas as pd
+import pytest
+
+# InvoiceGen opens and migrates its database at import time, so point it at a scratch file
+# before the first test module imports it.
+os.environ["INVOICEGEN_DB"] = os.path.join(tempfile.mkdtemp(prefix="invoicegen-tests-"), "app.db")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import InvoiceGen  # noqa: E402
+
+TABLES = ("invoices", "invoice_lines", "vendors", "vendor_generations", "generation_jobs", "execution_plans",
+          "soa_jobs")
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """Runs each test in its own folder, so render_cache/, archive/ and friends stay out of the repo."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def db():
+    """A connection to the test database; every table a test may fill is emptied afterwards."""
+    connection = sqlite3.connect(InvoiceGen.DB_FILE)
+    yield connection
+    connection.rollback()
+    with connection:
+        for table in TABLES:
+            connection.execute(f"DELETE FROM {table}")
+    connection.close()
+
+
+@pytest.fixture
+def make_workbook(workdir):
+    """Writes {sheet: rows} to an .xlsx (or one sheet's rows to a .csv) in the test folder; returns its path."""
+    def make(sheets, name="book.xlsx"):
+        path = workdir / name
+        if path.suffix == ".csv":
+            (rows,) = sheets.values()
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                csv.writer(f).writerows([["" if c is None else c for c in row] for row in rows])
+        else:
+            with pd.ExcelWriter(path, engine="openpyxl") as writer:
+                for sheet, rows in sheets.items():
+                    pd.DataFrame(rows).to_excel(writer, sheet_name=sheet, header=False, index=False)
+        return str(path)
+    return make
+
+
+@pytest.fixture
+def assets(workdir):
+    """The header, footer, signature and seal images the PDF templates draw, as small solid images."""
+    from PIL import Image
+    for name in InvoiceGen.PDF_ASSETS:
+        Image.new("RGB", (400, 80), (30, 90, 160)).save(workdir / name)
+    return workdir
+
+
+@pytest.fixture
+def input_details():
+    return {"vendor_name": "ACME Trading", "vendor_address": "Doha", "invoice_no": "INV-1",
+            "invoice_date": "2024-01-31", "invoice_type": "Invoice", "vendor_po": "PO-1"}
+
+
+@pytest.fixture
+def item_rows():
+    """Builds an invoice sheet: a title, the Name/Amount header, `count` distinct lines and a total row."""
+    def rows(count, start=0, amount=10.0):
+        lines = [[f"Item {i}", f"Line {i} description", amount] for i in range(start, start + count)]
+        return [["Invoice lines", None, None], ["Name", "Description", "Amount"]] + lines + [["Total", None, amount * count]]
+    return rows
@@ -0,0 +1,84 @@
+from datetime import date, timedelta
+
+import pytest
+
+import InvoiceGen
+from InvoiceGen import aging_overview, backfill_invoice_amounts, compute_aging, vendor_transactions
+
+AGES = (0, 30, 31, 60, 61, 90, 91, 120, 121, 400)
+
+
+def add(db, vendor_id, age, cents, invoice_type="Invoice", excel_file=None, invoice_no=None):
+    day = (date.today() - timedelta(days=age)).isoformat()
+    db.execute("INSERT INTO invoices (vendor_id, invoice_no, invoice_date, invoice_type, excel_file, amount_cents) "
+               "VALUES (?,?,?,?,?,?)", (vendor_id, invoice_no or f"{vendor_id}-{age}-{invoice_type}", day,
+                                        invoice_type, excel_file, cents))
+
+
+@pytest.fixture
+def ledger(db):
+    with db:
+        db.execute("INSERT INTO vendors (vendor_id, vendor_name) VALUES ('V1', 'Alpha'), ('V2', 'Beta')")
+        for i, age in enumerate(AGES):
+            add(db, "V1", age, 1000 + i)
+            add(db, "V2", age, 500 * (i + 1), "Credit" if i % 3 else "Invoice")
+        add(db, "V1", 10, None, invoice_no="UNPRICED")
+    return db
+
+
+def test_buckets_match_compute_aging(ledger):
+    rows = {r["vendor_id"]: r for r in aging_overview(ledger)}
+    for vendor_id in ("V1", "V2"):
+        expected = compute_aging(list(vendor_transactions(ledger, vendor_id)))
+        row = rows[vendor_id]
+        for bucket in InvoiceGen.AGING_BUCKETS + ("total",):
+            assert row[bucket] / 100 == pytest.approx(expected[bucket]), (vendor_id, bucket)
+        assert row["overdue"] == row["total"] - row["current"]
+    assert rows["V1"]["vendor_name"] == "Alpha"
+
+
+def test_day_boundaries(db):
+    with db:
+        for age in AGES:
+            add(db, "V1", age, 100)
+    row = aging_overview(db)[0]
+    # Invoices sit in the credit column, so balances are negative
+    assert [row[b] for b in InvoiceGen.AGING_BUCKETS] == [-200, -200, -200, -200, -200]
+
+
+def test_sorting(ledger):
+    assert [r["vendor_id"] for r in aging_overview(ledger, "vendor_name", descending=False)] == ["V1", "V2"]
+    overdue = [r["overdue"] for r in aging_overview(ledger)]
+    assert overdue == sorted(overdue, reverse=True)
+    with pytest.raises(ValueError):
+        aging_overview(ledger, "vendor_name; DROP TABLE invoices")
+
+
+def test_archived_years_are_included(db):
+    with db:
+        db.execute("INSERT INTO invoices (vendor_id, invoice_no, invoice_date, invoice_type, amount_cents) "
+                   "VALUES ('V1', 'OLD', '2020-03-01', 'Invoice', 700)")
+        add(db, "V1", 5, 300)
+    InvoiceGen.archive_fiscal_year(2020, vacuum=False)
+    row = aging_overview(db)[0]
+    assert (row["4plus"], row["total"]) == (-700, -1000)
+
+
+def test_backfill_reads_each_workbook_once(db, make_workbook, item_rows, monkeypatch):
+    path = make_workbook({"Items": item_rows(4, amount=2.5)})
+    with db:
+        add(db, "V1", 5, None, excel_file=path, invoice_no="A")
+        add(db, "V1", 6, None, excel_file=path, invoice_no="B")
+        add(db, "V1", 7, None, excel_file="missing.xlsx", invoice_no="C")
+        add(db, "V1", 8, 999, excel_file=path, invoice_no="PRICED")
+    reads = []
+    total = InvoiceGen.excel_total
+    monkeypatch.setattr(InvoiceGen, "excel_total", lambda p: reads.append(p) or total(p))
+    progress = []
+    assert backfill_invoice_amounts(db, lambda done, count: progress.append((done, count))) == 2
+    assert sorted(reads) == sorted([path, "missing.xlsx"])
+    assert dict(db.execute("SELECT invoice_no, amount_cents FROM invoices")) == {"A": 1000, "B": 1000, "C": None,
+                                                                                 "PRICED": 999}
+    assert InvoiceGen.unpriced_invoice_count(db) == 1
+    # Unreadable workbooks still count towards the progress
+    assert progress == [(1, 2), (2, 2)]
@@ -0,0 +1,84 @@
+import os
+from datetime import date
+
+import pandas as pd
+import pytest
+
+import InvoiceGen
+from InvoiceGen import archive_fiscal_year, find_billed_lines, invoice_line_keys, invoice_source, record_invoice
+
+LINES = invoice_line_keys(pd.DataFrame({"Name": ["Widget", "Gadget"], "Amount": [10.5, 3]}))
+
+
+def issue(db, invoice_no, invoice_date, vendor_id="V1"):
+    details = {"invoice_no": invoice_no, "invoice_date": invoice_date, "invoice_type": "Invoice", "vendor_po": "PO-1"}
+    with db:
+        return record_invoice(db, vendor_id, details, "book.xlsx", 1350, signature="sig", line_keys=LINES)
+
+
+def invoice_numbers(db, from_date=None, to_date=None):
+    with invoice_source(db, from_date, to_date) as source:
+        return sorted(r[0] for r in db.execute(f"SELECT invoice_no FROM {source}"))
+
+
+def test_year_moves_with_its_lines(db):
+    issue(db, "OLD", "2023-06-01")
+    issue(db, "NEW", "2024-01-10")
+    assert archive_fiscal_year(2023) == {"year": 2023, "moved": 1, "path": InvoiceGen.archive_path(2023)}
+    assert [r[0] for r in db.execute("SELECT invoice_no FROM invoices")] == ["NEW"]
+    assert [r[0] for r in db.execute("SELECT DISTINCT invoice_no FROM invoice_lines")] == ["NEW"]
+    assert InvoiceGen.archived_years() == [2023]
+
+
+def test_archive_keeps_every_column(db):
+    invoice_id = issue(db, "OLD", "2023-06-01")
+    live = db.execute("SELECT * FROM invoices WHERE id=?", (invoice_id,)).fetchone()
+    archive_fiscal_year(2023)
+    db.execute("ATTACH DATABASE ? AS arch", (InvoiceGen.archive_path(2023),))
+    try:
+        assert db.execute("SELECT * FROM arch.invoices").fetchall() == [live]
+        assert db.execute("SELECT COUNT(*) FROM arch.invoice_lines WHERE invoice_id=?", (invoice_id,)).fetchone()[0] == 2
+    finally:
+        db.execute("DETACH DATABASE arch")
+
+
+def test_invoice_source_attaches_only_overlapping_years(db):
+    issue(db, "OLD", "2023-06-01")
+    issue(db, "NEW", "2024-01-10")
+    archive_fiscal_year(2023)
+    assert invoice_numbers(db) == ["NEW", "OLD"]
+    with invoice_source(db, "2023-01-01", "2023-12-31") as source:
+        assert "UNION ALL" in source
+    with invoice_source(db, "2024-01-01", "2024-12-31") as source:
+        assert source == "invoices"
+    assert db.execute("PRAGMA database_list").fetchall()[1:] == []
+
+
+def test_rerun_moves_back_dated_invoices(db):
+    issue(db, "FIRST", "2023-03-01")
+    archive_fiscal_year(2023)
+    issue(db, "LATE", "2023-11-30")
+    assert archive_fiscal_year(2023, vacuum=False)["moved"] == 1
+    assert invoice_numbers(db, "2023-01-01", "2023-12-31") == ["FIRST", "LATE"]
+
+
+def test_open_year_is_refused():
+    with pytest.raises(ValueError):
+        archive_fiscal_year(date.today().year)
+    assert not os.path.exists(InvoiceGen.ARCHIVE_DIR)
+
+
+def test_archivable_years(db):
+    issue(db, "A", "2022-05-01")
+    issue(db, "B", "2023-06-01")
+    issue(db, "C", date.today().isoformat())
+    assert InvoiceGen.archivable_years(db) == [2022, 2023]
+
+
+def test_archived_lines_are_still_found(db):
+    issue(db, "ARCHIVED", "2023-12-20")
+    issue(db, "LIVE", "2024-01-10")
+    archive_fiscal_year(2023, vacuum=False)
+    assert db.execute("SELECT COUNT(*) FROM invoice_lines").fetchone()[0] == len(LINES)
+    found = find_billed_lines(db, "V1", LINES[:1], "2024-01-15", "NEW", 30)
+    assert [r[2] for r in found] == ["LIVE", "ARCHIVED"]
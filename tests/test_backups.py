@@ -0,0 +1,91 @@
+import os
+import sqlite3
+
+import pytest
+
+import InvoiceGen
+from InvoiceGen import backup_database, integrity_check, list_backups, prune_backups, restore_database
+
+
+def add_vendor(db, vendor_id):
+    with db:
+        db.execute("INSERT INTO vendors (vendor_id, vendor_name, vendor_address, po_number) VALUES (?,?,?,?)",
+                   (vendor_id, f"Vendor {vendor_id}", "Doha", "PO"))
+
+
+def vendor_ids(db):
+    return [r[0] for r in db.execute("SELECT vendor_id FROM vendors ORDER BY vendor_id")]
+
+
+def corrupt_copy(src, dest):
+    data = bytearray(open(src, "rb").read())
+    data[100:4096] = b"\xff" * (4096 - 100)  # the schema page
+    with open(dest, "wb") as f:
+        f.write(data)
+
+
+def test_backup_is_a_checked_copy(db, workdir):
+    add_vendor(db, "V1")
+    calls = []
+    result = backup_database(progress=lambda done, total: calls.append((done, total)))
+    assert list_backups() == [result["path"]] and os.path.dirname(result["path"]) == InvoiceGen.BACKUP_DIR
+    assert result["bytes"] == os.path.getsize(result["path"])
+    assert calls and calls[-1][0] == calls[-1][1]
+    assert not os.path.exists(result["path"] + ".partial")
+    assert integrity_check(result["path"]) == []
+    copy = sqlite3.connect(result["path"])
+    try:
+        assert vendor_ids(copy) == ["V1"]
+    finally:
+        copy.close()
+
+
+def test_retention_keeps_the_newest(db, workdir):
+    paths = [backup_database(keep=100)["path"] for _ in range(3)]
+    assert list_backups() == paths[::-1]
+    assert prune_backups(keep=2) == [paths[0]]
+    assert list_backups() == paths[:0:-1]
+    backup_database(keep=1)
+    assert len(list_backups()) == 1
+
+
+def test_integrity_check_reports_damage(db, workdir):
+    path = backup_database()["path"]
+    corrupt_copy(path, str(workdir / "broken.db"))
+    assert integrity_check(str(workdir / "broken.db"))
+    (workdir / "notes.db").write_text("not a database at all, just some text " * 200)
+    assert integrity_check(str(workdir / "notes.db"))
+
+
+def test_restore_brings_the_data_back_and_moves_the_epoch(db, workdir):
+    add_vendor(db, "V1")
+    path = backup_database()["path"]
+    add_vendor(db, "V2")
+    epoch = InvoiceGen.write_generation(db)[0]
+    result = restore_database(path)
+    # The open connection sees the restored contents
+    assert vendor_ids(db) == ["V1"]
+    assert InvoiceGen.write_generation(db)[0] > epoch
+    safety = sqlite3.connect(result["safety_backup"])
+    try:
+        assert vendor_ids(safety) == ["V1", "V2"]
+    finally:
+        safety.close()
+
+
+def test_damaged_backup_is_not_restored(db, workdir):
+    add_vendor(db, "V1")
+    path = backup_database()["path"]
+    corrupt_copy(path, str(workdir / "broken.db"))
+    add_vendor(db, "V2")
+    with pytest.raises(RuntimeError):
+        restore_database(str(workdir / "broken.db"))
+    assert vendor_ids(db) == ["V1", "V2"]
+    assert len(list_backups()) == 1  # no safety snapshot either
+
+
+def test_backup_due(workdir):
+    assert InvoiceGen.backup_due()
+    backup_database()
+    assert not InvoiceGen.backup_due()
+    assert InvoiceGen.backup_due(interval_hours=0)
@@ -0,0 +1,37 @@
+from pypdf import PdfReader
+
+from InvoiceGen import render_invoice_bundle
+
+
+def bundle_rows(make_workbook, item_rows):
+    first = make_workbook({"Items": item_rows(3)}, "first.xlsx")
+    second = make_workbook({"Items": item_rows(80, start=100)}, "second.xlsx")
+    return [("ACME Trading", "Doha", "INV-1", "2024-01-31", "Invoice", "PO-1", first),
+            ("ACME Trading", "Doha", "INV-2", "2024-02-29", "Invoice", "PO-1", second)]
+
+
+def test_each_invoice_starts_a_page_with_its_own_numbering(assets, make_workbook, item_rows, workdir):
+    output = str(workdir / "bundle.pdf")
+    render_invoice_bundle(output, bundle_rows(make_workbook, item_rows))
+    texts = [page.extract_text() for page in PdfReader(output).pages]
+    assert len(texts) >= 3
+    starts = [i for i, text in enumerate(texts) if "INVOICE NO:" in text]
+    assert len(starts) == 2 and "INV-1" in texts[0] and "INV-2" in texts[starts[1]]
+    assert "Invoice INV-2 - Page 1" in texts[starts[1]]
+    assert "Invoice INV-2 - Page 2" in texts[starts[1] + 1]
+    assert "Item 2" in texts[0] and "Item 179" in "".join(texts[starts[1]:])
+
+
+def test_outline_has_one_bookmark_per_invoice(assets, make_workbook, item_rows, workdir):
+    output = str(workdir / "bundle.pdf")
+    render_invoice_bundle(output, bundle_rows(make_workbook, item_rows))
+    reader = PdfReader(output)
+    starts = [i for i, page in enumerate(reader.pages) if "INVOICE NO:" in page.extract_text()]
+    assert [(entry.title, reader.get_destination_page_number(entry)) for entry in reader.outline] == \
+        [("Invoice INV-1", starts[0]), ("Invoice INV-2", starts[1])]
+
+
+def test_outline_can_be_left_out(assets, make_workbook, item_rows, workdir):
+    output = str(workdir / "bundle.pdf")
+    render_invoice_bundle(output, bundle_rows(make_workbook, item_rows), outline=False)
+    assert PdfReader(output).outline == []
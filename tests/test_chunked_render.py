@@ -0,0 +1,58 @@
+import io
+
+import pandas as pd
+import pytest
+from pypdf import PdfReader
+
+from InvoiceGen import create_invoice_pdf, create_invoice_pdf_chunked, plan_invoice_chunks, stitch_pdf_parts
+
+
+@pytest.fixture
+def frame():
+    # Descriptions of varying length, so rows wrap to different heights
+    return pd.DataFrame({"Name": [f"Item {i}" for i in range(180)],
+                         "Description": [" ".join(["word"] * (1 + i % 23)) for i in range(180)],
+                         "Amount": [float(i % 7) for i in range(180)]})
+
+
+def page_texts(path):
+    return [page.extract_text() for page in PdfReader(path).pages]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_chunked_pdf_matches_the_single_build(assets, input_details, frame, workdir, workers):
+    total = frame["Amount"].sum()
+    single, chunked = str(workdir / "single.pdf"), str(workdir / "chunked.pdf")
+    create_invoice_pdf(single, input_details, frame, total)
+    chunks = create_invoice_pdf_chunked(chunked, input_details, frame, total, workers=workers, pages_per_chunk=1)
+    expected = page_texts(single)
+    assert len(expected) > 3 and chunks >= 3
+    assert page_texts(chunked) == expected
+
+
+def test_chunks_are_page_aligned(input_details, frame):
+    _, ranges = plan_invoice_chunks(input_details, frame, workers=1, pages_per_chunk=2)
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(frame)
+    assert all(stop == start for (_, stop), (start, _) in zip(ranges, ranges[1:]))
+
+
+def test_short_or_multi_sheet_invoices_use_the_single_build(assets, input_details, frame, workdir):
+    output = str(workdir / "out.pdf")
+    assert create_invoice_pdf_chunked(output, input_details, frame.head(5), 10.0, workers=2) == 0
+    sections = [{"sheet": "A", "subtotal": 1.0, "rows": 90}, {"sheet": "B", "subtotal": 2.0, "rows": 90}]
+    sheets = frame.assign(Sheet=["A"] * 90 + ["B"] * 90)[["Sheet", "Name", "Description", "Amount"]]
+    assert create_invoice_pdf_chunked(output, input_details, sheets, 3.0, sections=sections, workers=2,
+                                      pages_per_chunk=1) == 0
+    assert "Sub-Total (B)" in "".join(page_texts(output))
+
+
+def test_stitch_keeps_part_order(assets, input_details, frame, workdir):
+    parts = []
+    for name in ("first", "second"):
+        buffer = io.BytesIO()
+        create_invoice_pdf(buffer, dict(input_details, invoice_no=name), frame.head(3), 1.0)
+        parts.append(buffer.getvalue())
+    output = str(workdir / "stitched.pdf")
+    stitch_pdf_parts(output, parts)
+    texts = page_texts(output)
+    assert "first" in texts[0] and "second" in texts[-1]
@@ -0,0 +1,66 @@
+import pandas as pd
+import pytest
+
+import InvoiceGen
+from InvoiceGen import find_billed_lines, invoice_line_keys, record_invoice
+
+LINES = invoice_line_keys(pd.DataFrame({"Name": ["Widget", "Gadget"], "Amount": [10.5, 3]}))
+WIDGET = LINES[:1]
+
+
+def issue(db, invoice_no, invoice_date, vendor_id="V1", lines=LINES):
+    details = {"invoice_no": invoice_no, "invoice_date": invoice_date, "invoice_type": "Invoice", "vendor_po": "PO-1"}
+    with db:
+        record_invoice(db, vendor_id, details, "book.xlsx", 1350, line_keys=lines)
+
+
+def billed(db, invoice_date, lookback_days=30, invoice_no="NEW", vendor_id="V1", lines=WIDGET):
+    return [r[2] for r in find_billed_lines(db, vendor_id, lines, invoice_date, invoice_no, lookback_days)]
+
+
+def test_line_keys_ignore_case_and_spacing():
+    frame = pd.DataFrame({"Name": ["  widget ", "WIDGET", None], "Amount": [10.5, 10.5, 0]})
+    assert invoice_line_keys(frame) == [WIDGET[0], WIDGET[0]]
+
+
+def test_lower_bound_is_inclusive(db):
+    issue(db, "EDGE", "2024-01-01")
+    issue(db, "OLD", "2023-12-31")
+    assert billed(db, "2024-01-31") == ["EDGE"]
+
+
+def test_upper_bound_excludes_later_invoices(db):
+    issue(db, "SAME-DAY", "2024-01-31")
+    issue(db, "LATER", "2024-02-01")
+    assert billed(db, "2024-01-31") == ["SAME-DAY"]
+
+
+def test_results_are_most_recent_first(db):
+    issue(db, "A", "2024-01-05")
+    issue(db, "B", "2024-01-20")
+    assert billed(db, "2024-01-31") == ["B", "A"]
+
+
+def test_own_invoice_and_other_vendors_are_skipped(db):
+    issue(db, "NEW", "2024-01-10")
+    issue(db, "OTHER", "2024-01-10", vendor_id="V2")
+    assert billed(db, "2024-01-31") == []
+
+
+def test_hash_hits_are_confirmed_against_the_stored_line(db):
+    # Same hash, different text: a collision must not be reported
+    issue(db, "A", "2024-01-10", lines=[(WIDGET[0][0], "sprocket", 99)])
+    assert billed(db, "2024-01-31") == []
+
+
+def test_default_lookback(db, monkeypatch):
+    monkeypatch.setattr(InvoiceGen, "DUPLICATE_LOOKBACK_DAYS", 10)
+    issue(db, "IN", "2024-01-21")
+    issue(db, "OUT", "2024-01-20")
+    assert [r[2] for r in find_billed_lines(db, "V1", WIDGET, "2024-01-31")] == ["IN"]
+
+
+@pytest.mark.parametrize("lines", [[], ()])
+def test_no_lines_no_query(db, lines):
+    assert find_billed_lines(db, "V1", lines, "2024-01-31") == []
+
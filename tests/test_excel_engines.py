@@ -0,0 +1,67 @@
+import csv
+
+import pandas as pd
+import pytest
+
+import InvoiceGen
+
+ROWS = [
+    ["Invoice", None, None],
+    [None, None, None],
+    ["Name", "Qty", "Amount"],
+    ["Widget", 2, 10.5],
+    ["Gadget", None, 3],
+    ["Total", None, 13.5],
+]
+
+# The file type each reader backend is picked for
+ENGINE_FORMATS = {"calamine": ".xlsx", "openpyxl": ".xlsx", "pandas": ".xlsx", "odf": ".ods", "csv": ".csv"}
+
+
+def write_workbook(path):
+    if path.suffix == ".csv":
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            csv.writer(f).writerows([["" if c is None else c for c in row] for row in ROWS])
+    else:
+        pd.DataFrame(ROWS).to_excel(path, header=False, index=False, engine="odf" if path.suffix == ".ods" else "openpyxl")
+    return str(path)
+
+
+@pytest.mark.parametrize("engine", InvoiceGen.available_excel_engines())
+def test_every_engine_reads_the_same_frame(engine, tmp_path):
+    path = write_workbook(tmp_path / f"book{ENGINE_FORMATS[engine]}")
+    expected = InvoiceGen.rows_to_frame(InvoiceGen._trim_rows(ROWS))
+    pd.testing.assert_frame_equal(InvoiceGen.read_excel_frame(path, engine=engine), expected)
+
+
+@pytest.mark.parametrize("engine", InvoiceGen.available_excel_engines())
+def test_every_engine_finds_the_same_header(engine, tmp_path):
+    path = write_workbook(tmp_path / f"book{ENGINE_FORMATS[engine]}")
+    expected = InvoiceGen.rows_to_frame(InvoiceGen._trim_rows(ROWS), header=2)
+    frame = InvoiceGen.read_excel_frame(path, header=2, engine=engine)
+    pd.testing.assert_frame_equal(frame, expected)
+    assert list(frame.columns) == ["Name", "Qty", "Amount"]
+
+
+@pytest.mark.parametrize("name, engine", [("a.csv", "csv"), ("a.TXT", "csv"), ("a.ods", "odf"), ("a.xls", "pandas")])
+def test_select_engine_by_file_type(name, engine):
+    assert InvoiceGen.select_excel_engine(name, size=0) == engine
+
+
+def test_select_engine_for_xlsx_by_size(monkeypatch):
+    monkeypatch.setattr(InvoiceGen, "available_excel_engines", lambda: ["openpyxl", "pandas", "csv"])
+    assert InvoiceGen.select_excel_engine("a.xlsx", size=0) == "pandas"
+    assert InvoiceGen.select_excel_engine("a.xlsx", size=InvoiceGen.LARGE_EXCEL_BYTES) == "openpyxl"
+    monkeypatch.setattr(InvoiceGen, "available_excel_engines", lambda: ["calamine", "openpyxl", "pandas", "csv"])
+    assert InvoiceGen.select_excel_engine("a.xlsx", size=InvoiceGen.LARGE_EXCEL_BYTES) == "calamine"
+
+
+def test_forced_engine_wins(monkeypatch):
+    monkeypatch.setattr(InvoiceGen, "EXCEL_ENGINE", "openpyxl")
+    assert InvoiceGen.select_excel_engine("a.csv", size=0) == "openpyxl"
+
+
+def test_unknown_engine_is_rejected(tmp_path):
+    path = write_workbook(tmp_path / "book.csv")
+    with pytest.raises(ValueError):
+        InvoiceGen.read_excel_frame(path, engine="lotus")
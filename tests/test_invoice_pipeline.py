@@ -0,0 +1,83 @@
+import csv
+import os
+
+import pytest
+from pypdf import PdfReader
+
+from InvoiceGen import read_invoice_manifest, run_invoice_batch
+
+
+@pytest.fixture
+def manifest(db, assets, make_workbook, item_rows, workdir):
+    with db:
+        db.executemany("INSERT INTO vendors (vendor_id, vendor_name, vendor_address, po_number) VALUES (?,?,?,?)",
+                       [("V1", "ACME Trading", "Doha", "PO-1"), ("V2", "Boxwell", "Lusail", "PO-2")])
+    os.makedirs(workdir / "books")
+    rows = [{"vendor_id": "V1", "invoice_no": f"INV-{i}", "invoice_date": "2024-03-01", "invoice_type": "",
+             "excel_file": os.path.basename(make_workbook({"Items": item_rows(3 + i, start=10 * i)}, f"books/b{i}.xlsx"))}
+            for i in range(4)]
+    rows.append({"vendor_id": "V2", "invoice_no": "INV-X", "invoice_date": "", "invoice_type": "Credit",
+                 "excel_file": "missing.xlsx"})
+    path = workdir / "books" / "manifest.csv"
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    return str(path)
+
+
+def pdf_texts(folder):
+    return {name: [page.extract_text() for page in PdfReader(os.path.join(folder, name)).pages]
+            for name in sorted(os.listdir(folder))}
+
+
+def recorded(db):
+    return db.execute("SELECT vendor_id, invoice_no, invoice_type, amount_cents FROM invoices ORDER BY invoice_no").fetchall()
+
+
+def test_manifest_resolves_vendors_and_paths(db, manifest, workdir):
+    jobs = read_invoice_manifest(db, manifest)
+    assert [j["input_details"]["invoice_no"] for j in jobs] == ["INV-0", "INV-1", "INV-2", "INV-3", "INV-X"]
+    assert jobs[0]["excel_file"] == str(workdir / "books" / "b0.xlsx")
+    assert jobs[0]["input_details"]["vendor_name"] == "ACME Trading"
+    assert jobs[0]["input_details"]["invoice_type"] == "Debit"
+    assert jobs[4]["input_details"]["invoice_type"] == "Credit" and jobs[4]["input_details"]["invoice_date"]
+
+
+def test_manifest_errors(db, workdir):
+    path = workdir / "manifest.csv"
+    path.write_text("vendor_id,invoice_no\nV1,INV-1\n")
+    with pytest.raises(ValueError, match="excel_file"):
+        read_invoice_manifest(db, str(path))
+    path.write_text("vendor_id,invoice_no,excel_file\nNOPE,INV-1,a.xlsx\n")
+    with pytest.raises(ValueError, match="Line 2: unknown vendor 'NOPE'"):
+        read_invoice_manifest(db, str(path))
+
+
+def test_pipeline_matches_sequential(db, manifest, workdir):
+    jobs = read_invoice_manifest(db, manifest)
+    results = {}
+    for mode, sequential in (("sequential", True), ("pipeline", False)):
+        calls = []
+        summary = run_invoice_batch(jobs, str(workdir / mode), workers=2, queue_size=1, sequential=sequential,
+                                    progress=lambda done, total: calls.append((done, total)))
+        assert (summary["written"], [f[0] for f in summary["failures"]]) == (4, ["INV-X"])
+        assert summary["failures"][0][1].startswith("read:")
+        assert sorted(calls)[-1] == (5, 5)
+        assert summary["stages"]["write"]["items"] == 4
+        results[mode] = (pdf_texts(workdir / mode), recorded(db))
+        with db:
+            db.execute("DELETE FROM invoice_lines")
+            db.execute("DELETE FROM invoices")
+    assert results["pipeline"] == results["sequential"]
+    texts, rows = results["pipeline"]
+    assert sorted(texts) == [f"Invoice_V1_INV-{i}.pdf" for i in range(4)]
+    assert rows == [("V1", f"INV-{i}", "Debit", (3 + i) * 1000) for i in range(4)]
+
+
+def test_lines_billed_earlier_are_reported(db, manifest, workdir):
+    jobs = read_invoice_manifest(db, manifest)[:1]
+    run_invoice_batch(jobs, str(workdir / "out"), workers=1, sequential=True)
+    again = [dict(jobs[0], input_details=dict(jobs[0]["input_details"], invoice_no="INV-0b"))]
+    summary = run_invoice_batch(again, str(workdir / "out"), workers=1)
+    assert [(no, len(billed)) for no, billed in summary["duplicates"]] == [("INV-0b", 3)]
@@ -0,0 +1,134 @@
+import os
+import sqlite3
+
+import pytest
+
+import InvoiceGen
+from InvoiceGen import claim_job, complete_job, enqueue_job, renew_lease
+
+
+def job_row(db, job_id):
+    return db.execute("SELECT status, worker, attempts, result, error FROM generation_jobs WHERE id=?", (job_id,)).fetchone()
+
+
+def rendered(path, text):
+    with open(path, "w") as f:
+        f.write(text)
+    return str(path)
+
+
+def test_claim_takes_the_oldest_queued_job(db, tmp_path):
+    first = enqueue_job(db, "soa", {"n": 1}, str(tmp_path / "1.pdf"))
+    enqueue_job(db, "soa", {"n": 2}, str(tmp_path / "2.pdf"))
+    job = claim_job(db, "w1")
+    assert (job["id"], job["payload"], job["attempt"]) == (first, {"n": 1}, 1)
+    assert job_row(db, first)[:3] == ("running", "w1", 1)
+    assert claim_job(db, "w2")["payload"] == {"n": 2}
+    assert claim_job(db, "w3") is None
+
+
+def test_completed_job_publishes_its_file(db, tmp_path):
+    job_id = enqueue_job(db, "soa", {}, str(tmp_path / "out.pdf"))
+    job = claim_job(db, "w1")
+    partial = rendered(tmp_path / "out.pdf.part", "w1")
+    assert complete_job(db, "w1", job, partial, meta={"pages": 3})
+    assert not os.path.exists(partial)
+    assert open(tmp_path / "out.pdf").read() == "w1"
+    status, _, _, result, error = job_row(db, job_id)
+    assert (status, result, error) == ("done", '{"pages": 3}', None)
+
+
+def test_expired_lease_is_claimed_again(db, tmp_path):
+    job_id = enqueue_job(db, "soa", {}, str(tmp_path / "out.pdf"))
+    claim_job(db, "w1", lease_seconds=-1)
+    job = claim_job(db, "w2")
+    assert (job["id"], job["attempt"]) == (job_id, 2)
+    assert job_row(db, job_id)[:3] == ("running", "w2", 2)
+
+
+def test_worker_that_lost_its_lease_cannot_complete(db, tmp_path):
+    job_id = enqueue_job(db, "soa", {}, str(tmp_path / "out.pdf"))
+    stale = claim_job(db, "w1", lease_seconds=-1)
+    current = claim_job(db, "w2")
+    assert not renew_lease(db, job_id, "w1")
+
+    late = rendered(tmp_path / "w1.part", "w1")
+    assert not complete_job(db, "w1", stale, late, meta={"pages": 1})
+    assert not os.path.exists(late)
+    assert not os.path.exists(tmp_path / "out.pdf")
+    assert job_row(db, job_id)[:2] == ("running", "w2")
+
+    assert renew_lease(db, job_id, "w2")
+    assert complete_job(db, "w2", current, rendered(tmp_path / "w2.part", "w2"), meta={"pages": 1})
+    assert open(tmp_path / "out.pdf").read() == "w2"
+    assert job_row(db, job_id)[:2] == ("done", "w2")
+
+
+def test_lost_lease_does_not_overwrite_a_finished_job(db, tmp_path):
+    job_id = enqueue_job(db, "soa", {}, str(tmp_path / "out.pdf"))
+    stale = claim_job(db, "w1", lease_seconds=-1)
+    current = claim_job(db, "w2")
+    assert complete_job(db, "w2", current, rendered(tmp_path / "w2.part", "w2"), meta={"pages": 1})
+    assert not complete_job(db, "w1", stale, rendered(tmp_path / "w1.part", "w1"), error="boom")
+    assert open(tmp_path / "out.pdf").read() == "w2"
+    assert job_row(db, job_id)[0] == "done"
+
+
+def test_failed_job_discards_its_file(db, tmp_path):
+    job_id = enqueue_job(db, "soa", {}, str(tmp_path / "out.pdf"))
+    job = claim_job(db, "w1")
+    partial = rendered(tmp_path / "out.part", "half")
+    assert complete_job(db, "w1", job, partial, error="render failed")
+    assert not os.path.exists(partial)
+    assert not os.path.exists(tmp_path / "out.pdf")
+    assert job_row(db, job_id)[0::4] == ("failed", "render failed")
+
+
+def test_job_fails_after_max_expired_leases(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(InvoiceGen, "JOB_MAX_ATTEMPTS", 2)
+    job_id = enqueue_job(db, "soa", {}, str(tmp_path / "out.pdf"))
+    claim_job(db, "w1", lease_seconds=-1)
+    claim_job(db, "w2", lease_seconds=-1)
+    assert claim_job(db, "w3") is None
+    status, _, attempts, _, error = job_row(db, job_id)
+    assert (status, attempts, error) == ("failed", 2, "lease expired 2 time(s)")
+
+
+def test_failed_commit_publishes_nothing(db, tmp_path):
+    job_id = enqueue_job(db, "soa", {}, str(tmp_path / "out.pdf"))
+    worker = sqlite3.connect(InvoiceGen.DB_FILE, timeout=0.1)
+    job = claim_job(worker, "w1")
+    partial = rendered(tmp_path / "out.part", "w1")
+    # An open read transaction elsewhere keeps the commit from getting its exclusive lock
+    db.execute("BEGIN")
+    db.execute("SELECT * FROM generation_jobs").fetchall()
+    try:
+        with pytest.raises(sqlite3.OperationalError):
+            complete_job(worker, "w1", job, partial, meta={"pages": 1})
+        assert not os.path.exists(tmp_path / "out.pdf")
+    finally:
+        db.rollback()
+        worker.rollback()
+    assert job_row(db, job_id)[:2] == ("running", "w1")
+    # The retry the worker loop makes once the database is free again
+    assert complete_job(worker, "w1", job, partial, meta={"pages": 1})
+    worker.close()
+    assert open(tmp_path / "out.pdf").read() == "w1"
+
+
+def test_unpublishable_file_fails_the_job_and_retry_reuses_the_invoice(db, tmp_path, input_details):
+    payload = {"vendor_id": "V1", "input_details": input_details, "excel_file": "book.xlsx"}
+    blocked = tmp_path / "blocked"
+    job_id = enqueue_job(db, "invoice", payload, str(blocked / "out.pdf"))
+    job = claim_job(db, "w1")
+    meta = {"total": 12.5, "lines": []}
+    # The output folder does not exist, so the file cannot be moved into place
+    assert complete_job(db, "w1", job, rendered(tmp_path / "out.part", "w1"), meta=meta)
+    status, _, _, _, error = job_row(db, job_id)
+    assert status == "failed" and error.startswith("could not publish the file")
+    assert InvoiceGen.requeue_failed_jobs(db) == 1
+    blocked.mkdir()
+    job = claim_job(db, "w2")
+    assert complete_job(db, "w2", job, rendered(tmp_path / "out.part", "w2"), meta=meta)
+    assert open(blocked / "out.pdf").read() == "w2"
+    assert db.execute("SELECT COUNT(*) FROM invoices").fetchone()[0] == 1
@@ -0,0 +1,67 @@
+import csv
+from datetime import date, timedelta
+
+import openpyxl
+import pytest
+
+from InvoiceGen import (AGING_LABELS, LEDGER_HEADER, Transaction, export_ledger, export_vendor_ledger,
+                        ledger_transactions, record_invoice)
+
+TODAY = date.today()
+
+
+def transactions():
+    return [Transaction.from_invoice(TODAY - timedelta(days=100), "INV-1", "", "Credit", 250.0),
+            Transaction.from_invoice(TODAY - timedelta(days=40), "INV-2", "", "Debit", 100.0),
+            Transaction.from_invoice(TODAY, "INV-3", "", "Credit", 0.1)]
+
+
+def read_csv(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.reader(f))
+
+
+def test_csv_ledger_has_running_balance_totals_and_aging(workdir):
+    path = str(workdir / "ledger.csv")
+    assert export_ledger(path, "Statement", iter(transactions()), balance_bf=10) == {"rows": 3, "balance": 160.1}
+    rows = read_csv(path)
+    assert rows[:4] == [["Statement"], [], LEDGER_HEADER, ["", "", "Balance b/f", "", "", "10.00"]]
+    assert [r[1] for r in rows[4:7]] == ["INV-1", "INV-2", "INV-3"]
+    assert [r[5] for r in rows[4:7]] == ["260.00", "160.00", "160.10"]
+    assert rows[7] == ["", "", "Sub-Total", "250.10", "100.00", "160.10"]
+    assert rows[9] == AGING_LABELS
+    assert rows[10] == ["0.10", "-100.00", "0.00", "250.00", "0.00", "150.10"]
+
+
+def test_xlsx_ledger_matches_the_csv(workdir):
+    csv_path, xlsx_path = str(workdir / "ledger.csv"), str(workdir / "ledger.xlsx")
+    export_ledger(csv_path, "Statement", transactions())
+    export_ledger(xlsx_path, "Statement", transactions())
+    sheet = openpyxl.load_workbook(xlsx_path, read_only=True)["Ledger"]
+    # Whole amounts come back from the workbook as integers
+    cells = [["" if c is None else f"{c:.2f}" if isinstance(c, (int, float)) else c for c in row]
+             for row in sheet.iter_rows(values_only=True)]
+    assert [row for row in cells if any(row)] == [row for row in read_csv(csv_path) if any(row)]
+
+
+def test_workbook_fallback_and_unreadable_invoices(make_workbook, item_rows):
+    path = make_workbook({"Items": item_rows(3)})
+    rows = [("INV-1", "2024-01-10", "Credit", 1234, "ignored.xlsx"),
+            ("INV-2", "2024-01-11", "Credit", None, path),
+            ("INV-3", "2024-01-12", "Credit", None, "missing.xlsx")]
+    assert [(t.invoice_no, t.debit) for t in ledger_transactions(rows)] == [("INV-1", 1234), ("INV-2", 3000)]
+
+
+def test_vendor_ledger_from_the_database(db, input_details, workdir):
+    db.execute("INSERT INTO vendors (vendor_id, vendor_name, vendor_address, po_number) VALUES ('V1','ACME','Doha','PO')")
+    with db:
+        for no, day, cents in (("INV-2", "2024-02-10", 5000), ("INV-1", "2024-01-10", 2500), ("INV-3", "2024-04-01", 1)):
+            record_invoice(db, "V1", dict(input_details, invoice_no=no, invoice_date=day, invoice_type="Credit"),
+                           "book.xlsx", cents)
+    path = str(workdir / "ledger.csv")
+    assert export_vendor_ledger(db, "V1", "2024-01-01", "2024-03-31", path) == {"rows": 2, "balance": 75.0}
+    rows = read_csv(path)
+    assert rows[0] == ["Statement of Account - ACME (2024-01-01 to 2024-03-31)"]
+    assert [r[1] for r in rows[4:6]] == ["INV-1", "INV-2"]
+    with pytest.raises(ValueError):
+        export_vendor_ledger(db, "NOPE", "2024-01-01", "2024-03-31", path)
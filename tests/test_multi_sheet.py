@@ -0,0 +1,63 @@
+import pytest
+
+import InvoiceGen
+from InvoiceGen import process_excel_workbook
+
+COVER = [["Monthly billing"], ["Prepared by", "Accounts"]]
+ALICE = [
+    ["Employee: Alice", None, None],
+    [None, None, None],
+    ["Name", "Qty", "Amount"],
+    ["Widget", 2, 10.5],
+    ["Gadget", 1, 3],
+    ["Widget", 2, 10.5],
+    ["Total", None, 24],
+]
+BOB = [
+    ["Name", "Qty", "Amount"],
+    ["Widget", 2, 10.5],
+    ["Service", 1, "n/a"],
+    ["Total", None, 10.5],
+]
+
+
+def test_single_sheet_has_no_sheet_column(make_workbook):
+    df, total, sections = process_excel_workbook(make_workbook({"Alice": ALICE}))
+    assert list(df.columns) == ["Name", "Qty", "Amount"]
+    assert df["Name"].tolist() == ["Widget", "Gadget"]
+    assert total == 13.5
+    assert sections == [{"sheet": "Alice", "subtotal": 13.5, "rows": 2}]
+
+
+def test_sheets_are_combined_with_their_own_subtotals(make_workbook):
+    df, total, sections = process_excel_workbook(make_workbook({"Cover": COVER, "Alice": ALICE, "Bob": BOB}))
+    assert [(s["sheet"], s["subtotal"], s["rows"]) for s in sections] == [("Alice", 13.5, 2), ("Bob", 10.5, 2)]
+    assert total == 24
+    assert list(df.columns) == ["Sheet", "Name", "Qty", "Amount"]
+    # Duplicates are removed within a sheet, not across sheets; unreadable amounts count as 0
+    assert df[["Sheet", "Name", "Amount"]].values.tolist() == [
+        ["Alice", "Widget", 10.5], ["Alice", "Gadget", 3], ["Bob", "Widget", 10.5], ["Bob", "Service", 0]]
+
+
+def test_workbook_is_opened_once(make_workbook, monkeypatch):
+    path = make_workbook({"Cover": COVER, "Alice": ALICE, "Bob": BOB})
+    opened = []
+    reader = InvoiceGen.EXCEL_ENGINES["openpyxl"]
+
+    def counting(source, first_only=False):
+        opened.append(source)
+        return reader(source, first_only)
+
+    monkeypatch.setitem(InvoiceGen.EXCEL_ENGINES, "openpyxl", counting)
+    process_excel_workbook(path, engine="openpyxl")
+    assert opened == [path]
+
+
+def test_workbook_without_item_sheets_is_rejected(make_workbook):
+    with pytest.raises(ValueError, match="No header row"):
+        process_excel_workbook(make_workbook({"Cover": COVER}))
+
+
+def test_process_excel_file_returns_the_combined_total(make_workbook):
+    df, total = InvoiceGen.process_excel_file(make_workbook({"Alice": ALICE, "Bob": BOB}))
+    assert (len(df), total) == (4, 24)
@@ -0,0 +1,73 @@
+import os
+
+import pytest
+from PIL import Image
+
+import InvoiceGen
+from InvoiceGen import output_profile_key, profile_assets
+
+
+@pytest.fixture
+def large_assets(workdir):
+    """Source images far above print resolution, as scanned letterheads tend to be."""
+    for name in InvoiceGen.PDF_ASSETS:
+        Image.effect_noise((500, 100), 60).resize((2000, 400)).convert("RGB").save(workdir / name)
+    return workdir
+
+
+def test_profile_key():
+    assert output_profile_key() == InvoiceGen.DEFAULT_OUTPUT_PROFILE
+    assert output_profile_key("email", grayscale=True) == "email-gray"
+    with pytest.raises(ValueError):
+        output_profile_key("fax")
+
+
+def test_assets_are_resampled_to_the_profile_dpi(large_assets):
+    widths = {}
+    for profile, settings in InvoiceGen.OUTPUT_PROFILES.items():
+        with Image.open(profile_assets(profile)["header.png"]) as img:
+            widths[profile] = img.width
+        box = InvoiceGen.ASSET_BOXES["header.png"]
+        scale = min(box[0] * settings["dpi"] / 72 / 2000, box[1] * settings["dpi"] / 72 / 400)
+        assert widths[profile] == round(2000 * scale)
+    assert widths["email"] < widths["archive"] < widths["print"] < 2000
+
+
+def test_small_sources_are_not_upsampled(assets):
+    with Image.open(profile_assets("print")["header.png"]) as img:
+        assert img.size == (400, 80)
+
+
+def test_grayscale_variant(large_assets):
+    assets = profile_assets("email", grayscale=True)
+    assert os.path.dirname(assets["header.png"]) == os.path.join(InvoiceGen.ASSET_CACHE_DIR, "email-gray")
+    with Image.open(assets["header.png"]) as img, Image.open(assets["signeture.jpg"]) as jpg:
+        assert (img.mode, jpg.mode) == ("L", "L")
+
+
+def test_resampled_copies_are_reused(large_assets):
+    first = profile_assets("email")
+    mtime = os.path.getmtime(first["header.png"])
+    assert profile_assets("email") == first
+    assert os.path.getmtime(first["header.png"]) == mtime
+
+
+def test_changed_source_gets_a_new_copy(large_assets):
+    first = profile_assets("email")["header.png"]
+    Image.new("RGB", (2000, 400), (200, 10, 10)).save(large_assets / "header.png")
+    assert profile_assets("email")["header.png"] != first
+
+
+def test_missing_source_falls_back_to_its_name(workdir):
+    assert profile_assets("email") == {name: name for name in InvoiceGen.ASSET_BOXES}
+
+
+def test_email_profile_makes_a_smaller_pdf(large_assets, make_workbook, item_rows, input_details, workdir):
+    path = make_workbook({"Items": item_rows(5)})
+    sizes = {}
+    for profile in ("print", "email"):
+        output = str(workdir / f"{profile}.pdf")
+        meta, _ = InvoiceGen.render_invoice_document(output, input_details, path, profile=profile)
+        sizes[profile] = meta["bytes"]
+        assert meta["bytes"] == os.path.getsize(output)
+    assert sizes["email"] < sizes["print"]
@@ -0,0 +1,81 @@
+import pytest
+
+import InvoiceGen
+from InvoiceGen import estimate_workbook_rows, execute_plan, log_execution_plan, plan_invoice_render, planner_rates
+
+
+def plan(rows, sheets=1, **budgets):
+    return plan_invoice_render("book.xlsx", rows=rows, sheets=sheets, workers=budgets.pop("workers", 4), **budgets)
+
+
+def test_small_invoice_stays_in_memory():
+    result = plan(500)
+    assert (result["strategy"], result["workers"], result["reason"]) == ("memory", 1, "fits both budgets")
+    assert result["estimate_source"] == "ingested"
+
+
+def test_over_the_memory_budget_streams():
+    result = plan(200_000, memory_mb=500, seconds=10_000)
+    assert result["strategy"] == "streaming" and "MB budget" in result["reason"]
+    assert result["predicted_mb"] <= 500
+
+
+def test_over_the_latency_budget_goes_parallel():
+    result = plan(100_000, seconds=60, memory_mb=10_000)
+    assert (result["strategy"], result["workers"]) == ("parallel", 4)
+    assert result["predicted_seconds"] < result["candidates"]["memory"][0]
+
+
+def test_parallel_needs_workers_and_permission():
+    assert "parallel" not in plan(100_000, seconds=60, workers=1)["candidates"]
+    assert "parallel" not in plan_invoice_render("book.xlsx", rows=100_000, seconds=60, workers=4,
+                                                 allow_parallel=False)["candidates"]
+    assert "parallel" not in plan(InvoiceGen.PARALLEL_RENDER_MIN_ROWS - 1, seconds=0)["candidates"]
+
+
+def test_multi_sheet_invoices_cannot_stream():
+    assert set(plan(200_000, sheets=3, memory_mb=100)["candidates"]) == {"memory"}
+
+
+def test_nothing_fits_picks_the_least_memory():
+    result = plan(2_000_000, memory_mb=1, workers=1)
+    assert result["strategy"] == "streaming" and result["reason"].startswith("nothing fits")
+
+
+def test_estimates_from_the_file(make_workbook, item_rows):
+    assert estimate_workbook_rows(make_workbook({"A": item_rows(40), "B": item_rows(10)})) == (
+        (43 + 13, 2, "sheet dimensions"))
+    assert estimate_workbook_rows(make_workbook({"A": item_rows(40)}, "book.csv")) == (43, 1, "line count")
+    result = plan_invoice_render(make_workbook({"A": item_rows(40)}))
+    assert (result["rows"], result["estimate_source"]) == (43, "sheet dimensions")
+
+
+def test_journal_calibrates_the_rates(db):
+    assert planner_rates(db) == planner_rates(None)
+    for seconds in (2.0, 3.0, 10.0):
+        done = dict(plan(10_000), actual_rows=10_000, actual_seconds=seconds)
+        log_execution_plan(db, done)
+    # A small run is mostly start-up time and is left out
+    log_execution_plan(db, dict(plan(10), actual_rows=10, actual_seconds=50.0))
+    db.commit()
+    rates = planner_rates(db)
+    assert rates["memory"] == 0.3
+    assert rates["streaming"] == InvoiceGen.PLAN_SECONDS_PER_1000_ROWS["streaming"]
+    assert plan_invoice_render("book.xlsx", rows=100_000, db=db)["candidates"]["memory"][0] == 30.0
+
+
+def test_execute_plan_records_cost_across_calls(db):
+    result = plan(500)
+    assert execute_plan(result, lambda: "ingested") == "ingested"
+    first = result["actual_seconds"]
+    execute_plan(result, lambda: bytearray(8 * 1024 * 1024))
+    assert result["actual_seconds"] >= first
+    assert result["peak_mb"] > 0
+    with pytest.raises(ZeroDivisionError):
+        execute_plan(result, lambda: 1 / 0)
+    log_execution_plan(db, result)
+    db.commit()
+    stored = db.execute("SELECT kind, strategy, rows, actual_rows, actual_seconds, peak_mb, reason "
+                        "FROM execution_plans").fetchall()
+    assert stored == [("invoice", "memory", 500, 500, result["actual_seconds"], result["peak_mb"], "fits both budgets")]
+    assert "memory: ~500 rows (ingested)" in InvoiceGen.format_plan(result)
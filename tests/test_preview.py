@@ -0,0 +1,71 @@
+import io
+
+import pandas as pd
+import pytest
+from pypdf import PdfReader
+
+import InvoiceGen
+from InvoiceGen import PREVIEW_ROWS, read_invoice_preview, render_invoice_preview
+
+
+def page_text(pdf_bytes):
+    return "\n".join(page.extract_text() for page in PdfReader(io.BytesIO(pdf_bytes)).pages)
+
+
+@pytest.mark.parametrize("name", ["book.xlsx", "book.csv"])
+def test_preview_matches_the_head_of_the_full_frame(make_workbook, item_rows, name):
+    path = make_workbook({"Items": item_rows(40)}, name)
+    df, total, sections, line_count = read_invoice_preview(path)
+    full_df, full_total, full_sections = InvoiceGen.process_excel_workbook(path)
+    pd.testing.assert_frame_equal(df, full_df.head(PREVIEW_ROWS))
+    assert (total, line_count) == (full_total, len(full_df))
+    assert [(s["sheet"], s["subtotal"], s["rows"]) for s in sections] == \
+        [(s["sheet"], s["subtotal"], s["rows"]) for s in full_sections]
+
+
+def test_preview_of_a_short_sheet_drops_its_total_row(make_workbook, item_rows):
+    path = make_workbook({"Items": item_rows(3)})
+    df, total, _, line_count = read_invoice_preview(path)
+    assert list(df["Name"]) == ["Item 0", "Item 1", "Item 2"]
+    assert (total, line_count) == (30.0, 3)
+
+
+def test_preview_keeps_the_float_amounts_of_the_full_frame(make_workbook, item_rows):
+    rows = item_rows(30)
+    rows[-2][2] = 2.5  # the last line's amount, well past the preview
+    path = make_workbook({"Items": rows})
+    df = read_invoice_preview(path)[0]
+    assert df["Amount"].dtype == "float64"
+
+
+def test_preview_spans_sheets(make_workbook, item_rows):
+    path = make_workbook({"North": item_rows(4), "South": item_rows(30, start=100)})
+    df, total, sections, line_count = read_invoice_preview(path)
+    full_df = InvoiceGen.process_excel_workbook(path)[0]
+    pd.testing.assert_frame_equal(df, full_df.head(PREVIEW_ROWS))
+    assert (total, line_count, [s["sheet"] for s in sections]) == (340.0, 34, ["North", "South"])
+
+
+def test_preview_reads_only_its_rows(make_workbook, item_rows, monkeypatch):
+    path = make_workbook({"Items": item_rows(200)})
+    read = []
+    stream = InvoiceGen.iter_excel_sheet_rows
+
+    def counting(*args, **kwargs):
+        for item in stream(*args, **kwargs):
+            read.append(item)
+            yield item
+    monkeypatch.setattr(InvoiceGen, "iter_excel_sheet_rows", counting)
+    monkeypatch.setattr(InvoiceGen, "ingest_excel_streaming",
+                        lambda *a, **k: {"total": 0.0, "rows": 200, "sections": [{"sheet": "Items"}], "dtypes": {}})
+    read_invoice_preview(path)
+    assert len(read) == 2 + PREVIEW_ROWS + 1
+
+
+def test_preview_notes_the_rows_left_out(assets, make_workbook, item_rows, input_details):
+    path = make_workbook({"Items": item_rows(40)})
+    df, total, sections, line_count = read_invoice_preview(path)
+    text = page_text(render_invoice_preview(input_details, df, total, True, sections, line_count=line_count))
+    assert f"Item {PREVIEW_ROWS - 1}" in text and f"Item {PREVIEW_ROWS}" not in text
+    assert f"{40 - PREVIEW_ROWS} more rows not shown" in text
+    assert "Total: 400" in text
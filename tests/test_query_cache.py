@@ -0,0 +1,178 @@
+import pytest
+from pypdf import PdfReader
+
+import InvoiceGen
+from InvoiceGen import QueryResultCache
+
+
+class Builder:
+    """Counts how often the cache had to build the value."""
+    def __init__(self, value="rows"):
+        self.value = value
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.value
+
+
+def add_invoice(db, vendor_id, invoice_no="I-1"):
+    with db:
+        db.execute("INSERT INTO invoices (vendor_id, invoice_no, invoice_date) VALUES (?, ?, '2024-01-01')",
+                   (vendor_id, invoice_no))
+
+
+@pytest.fixture
+def cache():
+    return QueryResultCache(max_bytes=1024 * 1024)
+
+
+def test_unchanged_vendor_is_a_hit(db, cache):
+    build = Builder()
+    assert cache.get(db, "V1", "soa", build) == "rows"
+    assert cache.get(db, "V1", "soa", build) == "rows"
+    assert build.calls == 1
+    assert (cache.hits, cache.misses, cache.stale) == (1, 1, 0)
+
+
+def test_write_to_the_vendor_invalidates(db, cache):
+    build = Builder()
+    cache.get(db, "V1", "soa", build)
+    add_invoice(db, "V1")
+    cache.get(db, "V1", "soa", build)
+    assert build.calls == 2
+    assert cache.stale == 1
+
+
+def test_update_and_delete_invalidate(db, cache):
+    add_invoice(db, "V1")
+    build = Builder()
+    cache.get(db, "V1", "soa", build)
+    with db:
+        db.execute("UPDATE invoices SET amount_cents=100 WHERE vendor_id='V1'")
+    cache.get(db, "V1", "soa", build)
+    with db:
+        db.execute("DELETE FROM invoices WHERE vendor_id='V1'")
+    cache.get(db, "V1", "soa", build)
+    assert build.calls == 3
+
+
+def test_moving_an_invoice_invalidates_both_vendors(db, cache):
+    add_invoice(db, "V1")
+    old, new = Builder(), Builder()
+    cache.get(db, "V1", "soa", old)
+    cache.get(db, "V2", "soa", new)
+    with db:
+        db.execute("UPDATE invoices SET vendor_id='V2' WHERE vendor_id='V1'")
+    cache.get(db, "V1", "soa", old)
+    cache.get(db, "V2", "soa", new)
+    assert (old.calls, new.calls) == (2, 2)
+
+
+def test_other_vendors_writes_do_not_invalidate(db, cache):
+    build = Builder()
+    cache.get(db, "V1", "soa", build)
+    add_invoice(db, "V2")
+    cache.get(db, "V1", "soa", build)
+    assert build.calls == 1
+
+
+def test_cross_vendor_entries_see_every_write(db, cache):
+    build = Builder()
+    cache.get(db, None, "report", build)
+    add_invoice(db, "V2")
+    cache.get(db, None, "report", build)
+    assert build.calls == 2
+
+
+def test_writes_from_another_connection_invalidate(db, cache):
+    build = Builder()
+    cache.get(db, "V1", "soa", build)
+    InvoiceGen.conn.execute("INSERT INTO vendors (vendor_id, vendor_name) VALUES ('V1', 'Acme')")
+    InvoiceGen.conn.commit()
+    cache.get(db, "V1", "soa", build)
+    assert build.calls == 2
+
+
+def test_restore_epoch_invalidates(db, cache):
+    build = Builder()
+    cache.get(db, "V1", "soa", build)
+    with db:
+        db.execute("UPDATE db_epoch SET epoch = epoch + 1")
+    try:
+        cache.get(db, "V1", "soa", build)
+    finally:
+        with db:
+            db.execute("UPDATE db_epoch SET epoch = epoch - 1")
+    assert build.calls == 2
+
+
+def test_clear(db, cache):
+    build = Builder()
+    cache.get(db, "V1", "soa", build)
+    cache.clear()
+    cache.get(db, "V1", "soa", build)
+    assert build.calls == 2
+    assert cache.stats()["entries"] == 1
+
+
+def test_least_recently_used_is_evicted_first(db):
+    value = ["x" * 100] * 10
+    size = InvoiceGen._approx_size(value)
+    cache = QueryResultCache(max_bytes=size * 2)
+    cache.get(db, "V1", "a", Builder(value))
+    cache.get(db, "V2", "b", Builder(value))
+    cache.get(db, "V1", "a", Builder(value))
+    cache.get(db, "V3", "c", Builder(value))
+    assert cache.evictions == 1
+    build = Builder(value)
+    cache.get(db, "V1", "a", build)
+    cache.get(db, "V2", "b", build)
+    assert build.calls == 1
+    assert cache.stats()["bytes"] <= size * 2
+
+
+def test_values_larger_than_the_cache_are_not_kept(db):
+    cache = QueryResultCache(max_bytes=10)
+    build = Builder(["x" * 100])
+    cache.get(db, "V1", "a", build)
+    cache.get(db, "V1", "a", build)
+    assert build.calls == 2
+    assert cache.stats()["entries"] == 0
+
+
+def test_failed_check_rebuilds(db, cache):
+    build = Builder()
+    valid = [True]
+    cache.get(db, "V1", "soa", build, check=lambda value: valid[0])
+    cache.get(db, "V1", "soa", build, check=lambda value: valid[0])
+    valid[0] = False
+    cache.get(db, "V1", "soa", build, check=lambda value: valid[0])
+    assert build.calls == 2
+    assert cache.stale == 1
+
+
+def test_edited_workbook_is_not_served_from_a_stale_set(db, cache, assets, make_workbook, item_rows, workdir):
+    path = make_workbook({"Items": item_rows(4)})
+    invoices = [("INV-1", "2024-01-31", "Credit", path)]
+
+    def build():
+        digests = InvoiceGen.workbook_digests([path])
+        return invoices, InvoiceGen.soa_transactions(invoices), digests
+
+    def check(value):
+        return value[2] == InvoiceGen.workbook_digests(inv[3] for inv in value[0])
+
+    _, transactions, digests = cache.get(db, "V1", "soa", build, check=check)
+    assert transactions[0].debit == 4000
+    make_workbook({"Items": item_rows(7)})
+    _, fresh, _ = cache.get(db, "V1", "soa", build, check=check)
+    assert fresh[0].debit == 7000
+
+    # Handed the set read before the edit, the render reads the workbook again
+    soa_info = {"statement_date": "2024-01-01", "due_date": "2024-01-31", "company_name": "ACME",
+                "company_address": "Doha"}
+    output = str(workdir / "soa.pdf")
+    meta, hit = InvoiceGen.render_soa_document(output, soa_info, invoices, transactions=transactions, digests=digests)
+    text = "".join(page.extract_text() for page in PdfReader(output).pages)
+    assert not hit and "70.00" in text and "40.00" not in text
@@ -0,0 +1,115 @@
+import os
+
+import pytest
+
+import InvoiceGen
+from InvoiceGen import cached_render, render_fingerprint
+
+
+class Renderer:
+    """Writes a fake PDF to output_path and counts the renders."""
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        with open(self.output_path, "w") as f:
+            f.write(f"render {self.calls}")
+        return {"pages": self.calls}
+
+
+@pytest.fixture
+def workbook(workdir):
+    path = workdir / "book.xlsx"
+    path.write_text("first")
+    return str(path)
+
+
+def fingerprint(workbook, **options):
+    return render_fingerprint("invoice", {"invoice_no": "I-1"}, [workbook], **options)
+
+
+def test_second_render_is_served_from_the_cache(workdir, workbook):
+    output = str(workdir / "out.pdf")
+    render = Renderer(output)
+    assert cached_render(fingerprint(workbook), output, render) == ({"pages": 1}, False)
+    os.remove(output)
+    assert cached_render(fingerprint(workbook), output, render) == ({"pages": 1}, True)
+    assert render.calls == 1
+    assert open(output).read() == "render 1"
+
+
+def test_force_renders_again(workdir, workbook):
+    output = str(workdir / "out.pdf")
+    render = Renderer(output)
+    cached_render(fingerprint(workbook), output, render)
+    assert cached_render(fingerprint(workbook), output, render, force=True) == ({"pages": 2}, False)
+    assert cached_render(fingerprint(workbook), output, render) == ({"pages": 2}, True)
+    assert render.calls == 2
+
+
+def test_changed_workbook_misses(workdir, workbook):
+    output = str(workdir / "out.pdf")
+    render = Renderer(output)
+    cached_render(fingerprint(workbook), output, render)
+    with open(workbook, "w") as f:
+        f.write("second version")
+    assert cached_render(fingerprint(workbook), output, render)[1] is False
+    assert render.calls == 2
+
+
+@pytest.mark.parametrize("options", [
+    {"include_seal": False},
+    {"profile": "email"},
+    {"grayscale": True},
+])
+def test_output_options_change_the_fingerprint(workbook, options):
+    assert fingerprint(workbook, **options) != fingerprint(workbook)
+
+
+def test_inputs_and_template_change_the_fingerprint(workbook, monkeypatch):
+    base = fingerprint(workbook)
+    assert render_fingerprint("invoice", {"invoice_no": "I-2"}, [workbook]) != base
+    assert render_fingerprint("soa", {"invoice_no": "I-1"}, [workbook]) != base
+    monkeypatch.setattr(InvoiceGen, "TEMPLATE_VERSION", "test")
+    assert fingerprint(workbook) != base
+
+
+def test_entry_without_its_pdf_misses(workdir, workbook):
+    output = str(workdir / "out.pdf")
+    render = Renderer(output)
+    key = fingerprint(workbook)
+    cached_render(key, output, render)
+    pdf_path, _ = InvoiceGen._render_cache_paths(key)
+    os.remove(pdf_path)
+    assert cached_render(key, output, render) == ({"pages": 2}, False)
+
+
+def test_eviction_keeps_the_cache_under_its_size(workdir, workbook):
+    output = str(workdir / "out.pdf")
+    keys = [render_fingerprint("invoice", {"invoice_no": n}, [workbook]) for n in "ABC"]
+    for key in keys:
+        cached_render(key, output, Renderer(output))
+    # Oldest first; set after storing, since every store runs an eviction pass of its own
+    for i, key in enumerate(keys):
+        pdf_path, _ = InvoiceGen._render_cache_paths(key)
+        os.utime(pdf_path, (1000 + i, 1000 + i))
+    InvoiceGen.evict_render_cache(max_bytes=os.path.getsize(output) * 2, max_age_days=100000)
+    assert [InvoiceGen.fetch_cached_render(key, output) is not None for key in keys] == [False, True, True]
+
+
+def test_invoice_reprint_is_a_cache_hit(assets, make_workbook, item_rows, input_details, workdir):
+    path = make_workbook({"Items": item_rows(5)})
+    output = str(workdir / "invoice.pdf")
+    meta, hit = InvoiceGen.render_invoice_document(output, input_details, path)
+    assert (hit, meta["total"]) == (False, 50.0)
+    first = open(output, "rb").read()
+    os.remove(output)
+    meta, hit = InvoiceGen.render_invoice_document(output, input_details, path)
+    assert hit and open(output, "rb").read() == first
+    # Same workbook, new invoice number: a different document
+    assert not InvoiceGen.render_invoice_document(output, dict(input_details, invoice_no="INV-2"), path)[1]
+    make_workbook({"Items": item_rows(6)})
+    meta, hit = InvoiceGen.render_invoice_document(output, input_details, path)
+    assert (hit, meta["total"]) == (False, 60.0)
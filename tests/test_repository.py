@@ -0,0 +1,92 @@
+import pytest
+
+import InvoiceGen
+from InvoiceGen import Repository, count_queries, fetch_vendors, record_invoice
+
+
+@pytest.fixture
+def repo(db):
+    return Repository(db)
+
+
+def add_invoices(db, input_details, count, cents=1000, excel_file="book.xlsx", vendors=5):
+    with db:
+        for i in range(count):
+            record_invoice(db, f"V{i % vendors}", dict(input_details, invoice_no=f"INV-{i:03}", invoice_type="Credit"),
+                           excel_file, cents)
+
+
+def add_vendors(repo, count):
+    for i in range(count):
+        repo.add_vendor(f"V{i}", f"Vendor {i}", "Doha", f"PO-{i}")
+
+
+def data_queries(statements):
+    """Statements that read rows; transaction control and pragmas are left out."""
+    return [s for s in statements if s.lstrip().upper().startswith("SELECT")]
+
+
+def test_search_filters_and_returns_stored_amounts(repo, db, input_details):
+    add_vendors(repo, 2)
+    add_invoices(db, input_details, 4, vendors=2)
+    rows = repo.search_invoices(vendor_name="Vendor 1")
+    assert [(r[1], r[2], r[7]) for r in rows] == [("V1", "INV-001", 1000), ("V1", "INV-003", 1000)]
+    assert [r[2] for r in repo.search_invoices(invoice_no="002")] == ["INV-002"]
+    assert len(repo.search_invoices(invoice_date=input_details["invoice_date"])) == 4
+
+
+def test_report_uses_stored_amounts_without_reading_workbooks(repo, db, input_details, monkeypatch):
+    add_vendors(repo, 5)
+    add_invoices(db, input_details, 10)
+    monkeypatch.setattr(InvoiceGen, "excel_total", lambda path: 1 / 0)
+    transactions = repo.report_transactions(repo.search_invoices())
+    assert [(t.name, t.debit) for t in transactions[:2]] == [("Vendor 0", 1000), ("Vendor 1", 1000)]
+    assert len(transactions) == 10
+
+
+def test_report_falls_back_to_the_workbook(repo, db, input_details, make_workbook, item_rows):
+    add_vendors(repo, 1)
+    path = make_workbook({"Items": item_rows(3)})
+    with db:
+        record_invoice(db, "V0", dict(input_details, invoice_type="Credit"), path, None)
+        record_invoice(db, "V0", dict(input_details, invoice_no="INV-2", invoice_type="Credit"), "missing.xlsx", None)
+    assert [(t.invoice_no, t.debit) for t in repo.report_transactions(repo.search_invoices())] == [("INV-1", 3000)]
+
+
+@pytest.mark.parametrize("count", [10, 200])
+def test_report_query_count_does_not_grow_with_rows(repo, db, input_details, count):
+    add_vendors(repo, 5)
+    add_invoices(db, input_details, count)
+    rows = repo.search_invoices()
+    with count_queries(db) as statements:
+        repo.report_transactions(rows)
+        repo.bundle_rows(rows)
+    # One batched vendor lookup; the second call is served by the identity map
+    assert len(data_queries(statements)) == 1
+
+
+def test_search_is_a_single_query(repo, db, input_details):
+    add_vendors(repo, 5)
+    add_invoices(db, input_details, 50)
+    with count_queries(db) as statements:
+        repo.search_invoices(vendor_name="Vendor")
+    assert len(data_queries(statements)) == 1
+
+
+def test_bundle_rows_carry_vendor_details(repo, db, input_details):
+    add_vendors(repo, 1)
+    add_invoices(db, input_details, 1, vendors=1)
+    with db:
+        record_invoice(db, "GONE", dict(input_details, invoice_no="INV-X"), "x.xlsx", 1)
+    assert repo.bundle_rows(repo.search_invoices()) == [
+        ("Vendor 0", "Doha", "INV-000", input_details["invoice_date"], "Credit", "PO-1", "book.xlsx"),
+        ("", "", "INV-X", input_details["invoice_date"], "Invoice", "PO-1", "x.xlsx")]
+
+
+def test_fetch_vendors_batches_large_key_sets(repo, db, monkeypatch):
+    add_vendors(repo, 5)
+    monkeypatch.setattr(InvoiceGen, "SQLITE_MAX_PARAMS", 2)
+    with count_queries(db) as statements:
+        found = fetch_vendors(db, ["V0", "V1", "V2", "V3", "V4", "V0", None, "NOPE"])
+    assert sorted(found) == ["V0", "V1", "V2", "V3", "V4"]
+    assert len(data_queries(statements)) == 3
@@ -0,0 +1,127 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import InvoiceGen
+from InvoiceGen import GenerationService, ServiceRequestHandler
+
+VENDOR = {"vendor_id": "V1", "vendor_name": "ACME Trading", "vendor_address": "Doha", "po_number": "PO-1"}
+
+
+@pytest.fixture
+def serve(db, workdir):
+    """Serves a GenerationService over HTTP on a free port; returns a request(method, path, body) helper."""
+    servers = []
+
+    def start(service):
+        handler = type("TestServiceRequestHandler", (ServiceRequestHandler,), {"service": service})
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+
+        def request(method, path, body=None, raw=None):
+            data = raw if raw is not None else (json.dumps(body).encode() if body is not None else None)
+            req = urllib.request.Request(f"http://127.0.0.1:{server.server_port}{path}", data=data, method=method)
+            try:
+                with urllib.request.urlopen(req) as response:
+                    return response.status, dict(response.headers), response.read()
+            except urllib.error.HTTPError as e:
+                return e.code, dict(e.headers), e.read()
+        return request
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+        server.RequestHandlerClass.service.pool.shutdown(cancel_futures=True)
+
+
+@pytest.fixture
+def idle_dispatchers(monkeypatch):
+    """Dispatcher threads that exit at once, so submitted jobs stay queued."""
+    monkeypatch.setattr(GenerationService, "_dispatch", lambda self: None)
+
+
+def wait_for(request, job_id, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = json.loads(request("GET", f"/jobs/{job_id}")[2])
+        if status["status"] in ("done", "failed"):
+            return status
+        time.sleep(0.1)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_full_queue_answers_429(serve, idle_dispatchers, workdir):
+    request = serve(GenerationService(str(workdir / "out"), workers=1, queue_limit=1))
+    assert request("POST", "/vendors", VENDOR)[0] == 201
+    body = {"vendor_id": "V1", "invoice_no": "INV-1", "excel_file": "book.xlsx"}
+    assert request("POST", "/invoices", body)[0] == 202
+    code, headers, _ = request("POST", "/invoices", dict(body, invoice_no="INV-2"))
+    assert (code, headers["Retry-After"]) == (429, "1")
+
+
+@pytest.mark.parametrize("raw", [b"[1, 2]", b'"text"', b"not json"])
+def test_body_that_is_not_an_object_answers_400(serve, idle_dispatchers, workdir, raw):
+    request = serve(GenerationService(str(workdir / "out"), workers=1))
+    code, _, body = request("POST", "/invoices", raw=raw)
+    assert code == 400 and "error" in json.loads(body)
+
+
+def test_missing_fields_and_unknown_vendor_answer_400(serve, idle_dispatchers, workdir):
+    request = serve(GenerationService(str(workdir / "out"), workers=1))
+    assert request("POST", "/invoices", {"vendor_id": "V1"})[0] == 400
+    assert request("POST", "/invoices", {"vendor_id": "NOPE", "invoice_no": "I", "excel_file": "x.xlsx"})[0] == 400
+    assert request("POST", "/vendors", {"vendor_id": "V1"})[0] == 400
+
+
+def test_unknown_routes_and_jobs_answer_404(serve, idle_dispatchers, workdir):
+    request = serve(GenerationService(str(workdir / "out"), workers=1))
+    assert request("POST", "/nowhere", {})[0] == 404
+    assert request("GET", "/jobs/missing")[0] == 404
+    assert request("GET", "/jobs/missing/other")[0] == 404
+
+
+def test_invoice_job_renders_and_is_recorded(serve, db, assets, make_workbook, item_rows, workdir):
+    path = make_workbook({"Items": item_rows(4)})
+    request = serve(GenerationService(str(workdir / "out"), workers=1))
+    request("POST", "/vendors", VENDOR)
+    code, _, body = request("POST", "/invoices", {"vendor_id": "V1", "invoice_no": "INV-7",
+                                                   "invoice_date": "2024-02-01", "excel_file": path})
+    assert code == 202
+    job_id = json.loads(body)["job_id"]
+    status = wait_for(request, job_id)
+    assert status["status"] == "done", status
+    code, headers, pdf = request("GET", f"/jobs/{job_id}/pdf")
+    assert (code, headers["Content-Type"]) == (200, "application/pdf") and pdf.startswith(b"%PDF")
+    assert db.execute("SELECT invoice_no, amount_cents FROM invoices WHERE vendor_id='V1'").fetchall() == [("INV-7", 4000)]
+
+
+def test_failed_job_reports_its_error(serve, db, workdir):
+    request = serve(GenerationService(str(workdir / "out"), workers=1))
+    request("POST", "/vendors", VENDOR)
+    body = json.loads(request("POST", "/invoices", {"vendor_id": "V1", "invoice_no": "INV-1",
+                                                     "excel_file": str(workdir / "missing.xlsx")})[2])
+    status = wait_for(request, body["job_id"])
+    assert status["status"] == "failed" and status["error"]
+    assert request("GET", f"/jobs/{body['job_id']}/pdf")[0] == 409
+
+
+def test_finished_jobs_are_pruned(idle_dispatchers, workdir):
+    service = GenerationService(str(workdir / "out"), workers=1, queue_limit=10, job_ttl=3600, max_finished=2)
+    try:
+        jobs = [service._enqueue("invoice", {}) for _ in range(3)]
+        for job in jobs:
+            service._update(job["id"], status="done", finished=InvoiceGen.perf_counter())
+        # Only the two most recent finished jobs are kept
+        assert [service.status(job["id"]) is not None for job in jobs] == [False, True, True]
+        service.job_ttl = 0
+        service._update(jobs[2]["id"], status="done")
+        service._enqueue("invoice", {})
+        assert service.status(jobs[1]["id"]) is None and service.status(jobs[2]["id"]) is None
+    finally:
+        service.pool.shutdown()
@@ -0,0 +1,92 @@
+import os
+
+import pytest
+
+import InvoiceGen
+from InvoiceGen import plan_soa_batch, run_soa_batch
+
+FROM, TO = "2024-01-01", "2024-01-31"
+
+
+@pytest.fixture
+def vendors(db, assets, make_workbook, item_rows):
+    """Three vendors with two January invoices each, plus one invoice outside the period."""
+    with db:
+        for n, vendor_id in enumerate(("V1", "V2", "V3")):
+            db.execute("INSERT INTO vendors (vendor_id, vendor_name, vendor_address, po_number) VALUES (?,?,?,?)",
+                       (vendor_id, f"Vendor {vendor_id}", "Doha", "PO"))
+            for day in ("2024-01-05", "2024-01-20", "2024-02-02"):
+                path = make_workbook({"Items": item_rows(3, amount=n + 1)}, name=f"{vendor_id}-{day}.xlsx")
+                db.execute("INSERT INTO invoices (vendor_id, invoice_no, invoice_date, invoice_type, excel_file) "
+                           "VALUES (?,?,?,?,?)", (vendor_id, f"{vendor_id}-{day}", day, "Invoice", path))
+    return ["V1", "V2", "V3"]
+
+
+def pdfs(folder):
+    return sorted(os.listdir(folder)) if os.path.isdir(folder) else []
+
+
+def test_plan_groups_the_period_by_vendor(db, vendors):
+    plan = plan_soa_batch(db, FROM, TO)
+    assert [p["vendor_id"] for p in plan] == vendors
+    assert [row[0] for row in plan[0]["invoices"]] == ["V1-2024-01-05", "V1-2024-01-20"]
+    assert [p["vendor_id"] for p in plan_soa_batch(db, FROM, TO, ["V2"])] == ["V2"]
+
+
+def test_rerun_skips_finished_vendors(vendors, workdir):
+    first = run_soa_batch(FROM, TO, "out", workers=1)
+    assert (first["planned"], first["rendered"], first["skipped"], first["failures"]) == (3, 3, 0, [])
+    assert len(pdfs("out")) == 3
+    again = run_soa_batch(FROM, TO, "out", workers=1)
+    assert (again["rendered"], again["skipped"]) == (0, 3)
+
+
+def test_interrupted_vendor_is_rendered_on_resume(db, vendors):
+    run_id = run_soa_batch(FROM, TO, "out", workers=1)["run_id"]
+    with db:
+        db.execute("UPDATE soa_jobs SET status='running' WHERE run_id=? AND vendor_id='V2'", (run_id,))
+    os.remove(os.path.join("out", pdfs("out")[1]))
+    resumed = run_soa_batch(FROM, TO, "out", workers=1)
+    assert (resumed["run_id"], resumed["rendered"], resumed["skipped"]) == (run_id, 1, 2)
+    assert list(resumed["timings"]) == ["V2"]
+
+
+def test_missing_output_is_rendered_again(vendors):
+    run_soa_batch(FROM, TO, "out", workers=1)
+    os.remove(os.path.join("out", pdfs("out")[0]))
+    assert run_soa_batch(FROM, TO, "out", workers=1)["rendered"] == 1
+    assert len(pdfs("out")) == 3
+
+
+@pytest.mark.parametrize("options", [
+    {"output_dir": "out2"},
+    {"include_seal": False},
+    {"profile": "email"},
+    {"grayscale": True},
+])
+def test_other_folder_or_options_start_a_new_run(vendors, options):
+    first = run_soa_batch(FROM, TO, "out", workers=1)
+    kwargs = dict({"output_dir": "out"}, **options)
+    second = run_soa_batch(FROM, TO, workers=1, **kwargs)
+    assert second["run_id"] != first["run_id"]
+    assert (second["rendered"], second["skipped"]) == (3, 0)
+    assert len(pdfs(kwargs["output_dir"])) == 3
+
+
+def test_force_renders_every_vendor(vendors):
+    run_soa_batch(FROM, TO, "out", workers=1)
+    assert run_soa_batch(FROM, TO, "out", workers=1, force=True)["rendered"] == 3
+
+
+def test_failures_are_journaled_and_retried(db, vendors):
+    # A folder in the way of V3's PDF makes its render fail
+    blocked = os.path.join("out", f"SOA_V3_{FROM}_{TO}.pdf")
+    os.makedirs(blocked)
+    summary = run_soa_batch(FROM, TO, "out", workers=1)
+    assert [vendor_id for vendor_id, _ in summary["failures"]] == ["V3"]
+    assert db.execute("SELECT status FROM soa_jobs WHERE run_id=? AND vendor_id='V3'",
+                      (summary["run_id"],)).fetchone() == ("failed",)
+    os.rmdir(blocked)
+    retry = run_soa_batch(FROM, TO, "out", workers=1)
+    assert (retry["rendered"], retry["skipped"], retry["failures"]) == (1, 2, [])
+    assert "failed: 0" in InvoiceGen.format_batch_summary(retry)
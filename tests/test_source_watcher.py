@@ -0,0 +1,87 @@
+import os
+import queue
+
+import InvoiceGen
+from InvoiceGen import SourceWatcher, mismatched_invoices, record_invoice, scan_source_changes, source_signature
+
+
+def issue(db, input_details, path, invoice_no="INV-1", cents=4000, signature=None):
+    with db:
+        record_invoice(db, "V1", dict(input_details, invoice_no=invoice_no), path, cents,
+                       source_signature(path) if signature is None else signature)
+
+
+def edit(make_workbook, item_rows, count, name="book.xlsx"):
+    path = make_workbook({"Items": item_rows(count)}, name)
+    # Same size and mtime would look unchanged; move the mtime on explicitly
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    return path
+
+
+def test_unchanged_workbooks_are_not_read(db, input_details, make_workbook, item_rows, monkeypatch):
+    issue(db, input_details, make_workbook({"Items": item_rows(4)}))
+    monkeypatch.setattr(InvoiceGen, "excel_total", lambda path: 1 / 0)
+    calls = []
+    summary = scan_source_changes(db, progress=lambda done, total: calls.append((done, total)))
+    assert summary == {"checked": 1, "changed": [], "missing": [], "errors": []}
+    assert calls == [(1, 1)]
+
+
+def test_edited_workbook_shows_up_as_mismatched(db, input_details, make_workbook, item_rows):
+    path = make_workbook({"Items": item_rows(4)})
+    issue(db, input_details, path)
+    edit(make_workbook, item_rows, 5)
+    assert scan_source_changes(db)["changed"] == [path]
+    assert [(r[2], r[5], r[6]) for r in mismatched_invoices(db)] == [("INV-1", 4000, 5000)]
+    # The new signature is stored, so the next pass skips it
+    assert scan_source_changes(db)["changed"] == []
+
+
+def test_missing_workbook_is_reported_once(db, input_details, make_workbook, item_rows):
+    path = make_workbook({"Items": item_rows(4)})
+    issue(db, input_details, path)
+    os.remove(path)
+    assert scan_source_changes(db)["missing"] == [path]
+    assert scan_source_changes(db)["missing"] == []
+
+
+def test_unreadable_workbook_is_an_error(db, input_details, workdir):
+    path = workdir / "book.csv"
+    path.write_text("no header here\n")
+    issue(db, input_details, str(path), signature="0:0")
+    summary = scan_source_changes(db)
+    assert [p for p, _ in summary["errors"]] == [str(path)]
+
+
+def test_invoices_without_a_signature_are_rescanned(db, input_details, make_workbook, item_rows):
+    path = make_workbook({"Items": item_rows(4)})
+    issue(db, input_details, path, "INV-1")
+    # Saved before signatures were recorded: MIN/MAX alone would only see INV-1's signature
+    issue(db, input_details, path, "INV-2", signature="")
+    db.execute("UPDATE invoices SET source_signature=NULL WHERE invoice_no='INV-2'")
+    db.commit()
+    assert scan_source_changes(db)["changed"] == [path]
+    assert db.execute("SELECT COUNT(*) FROM invoices WHERE source_signature IS NULL").fetchone()[0] == 0
+    assert db.execute("SELECT source_amount_cents FROM invoices WHERE invoice_no='INV-2'").fetchone()[0] == 4000
+
+
+def test_scan_now_reports_to_on_scan(db, input_details, make_workbook, item_rows):
+    path = make_workbook({"Items": item_rows(4)})
+    issue(db, input_details, path)
+    edit(make_workbook, item_rows, 6)
+    results = queue.Queue()
+    watcher = SourceWatcher(interval=None, on_scan=lambda summary, rows: results.put((summary, rows)))
+    watcher.start()
+    try:
+        watcher.scan_now()
+        summary, rows = results.get(timeout=30)
+        assert summary["changed"] == [path] and [r[6] for r in rows] == [6000]
+        # An explicit request is answered even when nothing changed
+        watcher.scan_now()
+        summary, rows = results.get(timeout=30)
+        assert summary["changed"] == [] and len(rows) == 1
+    finally:
+        watcher.stop()
+        watcher.join(timeout=30)
+    assert not watcher.is_alive()
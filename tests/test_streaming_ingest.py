@@ -0,0 +1,94 @@
+import os
+
+import pandas as pd
+import pytest
+
+import InvoiceGen
+from InvoiceGen import ingest_excel_streaming, process_excel_workbook
+
+ROWS = [
+    ["Statement for ACME", None, None, None],
+    [None, None, None, None],
+    ["Name", "Date", "Qty", "Amount"],
+    ["Widget", "2024-01-02", 2, 10.5],
+    ["Gadget", "2024-01-03", None, 3],
+    ["Widget", "2024-01-02", 2, 10.5],
+    [None, None, None, None],
+    ["Service", "2024-01-04", 1, "n/a"],
+    ["Rush fee", "2024-01-05", 1, "4.25"],
+    ["Total", None, None, 28.25],
+]
+
+
+@pytest.fixture(params=["book.xlsx", "book.csv"])
+def workbook(request, make_workbook):
+    return make_workbook({"Items": ROWS}, name=request.param)
+
+
+def test_totals_match_the_in_memory_path(workbook):
+    df, total, sections = process_excel_workbook(workbook)
+    result = ingest_excel_streaming(workbook, spill_path=None)
+    assert result["total"] == pytest.approx(total)
+    assert result["rows"] == len(df)
+    assert (result["duplicates"], result["coerced"]) == (1, 1)
+    section = result["sections"][0]
+    assert (section["rows"], section["header_row"], section["declared_total"]) == (sections[0]["rows"], 3, 28.25)
+
+
+def test_spilled_lines_rebuild_the_in_memory_frame(workbook):
+    df, total, _ = process_excel_workbook(workbook)
+    with InvoiceGen.spilled_workbook(workbook) as spilled:
+        pd.testing.assert_frame_equal(InvoiceGen.spilled_frame(spilled), df.reset_index(drop=True))
+        assert InvoiceGen.spilled_total(spilled) == total
+        chunks = list(InvoiceGen.iter_spilled_frames(spilled, rows=2))
+        assert [len(c) for c in chunks] == [2, 2, 1]
+        pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), df.reset_index(drop=True))
+        spill_path = spilled["spill_path"]
+        assert os.path.exists(spill_path)
+    assert not os.path.exists(spill_path)
+
+
+def test_temporary_spill_is_removed(workbook):
+    result = ingest_excel_streaming(workbook)
+    assert result["spill_path"] is None
+    kept = ingest_excel_streaming(workbook, keep_spill=True)
+    assert os.path.exists(kept["spill_path"])
+    os.remove(kept["spill_path"])
+
+
+def test_failed_ingest_removes_its_spill(make_workbook, monkeypatch, tmp_path):
+    monkeypatch.setattr(InvoiceGen.tempfile, "tempdir", str(tmp_path))
+    with pytest.raises(ValueError, match="No header row"):
+        ingest_excel_streaming(make_workbook({"Cover": [["just a cover"]]}), keep_spill=True)
+    assert not [name for name in os.listdir(tmp_path) if name.startswith("ingest-")]
+
+
+def test_large_files_total_through_the_streaming_path(workbook, monkeypatch):
+    expected = InvoiceGen.excel_total(workbook)
+    monkeypatch.setattr(InvoiceGen, "LARGE_EXCEL_BYTES", 0)
+    monkeypatch.setattr(InvoiceGen, "process_excel_file", None)
+    assert InvoiceGen.excel_total(workbook) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("name, engine", [("a.xlsx", "openpyxl"), ("a.XLSM", "openpyxl"), ("a.csv", "csv")])
+def test_xlsx_streams_through_openpyxl_even_with_calamine(name, engine, monkeypatch):
+    monkeypatch.setattr(InvoiceGen, "available_excel_engines", lambda: ["calamine", "openpyxl", "pandas", "csv"])
+    assert InvoiceGen.select_excel_engine(name, size=0) == ("calamine" if engine == "openpyxl" else engine)
+    assert InvoiceGen.select_streaming_engine(name) == engine
+
+
+def test_xlsx_rows_are_read_lazily(make_workbook, monkeypatch):
+    path = make_workbook({"Items": ROWS})
+    import openpyxl
+    modes = []
+    load = openpyxl.load_workbook
+
+    def spy(*args, **kwargs):
+        modes.append(kwargs.get("read_only"))
+        return load(*args, **kwargs)
+
+    monkeypatch.setattr(openpyxl, "load_workbook", spy)
+    rows = InvoiceGen.iter_excel_sheet_rows(path)
+    assert next(rows) == ("Items", ["Statement for ACME", None, None, None])
+    rows.close()
+    assert modes == [True]
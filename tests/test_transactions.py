@@ -0,0 +1,81 @@
+from datetime import date, timedelta
+
+import pytest
+
+import InvoiceGen
+from InvoiceGen import Transaction, aging_bucket, to_cents
+
+
+@pytest.mark.parametrize("amount, cents", [
+    (12.34, 1234),
+    ("7.5", 750),
+    (0.1 + 0.2, 30),
+    (-19.99, -1999),
+    (1e6, 100000000),
+    (0, 0),
+    (None, 0),
+    ("", 0),
+])
+def test_to_cents(amount, cents):
+    assert to_cents(amount) == cents
+
+
+def test_cents_add_up_exactly():
+    # Ten 0.10 lines are exactly 1.00, which float addition does not give
+    assert sum(to_cents(0.1) for _ in range(10)) == 100
+    assert InvoiceGen.format_cents(sum(to_cents(0.1) for _ in range(10))) == "1.00"
+    assert InvoiceGen.format_cents(123456789) == "1,234,567.89"
+
+
+def test_credit_invoice_lands_in_debit():
+    txn = Transaction.from_invoice("2024-03-01", "C-1", "Acme", "Credit", 25.5)
+    assert (txn.date, txn.debit, txn.credit) == (date(2024, 3, 1), 2550, 0)
+    assert txn.display_values() == ("2024-03-01", "C-1", "Acme", "25.50", "")
+
+
+def test_other_invoice_types_land_in_credit():
+    txn = Transaction.from_invoice(date(2024, 3, 1), "I-1", "Acme", "Invoice", "1200")
+    assert (txn.debit, txn.credit) == (0, 120000)
+    assert txn.display_values() == ("2024-03-01", "I-1", "Acme", "", "1,200.00")
+
+
+def test_unparseable_date_is_kept_as_undated():
+    txn = Transaction.from_invoice("01/03/2024", "I-1", "Acme", None, 1)
+    assert txn.date is None
+    assert txn.date_text == ""
+
+
+def test_compute_aging_nets_debits_against_credits():
+    today = date.today()
+    transactions = [
+        Transaction(today, "A", "", credit=to_cents(100)),
+        Transaction(today, "B", "", debit=to_cents(40)),
+        Transaction(today - timedelta(days=45), "C", "", debit=to_cents(10.1)),
+        Transaction(None, "D", "", debit=to_cents(0.2)),
+    ]
+    aging = InvoiceGen.compute_aging(transactions)
+    assert aging["current"] == pytest.approx(-59.8)
+    assert aging["1month"] == pytest.approx(10.1)
+    assert aging["total"] == pytest.approx(-49.7)
+
+
+@pytest.mark.parametrize("days, bucket", [
+    (-5, "current"),
+    (0, "current"),
+    (30, "current"),
+    (31, "1month"),
+    (60, "1month"),
+    (61, "2months"),
+    (90, "2months"),
+    (91, "3months"),
+    (120, "3months"),
+    (121, "4plus"),
+    (3650, "4plus"),
+])
+def test_aging_bucket_boundaries(days, bucket):
+    today = date(2024, 6, 30)
+    assert aging_bucket(Transaction(today - timedelta(days=days), "I", ""), today) == bucket
+
+
+def test_undated_transactions_are_current():
+    assert aging_bucket(Transaction(None, "I", ""), date(2024, 6, 30)) == "current"
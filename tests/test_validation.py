@@ -0,0 +1,57 @@
+import csv
+
+import InvoiceGen
+from InvoiceGen import validate_directory, validate_workbook, write_validation_report
+
+
+def test_clean_workbook_is_ok(make_workbook, item_rows):
+    report = validate_workbook(make_workbook({"Items": item_rows(4)}))
+    assert (report["status"], report["issues"], report["total"], report["rows"]) == ("ok", [], 40.0, 4)
+    assert [(s["sheet"], s["header_row"], s["declared_total"]) for s in report["sections"]] == [("Items", 2, 40.0)]
+
+
+def test_total_row_mismatch_and_coerced_amounts_warn(make_workbook, item_rows):
+    rows = item_rows(4)
+    rows[2][2] = "n/a"
+    report = validate_workbook(make_workbook({"Items": rows}))
+    assert report["status"] == "warning" and report["coerced"] == 1
+    assert any("computed 30.00 but the total row says 40.00" in issue for issue in report["issues"])
+    assert any("1 non-numeric amount(s)" in issue for issue in report["issues"])
+
+
+def test_duplicates_are_counted(make_workbook, item_rows):
+    rows = item_rows(3)
+    rows.insert(3, list(rows[2]))
+    rows[-1][2] = 30.0
+    report = validate_workbook(make_workbook({"Items": rows}))
+    assert (report["status"], report["duplicates"], report["rows"]) == ("ok", 1, 3)
+
+
+def test_missing_total_row_and_empty_sheet_warn(make_workbook):
+    report = validate_workbook(make_workbook({"Items": [["Name", "Amount"], ["Total", "see below"]]}))
+    assert report["status"] == "warning"
+    assert "Items: no line items under the header" in report["issues"]
+    assert "Items: last row has no numeric total" in report["issues"]
+
+
+def test_workbook_without_header_is_an_error(make_workbook):
+    report = validate_workbook(make_workbook({"Items": [["just", "notes"]]}))
+    assert report["status"] == "error" and "No header row" in report["issues"][0]
+
+
+def test_directory_validation_and_report(make_workbook, item_rows, workdir):
+    (workdir / "month").mkdir()
+    good = make_workbook({"Items": item_rows(2)}, "month/good.xlsx")
+    bad = make_workbook({"Items": [["nothing here"]]}, "month/bad.csv")
+    (workdir / "month" / "~$good.xlsx").write_text("lock file")
+    (workdir / "month" / "notes.txt").write_text("ignored")
+    calls = []
+    reports = validate_directory(str(workdir / "month"), workers=2, progress=lambda done, total: calls.append((done, total)))
+    assert [(r["path"], r["status"]) for r in reports] == [(bad, "error"), (good, "ok")]
+    assert calls[-1] == (2, 2)
+    output = str(workdir / "report.csv")
+    write_validation_report(output, reports)
+    with open(output, newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    assert rows[2][:5] == [good, "ok", "Items:2", "2", "20.00"]
+    assert "1 ok, 0 warning(s), 1 error(s)" in InvoiceGen.format_validation_summary(reports)
@@ -0,0 +1,88 @@
+import sqlite3
+
+import pytest
+
+import InvoiceGen
+from InvoiceGen import VendorDirectory
+
+VENDORS = [("AC-01", "Acme Trading", "Doha", "PO-1"), ("AL-02", "alpha supplies", "Doha", "PO-2"),
+           ("BX-03", "Boxwell", "Lusail", "PO-3"), ("ZZ-04", "Acorn Foods", "Wakra", "PO-4")]
+
+
+@pytest.fixture
+def vendors(db):
+    with db:
+        db.executemany("INSERT INTO vendors (vendor_id, vendor_name, vendor_address, po_number) VALUES (?,?,?,?)", VENDORS)
+    return db
+
+
+@pytest.fixture
+def queries(vendors):
+    """Returns the SELECTs on vendors the connection has run so far."""
+    statements = []
+    vendors.set_trace_callback(statements.append)
+    yield lambda: [s for s in statements if s.lstrip().startswith("SELECT") and "vendors" in s]
+    vendors.set_trace_callback(None)
+
+
+def names(rows):
+    return [r[1] for r in rows]
+
+
+def test_prefix_matches_name_or_id_ignoring_case(vendors):
+    directory = VendorDirectory(vendors)
+    assert names(directory.search("ac")) == ["Acme Trading", "Acorn Foods"]
+    assert names(directory.search("AL")) == ["alpha supplies"]
+    assert names(directory.search("zz-")) == ["Acorn Foods"]
+    assert directory.search("  ") == []
+
+
+def test_results_are_limited(vendors):
+    assert names(VendorDirectory(vendors, limit=1).search("a")) == ["Acme Trading"]
+
+
+def test_repeated_lookups_are_cached(vendors, queries):
+    directory = VendorDirectory(vendors)
+    directory.search("ac")
+    directory.search("AC")
+    directory.get("BX-03")
+    directory.get("BX-03")
+    assert len(queries()) == 2
+
+
+def test_commit_from_another_connection_drops_the_cache(vendors):
+    directory = VendorDirectory(vendors)
+    assert names(directory.search("b")) == ["Boxwell"]
+    other = sqlite3.connect(InvoiceGen.DB_FILE)
+    try:
+        with other:
+            other.execute("INSERT INTO vendors (vendor_id, vendor_name, vendor_address, po_number) "
+                          "VALUES ('BB-05', 'Bayside', 'Doha', 'PO-5')")
+    finally:
+        other.close()
+    assert names(directory.search("b")) == ["Bayside", "Boxwell"]
+
+
+def test_write_on_the_same_connection_drops_the_cache(vendors):
+    directory = VendorDirectory(vendors)
+    assert directory.get("AC-01")[1] == "Acme Trading"
+    with vendors:
+        vendors.execute("UPDATE vendors SET vendor_name='Acme Holdings' WHERE vendor_id='AC-01'")
+    assert directory.get("AC-01")[1] == "Acme Holdings"
+
+
+def test_get_many_fetches_only_what_is_not_cached(vendors, queries):
+    directory = VendorDirectory(vendors)
+    directory.get("AC-01")
+    rows = directory.get_many(["AC-01", "BX-03", "NOPE", "BX-03"])
+    assert {k: v and v[1] for k, v in rows.items()} == {"AC-01": "Acme Trading", "BX-03": "Boxwell", "NOPE": None}
+    assert len(queries()) == 2
+    directory.get_many(["BX-03", "NOPE"])
+    assert len(queries()) == 2
+
+
+def test_cache_size_is_bounded(vendors):
+    directory = VendorDirectory(vendors, cache_size=2)
+    for vendor_id, *_ in VENDORS:
+        directory.get(vendor_id)
+    assert list(directory._cache) == [("id", "BX-03"), ("id", "ZZ-04")]